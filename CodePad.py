@@ -3,6 +3,7 @@
 #   Licensed LGPL
 #   All Rights Reserved
 import traceback
+import os
 
 __author__ = 'Robert Cope'
 __version__ = 'v0.2.2 (Alpha)'
@@ -19,37 +20,60 @@ import tkSimpleDialog
 import tkMessageBox
 import tkFileDialog
 import extrawidgets
-from pygments.lexers import TextLexer, get_all_lexers, guess_lexer_for_filename, ClassNotFound, get_lexer_by_name
+import fileloader
+import filepipeline
+import filesaver
+import journal
+import lineindex
+import lexerresolver
+from pygments.lexers import ClassNotFound
 import pygments_tk_text.pygtext as pygtext
 import pygments_tk_text.tkformatter as pygtkformatter
+import pygments_tk_text.scheduler as pygscheduler
+import textstore
 import sys
+import time
 from functools import partial
+from bisect import bisect_right
 import printer
 import platform
 
 SYSTEMTYPE = platform.system()
 
 class CodePadEditor(tk.Frame):
-    def __init__(self, root, mainwindow=None, parent=None, lexer=TextLexer(), hashFunction=hash, *args, **kwargs):
+    readonly = False
+    def __init__(self, root, mainwindow=None, parent=None, lexer=lexerresolver.lexerByName('text'), hashFunction=hash,
+                 highlighter=None, placeholder=False, *args, **kwargs):
         tk.Frame.__init__(self, *args, **kwargs)
         self.root = root
         self._filename = None
         self._hashFunction = hashFunction
         self._saved = tk.BooleanVar()
-        self._saveHash = 0
         self._modified = tk.BooleanVar()
         self._modificationCallbackID = None
-        self.editorFormatter = pygtkformatter.TkFormatter()
+        self.loader = None
+        self.saver = None           # the save under way, if there is one
+        self.journal = None         # the journal of unsaved edits, see startJournal()
+        self.pendingLine = None     # the line to go to once loading is done
+        self.openedStat = None      # os.stat() of the file when its placeholder tab was made, see loadEditor()
+        self.editorFormatter = pygtkformatter.sharedFormatter()
         self.editorLexer = lexer
+        self.highlighter = highlighter     # the HighlightScheduler shared with the other tabs, if there are any
         self.mainwindow = mainwindow if mainwindow else root
         self.parent = parent if parent else root
-        self.buildTextBox()
+        self.lastActive = time.time()   # when the tab was last seen selected, for the hibernation policy
+        self.store = None               # the text while hibernating, see hibernate()
+        self._sleepState = None
+        self.placeholder = placeholder  # nothing built or loaded yet, see wake()
+        self.textbox = None
+        if not placeholder:
+            self.buildTextBox()
 
     def buildTextBox(self):
         """
             Should be called at initialization, puts the text box and scroll bars in place.
         """
-        self.textbox = pygtext.PygmentsText(self, self.editorLexer, self.editorFormatter,
+        self.textbox = pygtext.PygmentsText(self, self.editorLexer, self.editorFormatter, scheduler=self.highlighter,
                                             wrap=tk.NONE, autoseparators=False, undo=True)
         self.textbox.grid(row=0, column=1, sticky="NSEW")
         self.textbox.tag_configure("search", background="green")
@@ -70,23 +94,28 @@ class CodePadEditor(tk.Frame):
         self.vscroll.config(command=self.textbox.yview)
         self.hscroll.config(command=self.textbox.xview)
 
-        self.textbox.bind("<<Change>>", self._on_change)
-        self.textbox.bind("<<Configure>>", self._on_change)
+        self.textbox.bindData("<<ContentChanged>>", self._on_content_change)
+        self.textbox.bind("<<CursorMoved>>", self._on_cursor_move)
+        self.textbox.bind("<<ViewChanged>>", self.linenumberbox.redraw)
+        self.textbox.bind("<Configure>", self.linenumberbox.redraw)
 
     def setTextContent(self, newContent):
         """
-            Clear the text box and fill it's contents.
+            Clear the text box and fill it's contents. The text goes in plain, and is highlighted in the background
+            starting with whatever is on screen, so big files are usable straight away.
         """
-        self.textbox.delete("1.0", tk.END)
-        self.textbox.insertFormatted("end", newContent)
+        with self.textbox.undoGroup():
+            self.textbox.delete("1.0", tk.END)
+            self.textbox.insert("end", newContent)
+        self.textbox.reformatEverything()
         self.linenumberbox.redraw()
 
-    def setSaved(self, state):
+    def setSaved(self, state, saver=None):
         """
             Set the saved state (should beTrue if the file is now on disk, False othewise)
         """
         self._saved.set(state)
-        self.setModifiedFalse()
+        self.setModifiedFalse(saver=saver)
 
     def setFileName(self, name):
         """
@@ -112,11 +141,12 @@ class CodePadEditor(tk.Frame):
         """
             Delete selected and insert next text in its place.
         """
-        try:
-            self.textbox.delete("sel.first", "sel.last")
-        except tk.TclError, e:
-            pass
-        self.textbox.insertFormatted("end", newtext, True)
+        with self.textbox.undoGroup():
+            try:
+                self.textbox.delete("sel.first", "sel.last")
+            except tk.TclError, e:
+                pass
+            self.textbox.insertFormatted("end", newtext, True)
         self.linenumberbox.redraw()
         
     def undo(self):
@@ -137,20 +167,36 @@ class CodePadEditor(tk.Frame):
         except tk.TclError:
             pass
 
-    def _on_change(self, event):
+    def gotoLine(self, line):
         """
-            Redraw the line numberbox when we do something new.
+            Move the cursor to the start of the given (1-based) line, and scroll it into view.
+        """
+        self.textbox.mark_set(tk.INSERT, "{0}.0".format(line))
+        self.textbox.see(tk.INSERT)
+        return True
+
+    def _on_content_change(self, first, last, delta):
+        """
+            Update the modified flag when the text changes, and the line numbers if lines came or went.
+        """
+        if int(delta):
+            self.linenumberbox.redraw()
+        try:
+            modified = self.textbox.changes.isModified(self._contentHash)
+            if modified != self._modified.get():
+                self._modified.set(modified)
+        except Exception as e:
+            sys.stderr.write("Exception occured: {0}".format(e))
+
+    def _on_cursor_move(self, event):
+        """
+            Show the new cursor position in the status bar.
         """
-        self.linenumberbox.redraw()
         try:
             indx = self.textbox.index(tk.INSERT)
             row, col = indx.split(".", 1)
             self.mainwindow.setRow(row)
             self.mainwindow.setCol(int(col)+1)
-            if self._hashFunction(self.getTextContent()) != self._saveHash:
-                self._modified.set(True)
-            else:
-                self._modified.set(False)
         except Exception as e:
             sys.stderr.write("Exception occured: {0}".format(e))
 
@@ -159,24 +205,130 @@ class CodePadEditor(tk.Frame):
         """
             Get the content stored in the textbox
         """
-        return self.textbox.get("1.0", tk.END)
+        if self.hibernating:
+            return self.store.read() + "\n"
+        return self.textbox.document.get() + "\n"
+
+    def textSize(self):
+        """
+            The number of characters in the text, which is what the hibernation policy goes by.
+        """
+        if self.hibernating or self.placeholder:
+            return 0
+        return len(self.textbox.document)
+
+    def hibernate(self, compress=True):
+        """
+            Put the text away (see textstore.TextStore) and destroy the text box, line numbers and scroll bars, to
+            give back what they hold on to while the tab isn't being looked at. The cursor, the view and the
+            modification state and the undo history are kept for wake(). Read-only tabs
+            and tabs still loading or saving are left alone. Returns whether the tab was hibernated.
+        """
+        if self.hibernating or self.placeholder or self.readonly or self.loader or self.saver:
+            return False
+        textbox = self.textbox
+        self._sleepState = (textbox.index(tk.INSERT), textbox.yview()[0], textbox.xview()[0], textbox.changes,
+                            textbox.history)
+        self.store = textstore.TextStore(textbox.document.get(), compress)
+        for widget in (self.linenumberbox, self.vscroll, self.hscroll, textbox):
+            widget.destroy()
+        self.textbox = self.linenumberbox = self.vscroll = self.hscroll = None
+        return True
+
+    def wake(self):
+        """
+            Undo hibernate(): build the text box again, and put the text, cursor and view back as they were. A
+            placeholder tab just gets its (empty) text box, for the file to be loaded into.
+        """
+        if self.placeholder:
+            self.placeholder = False
+            self.lastActive = time.time()
+            self.buildTextBox()
+            return
+        if not self.hibernating:
+            return
+        insert, top, left, changes, history = self._sleepState
+        self.buildTextBox()
+        self.textbox.configure(undo=False)
+        self.setTextContent(self.store.read())
+        # the text is the same as it was, so the old history and tracker still fit it
+        self.textbox.history = history
+        self.textbox.configure(undo=history.enabled)
+        self.textbox.changes = changes
+        self.textbox.mark_set(tk.INSERT, insert)
+        self.textbox.yview_moveto(top)
+        self.textbox.xview_moveto(left)
+        if self.journal:
+            self.textbox.setEditHook(self.journal.record)
+        self.store.close()
+        self.store = None
+        self._sleepState = None
+
+    @property
+    def hibernating(self):
+        """
+            Return if the tab is hibernated (see hibernate()).
+        """
+        return self.store is not None
+
+    def startJournal(self, baseText=None):
+        """
+            Start a journal of the edits from here on (see journal.EditJournal), so they can be got back if CodePad
+            dies before they're saved. They start from the file as it is on disk, or from baseText. Any journal
+            already going is thrown away.
+        """
+        self.stopJournal()
+        if self.readonly:
+            return
+        self.journal = journal.EditJournal(self._journalText, self.filename if self.saved else None, baseText)
+        self.textbox.setEditHook(self.journal.record)
+
+    def stopJournal(self):
+        """
+            Stop journaling edits, and throw the journal away.
+        """
+        if self.journal:
+            self.journal.discard()
+            self.journal = None
+        if self.textbox:
+            self.textbox.setEditHook(None)
+
+    def _journalText(self):
+        return self.textbox.document.snapshot()
+
+    def destroy(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+        if self.journal:
+            self.journal.discard()
+            self.journal = None
+        tk.Frame.destroy(self)
+
+    def _contentHash(self):
+        """
+            Hash the whole of the text. The modification tracker only asks for this when its edit counts say the
+            text might be back to how it was saved, so it isn't done on every change.
+        """
+        return self._hashFunction(self.getTextContent())
 
     def guessLexer(self):
         """
             Call this to try to use the Pygments lexer guess function on this editor.
-            The lexer will be set to whatever the best guess was.
+            The lexer will be set to whatever the best guess was. Only the start of the text is looked at, and
+            often not even that (see lexerresolver.guessLexer).
         """
-        try:
-            newlexer = guess_lexer_for_filename(self.filename, self.getTextContent())
-        except ClassNotFound:
-            newlexer = TextLexer()
-        self.setLexer(newlexer)
+        sample = self.textbox.document.get(0, lexerresolver.SAMPLESIZE)
+        self.setLexer(lexerresolver.guessLexer(self.filename, sample))
         return self.lexer
 
     def setLexer(self, lexer):
         """
-            Set the Lexer to an open lexer instance, and then reformat the code highlighting.
+            Set the Lexer to an open lexer instance, and then reformat the code highlighting (unless it's the lexer
+            we already have).
         """
+        if lexer is self.editorLexer:
+            return
         self.editorLexer = lexer
         self.textbox.setLexer(lexer)
         self.textbox.reformatEverything()
@@ -187,7 +339,7 @@ class CodePadEditor(tk.Frame):
             This will reformat the code highlighting.
         """
         try:
-            newlexer = get_lexer_by_name(lexername.lower(), stripall=True)
+            newlexer = lexerresolver.lexerByName(lexername)
         except ClassNotFound:
             sys.stderr.write("Something went really wrong getting the lexer...\n")
             sys.stderr.write("Lexer name: {0}\n".format(lexername))
@@ -195,12 +347,23 @@ class CodePadEditor(tk.Frame):
         self.setLexer(newlexer)
         return self.lexer
 
-    def setModifiedFalse(self):
+    def setModifiedFalse(self, hashContent=True, saver=None):
         """
-            Set the modification state to false, and update the save hash (this should be called on save).
+            Set the modification state to false, and update the save hash (this should be called on save). The hash
+            is of a snapshot of the text, only taken if the modification tracker asks for it (when undoing gets back
+            to the saved text, say), so saving or loading a big file doesn't mean hashing all of it. With
+            hashContent False there's no hash, and any later edit counts as a modification, even if undone.
+            With a saver (a finished filesaver.ChunkedFileSaver), the text it took a snapshot of is what counts as
+            saved, and anything typed while it was saving still counts as a modification.
         """
-        self._saveHash = self._hashFunction(self.getTextContent())
-        self._modified.set(False)
+        if not hashContent:
+            self.textbox.changes.markSaved(None)
+            self._modified.set(False)
+            return
+        snapshot = saver.snapshot if saver else self.textbox.document.snapshot()
+        self.textbox.changes.markSaved(lambda: self._hashFunction(snapshot.get() + "\n"),
+                                       saver.savePoint if saver else None)
+        self._modified.set(self.textbox.changes.isModified(self._contentHash))
 
     def setModificationCallback(self, callback):
         """
@@ -237,30 +400,188 @@ class CodePadEditor(tk.Frame):
         """
             Return the hash that was generated when the file was last saved.
         """
-        return self._saveHash
+        return self.textbox.changes.savedDigest
 
     @property
     def hasContents(self):
         """
             Return if the editor has any contents in it.
         """
-        if len(self.getTextContent()) > 1:
-            return True
-        else:
-            return False
+        if self.hibernating:
+            return len(self.getTextContent()) > 1
+        return len(self.textbox.document) > 0
 
     @property
     def lexer(self):
         return self.editorLexer
 
+class CodePadViewer(CodePadEditor):
+    """
+        A read-only tab for files too big to load into a text box. The file is memory-mapped (see
+        lineindex.LineIndex), and only the WINDOWLINES lines around the view are in the text box at once; the window
+        slides along when the view gets within MARGINLINES of either end of it. The scrollbar covers the whole file
+        by byte offset, so jumping anywhere in it costs the same however big the file is. The line index is built in
+        the background, and line numbers show up as it gets to them. Highlighting is only ever of the window.
+    """
+    WINDOWLINES = 1000
+    WINDOWBYTES = 4 * 1024 * 1024   # the most of the file in the window, in case of very long lines
+    MARGINLINES = 200
+    INDEXBYTES = 8 * 1024 * 1024    # indexed per background callback
+    readonly = True
+    def __init__(self, root, filename, mainwindow=None, parent=None, *args, **kwargs):
+        self.lines = lineindex.LineIndex(filename)
+        self._windowStart = 0
+        self._windowEnd = 0
+        self._lineStarts = []       # the file offset of each line in the text box
+        self._windowOffset = None   # the offset the window was last loaded around
+        self._pendingOffset = None
+        self._windowJob = None
+        self._indexJob = None
+        CodePadEditor.__init__(self, root, mainwindow, parent, *args, **kwargs)
+        self.setFileName(filename)
+        self.setSaved(True)
+        self.loadWindow(0)
+        self._indexJob = self.after_idle(self._buildIndex)
+
+    def buildTextBox(self):
+        """
+            The same as an editor's text box, but disabled, and with the scrollbar going over the whole file.
+        """
+        CodePadEditor.buildTextBox(self)
+        self.textbox.config(undo=False, state=tk.DISABLED, yscrollcommand=self._onTextScroll)
+        self.vscroll.config(command=self._onScrollbar)
+
+    def loadWindow(self, offset):
+        """
+            Fill the text box with the lines around the given file offset, and scroll the line it is on to the top.
+        """
+        lines = self.lines
+        top = lines.lineStart(offset)
+        self._windowOffset = top
+        start = lines.backward(top, self.WINDOWLINES // 2, self.WINDOWBYTES // 2)
+        starts = lines.forward(start, self.WINDOWLINES, self.WINDOWBYTES)
+        end = starts[-1] if starts else min(lines.size, start + self.WINDOWBYTES)
+        self._windowStart, self._windowEnd = start, end
+        self._lineStarts = [start] + [lineStart for lineStart in starts if lineStart < end]
+        text = lines.data[start:end].decode('utf-8', 'replace')
+        if text.endswith('\n'):
+            text = text[:-1]
+        self.textbox.config(state=tk.NORMAL)
+        self.textbox.delete("1.0", tk.END)
+        self.textbox.insert("1.0", text)
+        self.textbox.config(state=tk.DISABLED)
+        self.textbox.reformatEverything()
+        self.textbox.yview("{0}.0".format(bisect_right(self._lineStarts, top)))
+        self._updateFirstLine()
+
+    def gotoLine(self, line):
+        """
+            Show the given (1-based) line, if the index has got that far.
+        """
+        offset = self.lines.offsetOfLine(line - 1)
+        if offset is None:
+            return False
+        self.loadWindow(offset)
+        return True
+
+    def _updateFirstLine(self):
+        first = self.lines.lineOfOffset(self._windowStart)
+        self.linenumberbox.firstLine = None if first is None else first + 1
+        self.linenumberbox.redraw()
+
+    def _offsetOfTextLine(self, line):
+        return self._lineStarts[line - 1] if line <= len(self._lineStarts) else self._windowEnd
+
+    def _onTextScroll(self, first, last):
+        """
+            The text box's yscrollcommand: show where the view is in the whole file, and slide the window along if the
+            view is getting near either end of it.
+        """
+        top = int(self.textbox.index("@0,0").split(".")[0])
+        bottom = int(self.textbox.index("@0,{0}".format(self.textbox.winfo_height())).split(".")[0])
+        size = float(self.lines.size)
+        topOffset = self._offsetOfTextLine(top)
+        self.vscroll.set(topOffset / size, self._offsetOfTextLine(bottom + 1) / size)
+        if topOffset == self._windowOffset:
+            return  # the window is already as centred on the view as it can be
+        if ((top <= self.MARGINLINES and self._windowStart > 0) or
+                (bottom > len(self._lineStarts) - self.MARGINLINES and self._windowEnd < self.lines.size)):
+            self._scheduleWindow(topOffset)
+
+    def _onScrollbar(self, *args):
+        if args[0] == "moveto":
+            self._scheduleWindow(int(float(args[1]) * self.lines.size))
+        else:
+            self.textbox.yview(*args)
+
+    def _scheduleWindow(self, offset):
+        """
+            Move the window to offset when Tk is next idle. A scrollbar drag only loads the last place dragged to.
+        """
+        self._pendingOffset = offset
+        if self._windowJob is None:
+            self._windowJob = self.after_idle(self._moveWindow)
+
+    def _moveWindow(self):
+        self._windowJob = None
+        self.loadWindow(self._pendingOffset)
+
+    def _buildIndex(self):
+        self._indexJob = None
+        done = self.lines.build(self.INDEXBYTES)
+        if self.linenumberbox.firstLine is None:
+            self._updateFirstLine()
+        if done:
+            self.mainwindow.setStatus('Indexed {0}: {1} lines'.format(self.filename, self.lines.lineCount))
+        else:
+            self.mainwindow.setStatus('Indexing {0}: {1}%'.format(self.filename, int(self.lines.progress * 100)))
+            self._indexJob = self.after(1, self._buildIndex)
+
+    def _on_content_change(self, first, last, delta):
+        """
+            Only the window changes, never the file, so there's no modified flag to keep up to date.
+        """
+        if int(delta):
+            self.linenumberbox.redraw()
+
+    def _on_cursor_move(self, event):
+        """
+            Show the cursor position in the status bar, by file line.
+        """
+        row, col = self.textbox.index(tk.INSERT).split(".", 1)
+        firstLine = self.linenumberbox.firstLine
+        self.mainwindow.setRow(int(row) + firstLine - 1 if firstLine else '?')
+        self.mainwindow.setCol(int(col)+1)
+
+    def destroy(self):
+        for job in (self._windowJob, self._indexJob):
+            if job is not None:
+                self.after_cancel(job)
+        self._windowJob = self._indexJob = None
+        CodePadEditor.destroy(self)
+        self.lines.close()
+
 class CodePadMainWindow(tk.Frame):
     STATUSPADY = 5
     STATUSWIDTH = 10
+    VIEWERSIZE = 512 * 1024 * 1024     # files this big or bigger open in a read-only viewer
+    SYNTAXMENUSIZE = 20                 # lexers per syntax submenu
+    HIBERNATETIME = 10 * 60             # seconds a tab can go unselected before it's hibernated
+    HIBERNATECHARS = 32 * 1024 * 1024   # characters the unselected tabs can hold awake between them
+    HIBERNATECHECK = 30 * 1000          # ms between looks for tabs to hibernate
+    PREFETCHTABS = 2                    # placeholder tabs after the selected one to load in the background
+    PIPELINESIZE = 32 * 1024 * 1024     # files bigger than this are loaded a chunk at a time instead
+    PIPELINEPOLL = 20                   # ms between looks for files the pipeline has finished
+    SAVEFSYNC = True                    # make sure saves are on the disk before they count as done
     def __init__(self, root, *args, **kwargs):
         tk.Frame.__init__(self, root, *args, **kwargs)
         self.root = root
         self.openEditors = []
         self.openFiles = {}
+        self.highlighter = pygscheduler.HighlightScheduler(self)
+        self.pipeline = filepipeline.FilePipeline()
+        self._pipelineJob = None
+        self._hibernateJob = self.after(self.HIBERNATECHECK, self.checkHibernation)
         self.editorNotebook = ttk.Notebook(self)
         self.editorNotebook.enable_traversal()
 
@@ -288,12 +609,14 @@ class CodePadMainWindow(tk.Frame):
         self.root.bind('<Control-Key-n>', lambda e: self.addNewEditor())
         self.filemenu.add_command(label="Open...", command=self.openFile, accelerator="Ctrl+O")
         self.root.bind('<Control-Key-o>', lambda e: self.openFile())
+        self.filemenu.add_command(label="Open Read-Only...", command=self.openFileViewer)
         self.filemenu.add_command(label="Save", command=self.saveFile, accelerator="Ctrl+S")
         self.root.bind('<Control-Key-s>', lambda e: self.saveFile())
         self.filemenu.add_command(label="Save as...", command=self.saveFileAs, accelerator="Shift+Ctrl+S")
         self.root.bind('<Control-Key-S>', lambda e: self.saveFileAs())
         self.filemenu.add_command(label='Close Tab', command=self.closeCurrentTab, accelerator="Ctrl+W")
         self.root.bind('<Control-Key-w>', lambda e: self.closeCurrentTab())
+        self.root.bind('<Escape>', lambda e: self.cancelLoading())
         self.filemenu.add_separator()
         self.filemenu.add_command(label='Print', command=self.printCurrent, accelerator="Ctrl+P")
         self.root.bind('<Control-Key-p>', lambda e: self.printCurrent())
@@ -317,12 +640,17 @@ class CodePadMainWindow(tk.Frame):
         self.viewmenu = tk.Menu(self.menubar, tearoff=0)
         self.viewmenu.add_command(label="Find", command=self.findTextCurrent, accelerator="Ctrl+F")
         self.root.bind('<Control-Key-f>', lambda e: self.findTextCurrent())
-        self.viewmenu.add_command(label="Replace", accelerator="Ctrl+R")
+        self.viewmenu.add_command(label="Find in Files...", command=self.findInFiles, accelerator="Shift+Ctrl+F")
+        self.root.bind('<Control-Key-F>', lambda e: self.findInFiles())
+        self.viewmenu.add_command(label="Go to Line...", command=self.gotoLineCurrent, accelerator="Ctrl+G")
+        self.root.bind('<Control-Key-g>', lambda e: self.gotoLineCurrent())
+        self.viewmenu.add_command(label="Replace", command=self.replaceTextCurrent, accelerator="Ctrl+R")
+        self.root.bind('<Control-Key-r>', lambda e: self.replaceTextCurrent())
         self.viewmenu.add_separator()
-        self.syntaxmenu = tk.Menu(self.menubar, tearoff=0)
+        self.syntaxVar = tk.StringVar(self)
+        self.syntaxmenu = tk.Menu(self.menubar, tearoff=0, postcommand=self.buildSyntaxSubmenus)
         self.syntaxmenu.add_command(label="Guess Syntax...", command=self.guessLexer)
         self.syntaxmenu.add_separator()
-        self.syntaxsubmenus, self.syntaxoptions = self.buildSyntaxSubmenus(self.syntaxmenu)
         self.viewmenu.add_cascade(label="Highlight Syntax...", menu=self.syntaxmenu)
         self.menubar.add_cascade(menu=self.viewmenu, label='View')
 
@@ -379,74 +707,248 @@ class CodePadMainWindow(tk.Frame):
     def setCol(self, col):
         self.colVar.set('Col: {c}'.format(c=col))
 
-    def buildSyntaxSubmenus(self, rootmenu):
-        syntaxsubmenus = []
-        syntaxoptions = []
-        currentmenu = None
-        firstLetter, startLetter = None, None
-        for i, lexer in enumerate(sorted(get_all_lexers())):
-            if not i % 20:
-                if currentmenu:
-
-                    rootmenu.add_cascade(label="Submenu {0}-{1}".format(firstLetter, startLetter), menu=currentmenu)
-                currentmenu = tk.Menu(rootmenu, tearoff=0)
-                firstLetter = lexer[0][0]
-                syntaxsubmenus.append(currentmenu)
-            startLetter = lexer[0][0]
-            newVar = tk.BooleanVar(self)
-            callback = partial(self.setLexer, lexer[0])
-            syntaxoptions.append((lexer[0], newVar, callback))
-            currentmenu.add_checkbutton(label=lexer[0], variable=newVar, command= callback)
-
-        rootmenu.add_cascade(label="Submenu {0}-{1}".format(firstLetter, startLetter), menu=currentmenu)
-        return syntaxsubmenus, syntaxoptions
-
+    def buildSyntaxSubmenus(self):
+        """
+            Add the syntax submenus, the first time the syntax menu is posted. Each one is only filled in the first
+            time it is posted itself, so opening the window doesn't mean a menu entry for every lexer there is. All
+            the entries share syntaxVar, set to the name of the current tab's lexer.
+        """
+        if self.syntaxmenu.index('end') > 1:
+            return
+        lexers = [lexer[0] for lexer in lexerresolver.catalog()]
+        for i in xrange(0, len(lexers), self.SYNTAXMENUSIZE):
+            names = lexers[i:i + self.SYNTAXMENUSIZE]
+            submenu = tk.Menu(self.syntaxmenu, tearoff=0)
+            submenu.config(postcommand=partial(self.fillSyntaxSubmenu, submenu, names))
+            self.syntaxmenu.add_cascade(label="Submenu {0}-{1}".format(names[0][0], names[-1][0]), menu=submenu)
+
+    def fillSyntaxSubmenu(self, submenu, names):
+        if submenu.index('end') is not None:
+            return
+        for name in names:
+            submenu.add_radiobutton(label=name, variable=self.syntaxVar, value=name,
+                                    command=partial(self.setLexer, name))
 
-    def addNewEditor(self, filename=None):
+    def addNewEditor(self, filename=None, placeholder=False):
         """
             Opens a new editor tab.
             If filename is specified, we will try and open in in ASCII mode and use it to fill the new textbox.
-        """
-        ed = CodePadEditor(self.root, self, self.editorNotebook)
+            Files of VIEWERSIZE or more open in a read-only viewer instead.
+            With placeholder True the tab is only a name and the file's stat: nothing is built or read until it's
+            selected (see loadEditor()), and it isn't selected here.
+        """
+        if filename and os.path.isfile(filename) and os.path.getsize(filename) >= self.VIEWERSIZE:
+            return self.addNewViewer(filename)
+        placeholder = placeholder and bool(filename)
+        ed = CodePadEditor(self.root, self, self.editorNotebook, highlighter=self.highlighter,
+                           placeholder=placeholder)
         self.openEditors.append(ed)
         if not filename:
             ed.setFileName("Untitled")
+            ed.startJournal(u"")
         else:
-            try:
-                contents = """"""
-                with open(filename, 'rb') as f:
-                    contents += f.read()
-                try:
-                    newcontents = contents.encode('utf-8')
-                except UnicodeDecodeError:
-                    tkMessageBox.showwarning('Non-UTF-8 Characters', 'Non-UTF-8 characters were detected in this file.\n'
-                                                                     'Loading will proceed with these replaced.\n'
-                                                                     'Continue at your own risk!', parent=self)
-                    try:
-                        newcontents = contents.encode('utf-8', 'xmlcharrefreplace')
-                    except UnicodeDecodeError:
-                        tkMessageBox.showerror('Non-UTF-8 Characters', 'Non-UTF-8 characters were detected in this file.\n'
-                                                                     'Loading could not replace characters.\n'
-                                                                     'Bad characters will be ignored!\n'
-                                                                     'Continue at your own risk!', parent=self)
-                        newcontents = contents.encode('utf-8', 'ignore')
-                contents = newcontents
-            except:
-                tkMessageBox.showerror('Could not read file!', 'Failed to read file correctly!\n'
-                                                               'You may have selected a non-text file.\n')
-                contents = ''
-                traceback.print_exc()
             ed.setFileName(filename)
-            ed.setSaved(True)
-            ed.setTextContent(contents)
-            ed.guessLexer()
-            ed.setModifiedFalse()
-            ed.setModificationCallback(self.currentTabModified)
+            if placeholder:
+                try:
+                    ed.openedStat = os.stat(filename)
+                except OSError:
+                    pass
+            else:
+                self.loadEditor(ed)
+        self.editorNotebook.add(ed, sticky="NSEW")
+        self.setTabTitle(ed, ed.filename)
+        if not placeholder:
+            self.selectEditor(ed)
+        return ed
+
+    def loadEditor(self, ed):
+        """
+            Start loading the file into an editor in the background, building its text box first if it's a
+            placeholder. Files up to PIPELINESIZE are read and decoded in another process (see
+            filepipeline.FilePipeline), so any number of them load side by side; bigger ones are read in a chunk at
+            a time (see fileloader.ChunkedFileLoader), rather than held whole in memory more than once. If the file
+            has changed since its placeholder tab was made, the user is told it's being loaded as it is now.
+        """
+        ed.wake()
+        ed.setSaved(True)
+        opened, ed.openedStat = ed.openedStat, None
+        try:
+            st = os.stat(ed.filename)
+            if st.st_size <= self.PIPELINESIZE:
+                ed.loader = self.pipeline.load(ed.filename)
+                ed.textbox.configure(state=tk.DISABLED)
+                if self._pipelineJob is None:
+                    self._pipelineJob = self.after(self.PIPELINEPOLL, self._pollPipeline)
+            else:
+                ed.loader = fileloader.ChunkedFileLoader(ed.textbox, ed.filename,
+                                                         onProgress=partial(self._loadProgress, ed),
+                                                         onDone=partial(self._loadDone, ed))
+                ed.loader.start()
+        except (IOError, OSError):
+            self._loadFailed(ed)
+        else:
+            if self._isCurrent(ed):
+                self.setStatus('Loading {0}... (Esc to cancel)'.format(ed.filename))
+            if opened is not None and (st.st_size, st.st_mtime) != (opened.st_size, opened.st_mtime):
+                tkMessageBox.showinfo('File Changed', '{0} has changed on disk since its tab was opened.\n'
+                                                      'It is being loaded as it is now.'.format(ed.filename),
+                                      parent=self)
+
+    def openFileList(self, filenames):
+        """
+            Open several files at once. They all get tabs straight away, and load side by side (see loadEditor),
+            rather than one after another. The first of them is selected.
+        """
+        oldeditor = self.getCurrentEditor()
+        closeOld = self.isCurrentEmpty
+        first = None
+        for filename in filenames:
+            ed = self.openFiles.get(filename)
+            if ed is None:
+                ed = self.openFiles[filename] = self.addNewEditor(filename, placeholder=True)
+                if ed.placeholder:
+                    self.loadEditor(ed)
+            if first is None:
+                first = ed
+        if first is not None:
+            self.selectEditor(first)
+            if closeOld and oldeditor is not first:
+                self._closeTab(oldeditor)
+
+    def _prefetch(self):
+        """
+            Start loading the placeholder tabs among the PREFETCHTABS after the selected one.
+        """
+        if not self.openEditors:
+            return
+        current = self.editorNotebook.index(self.selectEditor())
+        for ed in self.openEditors[current + 1:current + 1 + self.PREFETCHTABS]:
+            if ed.placeholder:
+                self.loadEditor(ed)
+
+    def _pollPipeline(self):
+        """
+            Put the files the pipeline has finished into their editors. Runs every PIPELINEPOLL ms while files are
+            loading.
+        """
+        self._pipelineJob = None
+        editors = dict((id(ed.loader), ed) for ed in self.openEditors if ed.loader)
+        error = None
+        for load, result, exc_info in self.pipeline.poll():
+            ed = editors.get(id(load))
+            if ed is None:
+                continue
+            try:
+                if result is None:
+                    if not issubclass(exc_info[0], EnvironmentError):
+                        raise exc_info[0], exc_info[1], exc_info[2]
+                    ed.loader = None
+                    self._loadFailed(ed, exc_info)
+                else:
+                    self._fillEditor(ed, load, *result)
+            except Exception:
+                error = error or sys.exc_info()
+        if self.pipeline.loading:
+            self._pipelineJob = self.after(self.PIPELINEPOLL, self._pollPipeline)
+        if error:
+            raise error[0], error[1], error[2]
+
+    def _fillEditor(self, ed, load, text, replaced, lexerName):
+        """
+            Put what filepipeline.prepareFile() handed back for a file into its editor, which can be edited straight
+            away. It's highlighted like any other edit, starting with whatever is on screen.
+        """
+        textbox = ed.textbox
+        undo = textbox.cget('undo')
+        textbox.configure(undo=False, state=tk.NORMAL)
+        textbox.insert('1.0', text)
+        textbox.configure(undo=undo)
+        textbox.edit_reset()
+        ed.setLexer(lexerresolver.lexerByName(lexerName))
+        ed.linenumberbox.redraw()
+        if self._isCurrent(ed):
+            self.setLexerSelected(ed.lexer)
+        self._finishLoading(ed, load.filename, replaced)
+
+    def _loadFailed(self, ed, exc_info=None):
+        tkMessageBox.showerror('Could not read file!', 'Failed to read file correctly!\n'
+                                                       'You may have selected a non-text file.\n')
+        traceback.print_exception(*(exc_info or sys.exc_info()))
+        ed.textbox.configure(state=tk.NORMAL)
+        ed.setModificationCallback(self.currentTabModified)
+
+    def _isCurrent(self, ed):
+        return str(self.selectEditor()) == str(ed)
+
+    def addNewViewer(self, filename):
+        """
+            Opens filename in a new read-only viewer tab (see CodePadViewer).
+        """
+        try:
+            ed = CodePadViewer(self.root, filename, self, self.editorNotebook, highlighter=self.highlighter)
+        except (EnvironmentError, ValueError):
+            tkMessageBox.showerror('Could not read file!', 'Failed to open the file for viewing!\n', parent=self)
+            traceback.print_exc()
+            return self.addNewEditor()
+        self.openEditors.append(ed)
+        ed.guessLexer()
+        ed.setModificationCallback(self.currentTabModified)
         self.editorNotebook.add(ed, sticky="NSEW")
         self.setTabTitle(ed, ed.filename)
         self.selectEditor(ed)
         return ed
 
+    def _loadProgress(self, ed, loader):
+        """
+            Called by an editor's file loader after each chunk. The lexer is guessed from the first chunk, so the
+            rest of the file is highlighted with the right one as it comes in.
+        """
+        if loader.chunks == 1:
+            self._guessLexerFor(ed)
+        if self._isCurrent(ed):
+            self.setStatus('Loading {0}: {1}% (Esc to cancel)'.format(loader.filename, int(loader.progress * 100)))
+
+    def _loadDone(self, ed, loader):
+        """
+            Called by an editor's file loader once the whole file is in.
+        """
+        if loader.chunks == 1:
+            self._guessLexerFor(ed)
+        self._finishLoading(ed, loader.filename, loader.replaced)
+
+    def _finishLoading(self, ed, filename, replaced):
+        """
+            Called once a file is all in its editor, however it got there.
+        """
+        ed.loader = None
+        ed.setModifiedFalse()
+        ed.startJournal()
+        ed.setModificationCallback(self.currentTabModified)
+        if ed.pendingLine:
+            ed.gotoLine(ed.pendingLine)
+            ed.pendingLine = None
+        if self._isCurrent(ed):
+            self.setStatus('Loaded {0}'.format(filename))
+        if replaced:
+            tkMessageBox.showwarning('Non-UTF-8 Characters', 'Non-UTF-8 characters were detected in this file.\n'
+                                                             'They have been replaced.\n'
+                                                             'Continue at your own risk!', parent=self)
+        self._prefetch()
+
+    def _guessLexerFor(self, ed):
+        ed.guessLexer()
+        if self._isCurrent(ed):
+            self.setLexerSelected(ed.lexer)
+
+    def cancelLoading(self):
+        """
+            Stop loading the file into the current tab (Escape), and close the tab.
+        """
+        currentEditor = self.getCurrentEditor()
+        if currentEditor and currentEditor.loader:
+            self._closeTab(currentEditor)
+            self.setStatus('Cancelled loading {0}'.format(currentEditor.filename))
+
     def selectEditor(self, ed=None):
         """
             Bring the given editor to focus.
@@ -457,78 +959,195 @@ class CodePadMainWindow(tk.Frame):
     def openFile(self):
         """
             The open file callback in the file menu (also mapped to Ctrl+0). Spawns a dialog and opens a new editor if
-            a file was specified. If we canceled, it does nothing.
-        """
-        filename = tkFileDialog.askopenfilename(parent=self,
-                                                filetypes=[("All Files", "*"), ("Plaintext File", "*.txt"),
-                                                           ("Python Script", "*.py"), ("Ruby Script", "*.rb")])
-        if not filename:
+            a file was specified, or one for each of them if several were (see openFileList). If we canceled, it
+            does nothing.
+        """
+        filenames = tkFileDialog.askopenfilenames(parent=self,
+                                                  filetypes=[("All Files", "*"), ("Plaintext File", "*.txt"),
+                                                             ("Python Script", "*.py"), ("Ruby Script", "*.rb")])
+        # some platforms hand the names back as a Tcl list in one string
+        filenames = self.tk.splitlist(filenames) if filenames else ()
+        if len(filenames) > 1:
+            self.openFileList(filenames)
             return
+        if not filenames:
+            return
+        filename = filenames[0]
         if filename not in self.openFiles:
             self._openFile(filename)
         else:
             self.selectEditor(self.openFiles[filename])
 
+    def openFileViewer(self):
+        """
+            Like openFile, but always opens the file in a read-only viewer, however big it is.
+        """
+        filename = tkFileDialog.askopenfilename(parent=self, filetypes=[("All Files", "*")])
+        if not filename:
+            return
+        if filename in self.openFiles:
+            self.selectEditor(self.openFiles[filename])
+            return
+        oldeditor = self.getCurrentEditor()
+        closeOld = self.isCurrentEmpty
+        ed = self.addNewViewer(filename)
+        if ed.readonly:
+            self.openFiles[filename] = ed
+            if closeOld:
+                self._closeTab(oldeditor)
+
     def loadFiles(self, args):
         """
-            This loads a list of files, and should be called at startup.
+            This loads a list of files, and should be called at startup. Only the first is loaded straight away; the
+            rest get placeholder tabs, which load when they're selected, or in the background once they're within
+            PREFETCHTABS after the selected tab.
         """
-        for filename in args:
-            self._openFile(filename)
+        if not args:
+            return
+        self._openFile(args[0])
+        for filename in args[1:]:
+            if filename not in self.openFiles:
+                self.openFiles[filename] = self.addNewEditor(filename, placeholder=True)
+        self.selectEditor(self.openFiles[args[0]])
 
-    def _openFile(self, filename):
+    def _openFile(self, filename, line=None):
         """
-            The private method for loading files into new editors.
+            The private method for loading files into new editors. If line is given, go to that line (once it has
+            loaded), and if the file is already open, just go to its tab.
         """
-        oldeditor = self.getCurrentEditor()
-        closeOld = self.isCurrentEmpty
-        ed = self.addNewEditor(filename)
-        self.openFiles[filename] = ed
-        if closeOld:
-            self._closeTab(oldeditor)
+        if filename in self.openFiles:
+            ed = self.openFiles[filename]
+            self.selectEditor(ed)
+        else:
+            oldeditor = self.getCurrentEditor()
+            closeOld = self.isCurrentEmpty
+            ed = self.addNewEditor(filename)
+            self.openFiles[filename] = ed
+            if closeOld:
+                self._closeTab(oldeditor)
+        if line:
+            # the tab change that would load or wake it may not have come through yet
+            if ed.placeholder:
+                self.loadEditor(ed)
+            else:
+                ed.wake()
+            if ed.loader:
+                ed.pendingLine = line
+            else:
+                ed.gotoLine(line)
 
     def getCurrentEditor(self):
         """
-            Grab the current focused editor instance.
+            Grab the current focused editor instance, waking it if it's hibernated (the tab change that does that
+            may not have come through yet).
         """
-        return self.openEditors[self.editorNotebook.index(self.selectEditor())] if self.openEditors else None
+        if not self.openEditors:
+            return None
+        editor = self.openEditors[self.editorNotebook.index(self.selectEditor())]
+        if editor.placeholder:
+            self.loadEditor(editor)
+        else:
+            editor.wake()
+        return editor
 
-    def saveFile(self):
+    def checkHibernation(self):
+        """
+            Hibernate (see CodePadEditor.hibernate) the unselected tabs that haven't been selected for HIBERNATETIME,
+            then the least recently selected of the rest, while the tabs left awake hold more than HIBERNATECHARS.
+            Runs every HIBERNATECHECK ms.
+        """
+        self._hibernateJob = self.after(self.HIBERNATECHECK, self.checkHibernation)
+        currentEditor = self.getCurrentEditor()
+        now = time.time()
+        if currentEditor:
+            currentEditor.lastActive = now
+        awake = sorted((ed for ed in self.openEditors
+                        if ed is not currentEditor and not (ed.hibernating or ed.placeholder)),
+                       key=lambda ed: ed.lastActive)
+        sizes = [ed.textSize() for ed in awake]
+        total = sum(sizes)
+        for ed, size in zip(awake, sizes):
+            if now - ed.lastActive < self.HIBERNATETIME and total <= self.HIBERNATECHARS:
+                break
+            if ed.hibernate():
+                total -= size
+
+    def saveFile(self, wait=False):
         """
             This is the call back for the regular save in File, (also Ctrl+S). Should spawn a save dialog and
-            save the file to disk, if the user doesn't cancel.
+            save the file to disk, if the user doesn't cancel. The file is saved in the background (see saveEditor),
+            unless wait is True.
         """
         currentEditor = self.getCurrentEditor()
+        if currentEditor.readonly:
+            return True
         if not currentEditor.saved:
-            return self.saveFileAs()
+            return self.saveFileAs(wait)
         else:
-            with open(currentEditor.filename, 'w') as f:
-                f.write(currentEditor.getTextContent())
-            currentEditor.setModifiedFalse()
-            return True
+            return self.saveEditor(currentEditor, wait)
 
-    def saveFileAs(self):
+    def saveFileAs(self, wait=False):
         """
             Let the user select to save the file as (then save the file).
         """
         currentEditor = self.getCurrentEditor()
+        if currentEditor.readonly:
+            tkMessageBox.showinfo('Read-Only', 'This file is open read-only, and can\'t be saved as another file.',
+                                  parent=self)
+            return False
         filename = tkFileDialog.asksaveasfilename()
         if not filename:
             return False
         currentEditor.setFileName(filename)
-        currentEditor.setSaved(True)
         self.setTabTitle(currentEditor, filename)
         self.guessLexer()
-        with open(currentEditor.filename, 'w') as f:
-            f.write(currentEditor.getTextContent())
-        currentEditor.setModifiedFalse()
+        return self.saveEditor(currentEditor, wait)
+
+    def saveEditor(self, ed, wait=False):
+        """
+            Save an editor's text to its file, in the background (see filesaver.ChunkedFileSaver), with progress and
+            any error shown in the status bar. With wait True the save is finished before returning, and the return
+            value is whether it worked; otherwise it's True once the save is under way. A save already under way
+            for the editor is finished first.
+        """
+        if ed.saver:
+            ed.saver.wait()
+        ed.saver = filesaver.ChunkedFileSaver(ed.textbox, ed.filename, fsync=self.SAVEFSYNC,
+                                              onProgress=partial(self._saveProgress, ed),
+                                              onDone=partial(self._saveDone, ed),
+                                              onError=partial(self._saveFailed, ed))
+        ed.saver.start()
+        self.setStatus('Saving {0}...'.format(ed.filename))
+        if wait:
+            return ed.saver.wait()
         return True
 
+    def _saveProgress(self, ed, saver):
+        if self._isCurrent(ed):
+            self.setStatus('Saving {0}: {1}%'.format(saver.filename, int(saver.progress * 100)))
+
+    def _saveDone(self, ed, saver):
+        ed.saver = None
+        # only counts as saved (to its new name, for Save As) once it's on the disk
+        ed.setSaved(True, saver)
+        # anything typed while saving isn't in the file, so then the journal starts from the text as it is
+        ed.startJournal(ed.textbox.document.snapshot() if ed.modified else None)
+        self.setStatus('Saved {0}'.format(saver.filename))
+
+    def _saveFailed(self, ed, saver):
+        ed.saver = None
+        error = saver.error[1]
+        traceback.print_exception(*saver.error)
+        self.setStatus('Could not save {0}: {1}'.format(saver.filename, error))
+        tkMessageBox.showerror('Could not save file!', 'Failed to save {0}:\n{1}\n'
+                                                       'The file on disk has been left as it was.'.format(
+                                                           saver.filename, error), parent=self)
+
     def printCurrent(self):
         currentEditor = self.getCurrentEditor()
         if SYSTEMTYPE == 'Linux':
             if not currentEditor.saved or currentEditor.modified:
-                if not self.saveFile():
+                if not self.saveFile(wait=True):
                     tkMessageBox.showwarning('Save File to Print!', 'File must be saved to print!', parent=self)
                     return
             printDialog = printer.PrintDialogLinux(self, currentEditor.filename)
@@ -598,31 +1217,102 @@ class CodePadMainWindow(tk.Frame):
         return self._closeTab(currentEditor)
 
     def cleanUpOnClose(self):
-        for editor in self.openEditors:
+        """
+            Offer to save each modified tab, then close every tab, which throws its journal away.
+        """
+        for editor in list(self.openEditors):
             if editor.modified:
-               self.selectEditor(editor)
-               if tkMessageBox.askyesno('Save File Modified File?', 'Save this file before closing?', parent=self):
-                   self.saveFile()
-            else:
-                self._closeTab(editor)
+                self.selectEditor(editor)
+                if tkMessageBox.askyesno('Save File Modified File?', 'Save this file before closing?', parent=self):
+                    self.saveFile(wait=True)
+            self._closeTab(editor)
+        self.pipeline.close()
+
+    def recoverJournals(self):
+        """
+            Offer to get back the unsaved edits in the journals left behind by a CodePad that didn't close properly
+            (see journal), each into a new tab. Edits made to a file start out as undoable back to the file.
+        """
+        paths = journal.orphaned()
+        if not paths:
+            return
+        if not tkMessageBox.askyesno('Recover Unsaved Changes?',
+                                     'CodePad didn\'t close properly, and left unsaved changes to {0} file(s).\n'
+                                     'Recover them?'.format(len(paths)), parent=self):
+            for path in paths:
+                journal.remove(path)
+            return
+        for path in paths:
+            try:
+                filename, fromFile, text, edits = journal.read(path)
+            except (EnvironmentError, ValueError, journal.JournalError) as e:
+                tkMessageBox.showerror('Could not recover changes!', 'Failed to recover changes from {0}:\n'
+                                                                     '{1}'.format(path, e), parent=self)
+                traceback.print_exc()
+                journal.remove(path)
+                continue
+            if fromFile and not edits:
+                journal.remove(path)
+                continue
+            self._recoverInto(filename, fromFile, text, edits)
+            journal.remove(path)
+
+    def _recoverInto(self, filename, fromFile, text, edits):
+        oldeditor = self.getCurrentEditor()
+        closeOld = self.isCurrentEmpty
+        ed = self.addNewEditor()
+        ed.stopJournal()
+        if filename:
+            ed.setFileName(filename)
+            ed.setSaved(True)
+            self.setTabTitle(ed, filename)
+        if fromFile:
+            ed.textbox.insert("1.0", text)
+            ed.textbox.edit_reset()
+            ed.setModifiedFalse()
+        else:
+            # not what's on disk, so modified from the start
+            ed.setModifiedFalse(hashContent=False)
+            ed.textbox.insert("1.0", text)
+            ed.textbox.edit_reset()
+        journal.replay(ed.textbox, edits)
+        ed.setModificationCallback(self.currentTabModified)
+        ed.linenumberbox.redraw()
+        self._guessLexerFor(ed)
+        # written straight away, since this text is only in memory now
+        text = ed.textbox.document.snapshot()
+        ed.startJournal(text)
+        ed.journal.snapshot(text)
+        if filename:
+            self.openFiles[filename] = ed
+        if closeOld and oldeditor is not ed:
+            self._closeTab(oldeditor)
 
     def _closeTab(self, editor):
         """
             The private method for closing any editor.
         """
+        if editor.loader:
+            editor.loader.cancel()
+            editor.loader = None
+        if editor.saver:
+            editor.saver.wait()
         if len(self.openEditors) == 1:
             self.addNewEditor()
         self.editorNotebook.forget(editor)
         self.openEditors.remove(editor)
         if editor.filename in self.openFiles:
             self.openFiles.pop(editor.filename)
-        del editor
+        editor.destroy()
 
     def _onTabChange(self, event):
         currentEditor = self.getCurrentEditor()
         if currentEditor:
+            currentEditor.lastActive = time.time()
             currentLexer = currentEditor.lexer
             self.setLexerSelected(currentLexer)
+            self.highlighter.focus(currentEditor.textbox)
+            self._prefetch()
         else:
             sys.stderr.write('_onTabChange called without an open editor..')
         self.setRootTitleFilename(currentEditor.filename)
@@ -650,18 +1340,13 @@ class CodePadMainWindow(tk.Frame):
             sys.stderr.write('guessLexer called without an open editor..')
 
     def setLexerSelected(self, lexer):
-        name = lexer.name
-        for option in self.syntaxoptions:
-            if option[0] == name:
-                option[1].set(True)
-            else:
-                option[1].set(False)
+        self.syntaxVar.set(lexer.name)
 
     def runCurrent(self):
         """
             Save the current file, let the user specify the interpreter, and try to run the code in a new window.
         """
-        if self.saveFile():
+        if self.saveFile(wait=True):
             interpreter = tkSimpleDialog.askstring('Set Interpreter',
                                              'Set the interpreter to run the code',
                                              initialvalue='python', parent=self)
@@ -685,6 +1370,36 @@ class CodePadMainWindow(tk.Frame):
         currentEditor = self.getCurrentEditor()
         extrawidgets.textFindWidget(self.root, currentEditor, self)
 
+    def findInFiles(self):
+        """
+            Open a dialog to search all the files under a directory (by default, the one the current file is in).
+        """
+        currentEditor = self.getCurrentEditor()
+        if currentEditor and currentEditor.saved:
+            directory = os.path.dirname(os.path.abspath(currentEditor.filename))
+        else:
+            directory = os.getcwd()
+        extrawidgets.findInFilesWidget(self.root, self._openFile, directory, self)
+
+    def replaceTextCurrent(self):
+        """
+            Open a dialog to find and replace text in the current editor.
+        """
+        currentEditor = self.getCurrentEditor()
+        if currentEditor.readonly:
+            tkMessageBox.showinfo('Read-Only', 'This file is open read-only.', parent=self)
+            return
+        extrawidgets.textReplaceWidget(self.root, currentEditor, self)
+
+    def gotoLineCurrent(self):
+        """
+            Ask for a line number, and go to it in the current editor.
+        """
+        currentEditor = self.getCurrentEditor()
+        line = tkSimpleDialog.askinteger('Go to Line', 'Line number:', minvalue=1, parent=self)
+        if line and not currentEditor.gotoLine(line):
+            self.setStatus('Line {0} has not been indexed yet'.format(line))
+
     def about(self):
         """
             Show the about box.
@@ -724,10 +1439,12 @@ class CodePad(tk.Tk):
 
     def cmdLineArgs(self, args):
         self.MainWindow.loadFiles(args)
+        self.MainWindow.recoverJournals()
 
     def destroy(self):
         self.MainWindow.cleanUpOnClose()
         tk.Tk.destroy(self)
+        journal.flush()
 
 
 def main(args):
@@ -3,20 +3,44 @@ __version__ = 'v0.2'
 
 try:
     import Tkinter as tk
+    import tkFont
 except ImportError:
     import tkinter as tk
+    import tkinter.font as tkFont
 import ttk
+import tkFileDialog
+import os
+import re
 
 from pygments.formatter import Formatter
+import searchengine
+import filesearch
 
 class textFindWidget(tk.Toplevel):
+    """
+        Find dialog for an editor. The search itself runs over a snapshot of the text in the background (see
+        searchengine.SearchEngine), with the match count shown as it goes. Only the matches on or near the screen are
+        tagged, and they are re-tagged as the view moves. Editing the text searches again once the edits stop.
+    """
     BUTTONWIDTH = 15
+    POLLTIME = 50       # ms between checks on a search running in the background
+    VIEWMARGIN = 100    # lines above and below the view to tag matches in
+    REFRESHTIME = 300   # ms after the last edit before searching again
     def __init__(self, root, editor, parent=None, *args, **kwargs):
         tk.Toplevel.__init__(self, root, *args, **kwargs)
         self.root = root
         self.editor = editor
         self.parent = parent if parent else root
         self.searchTextVar = tk.StringVar(self)
+        self.regexVar = tk.BooleanVar(self)
+        self.matchCaseVar = tk.BooleanVar(self)
+        self.wholeWordVar = tk.BooleanVar(self)
+        self.countVar = tk.StringVar(self)
+        self.engine = searchengine.SearchEngine()
+        self._searched = None   # the search text and options the engine's matches are for
+        self._stale = False     # True once the text has been edited since the search
+        self._pollJob = None
+        self._refreshJob = None
 
         self.lframe = ttk.Labelframe(self, text='Find')
         self.rowOne = tk.Frame(self.lframe)
@@ -24,102 +48,516 @@ class textFindWidget(tk.Toplevel):
 
         self.searchEntry = tk.Entry(self.rowOne, textvariable=self.searchTextVar, width=40)
         self.searchEntry.grid(row=0, column=1, sticky="NSEW")
+        self.searchEntry.bind('<Return>', lambda e: self.findNext())
         self.rowOne.grid(row=0, column=0, sticky="NSEW")
         self.rowOne.grid_rowconfigure(0, weight=1)
         self.rowOne.grid_columnconfigure(1, weight=1)
 
+        self.rowOptions = tk.Frame(self.lframe)
+        tk.Checkbutton(self.rowOptions, text="Regex", variable=self.regexVar).grid(row=0, column=0, sticky="W")
+        tk.Checkbutton(self.rowOptions, text="Match case", variable=self.matchCaseVar).grid(row=0, column=1,
+                                                                                          sticky="W")
+        tk.Checkbutton(self.rowOptions, text="Whole word", variable=self.wholeWordVar).grid(row=0, column=2,
+                                                                                          sticky="W")
+        self.rowOptions.grid(row=1, column=0, sticky="NSEW")
+
         self.rowTwo = tk.Frame(self.lframe)
         self.findButton = tk.Button(self.rowTwo, text="Find", width=self.BUTTONWIDTH, command=self.findText)
         self.findButton.grid(row=0, column=0, sticky="NSEW")
 
         self.closeButton = tk.Button(self.rowTwo, text="Close", command=self.destroy, width=self.BUTTONWIDTH)
         self.closeButton.grid(row=0, column=1, sticky="NSEW")
-        self.rowTwo.grid(row=1, column=0, sticky="NSEW")
+        self.rowTwo.grid(row=2, column=0, sticky="NSEW")
         self.rowTwo.grid_rowconfigure(0, weight=1)
         self.rowTwo.grid_rowconfigure(1, weight=1)
+        self.rowTwo.grid_rowconfigure(2, weight=1)
         self.rowTwo.grid_columnconfigure(0, weight=1)
         self.rowTwo.grid_columnconfigure(1, weight=1)
 
+        self.previousButton = tk.Button(self.rowTwo, text="Find Previous", width=self.BUTTONWIDTH,
+                                        command=self.findPrevious)
+        self.previousButton.grid(row=1, column=0, sticky="NSEW")
+        self.nextButton = tk.Button(self.rowTwo, text="Find Next", width=self.BUTTONWIDTH, command=self.findNext)
+        self.nextButton.grid(row=1, column=1, sticky="NSEW")
+
         self.clearButton = tk.Button(self.rowTwo, text="Clear Highlight", width=self.BUTTONWIDTH,
                                      command=self.clearHighlight)
-        self.clearButton.grid(row=1, column=0, sticky="NSEW")
+        self.clearButton.grid(row=2, column=0, sticky="NSEW")
+        tk.Label(self.rowTwo, textvariable=self.countVar).grid(row=2, column=1, sticky="NSEW")
         self.lframe.grid(row=0, column=0, sticky="NSEW")
 
+        self._textbox = textbox = self.editor.textbox
+        # the text box goes when its tab is closed or hibernated, and the dialog with it
+        self._bindings = [("<<ViewChanged>>", textbox.bindData("<<ViewChanged>>", self._tagVisible)),
+                          ("<<ContentChanged>>", textbox.bindData("<<ContentChanged>>", self._onContentChange)),
+                          ("<Destroy>", textbox.bindData("<Destroy>", lambda *args: self.destroy()))]
+        self.searchEntry.focus_set()
+
 
     def findText(self):
         """
-            Find and highlight all of the text that matches what we are looking for in the current editor.
+            Start finding all of the text that matches what we are looking for in the current editor. The search
+            runs in the background, and the matches on screen are highlighted as they turn up.
+        """
+        self._cancelJobs()
+        self.engine.cancel()
+        self.editor.textbox.tag_remove("search", "1.0", tk.END)
+        compiled = self._compile()
+        if compiled is None:
+            return False
+        self._searched = self._searchOptions()
+        self._stale = False
+        self.engine.start(self.editor.textbox.document.snapshot(), compiled)
+        self.countVar.set("Searching...")
+        self._pollJob = self.after(self.POLLTIME, self._poll)
+        return True
+
+    def findNext(self):
+        """
+            Select the next match after the cursor (starting a search first, if the search text or options have
+            changed), wrapping round at the end.
+        """
+        self._goToMatch(self.engine.nextMatch)
+
+    def findPrevious(self):
+        """
+            Select the last match before the cursor, wrapping round at the start.
         """
-        offSetVar = tk.StringVar(self)
-        offSetVar.set("0")
-        currentpos = "0.0"
-        while currentpos:
-            startPos = "{position} + {offset}c".format(position=currentpos, offset=offSetVar.get())
-            currentpos = self.editor.textbox.search(self.searchTextVar.get(), startPos, stopindex="end",
-                                                     count=offSetVar)
-            if currentpos:
-                self.editor.textbox.tag_add("search", currentpos,
-                                    "{position} + {offset}c".format(position=currentpos, offset=offSetVar.get()))
-        return
+        self._goToMatch(self.engine.previousMatch)
 
     def clearHighlight(self):
         """
             Clear all of the highlights form the current editor.
         """
+        self._cancelJobs()
+        self.engine.cancel()
+        self._searched = None
+        self.countVar.set("")
         self.editor.textbox.tag_remove("search", "1.0", tk.END)
 
+    def _searchOptions(self):
+        return self.searchTextVar.get(), self.regexVar.get(), self.matchCaseVar.get(), self.wholeWordVar.get()
+
+    def _compile(self):
+        """
+            Compile the search text with the options chosen, or return None (saying why) if it won't.
+        """
+        pattern = self.searchTextVar.get()
+        if not pattern:
+            self.countVar.set("")
+            return None
+        try:
+            return self.engine.compile(pattern, self.regexVar.get(), self.matchCaseVar.get(),
+                                       self.wholeWordVar.get())
+        except re.error as e:
+            self.countVar.set("Bad regex: {0}".format(e))
+            return None
+
+    def _goToMatch(self, which):
+        if self._stale or self._searched != self._searchOptions():
+            # Wait for the search to get going; the first batch of matches is enough to go on with.
+            if not self.findText():
+                return
+            self.after(self.POLLTIME, lambda: self._goToMatch(which))
+            return
+        engine = self.engine
+        engine.poll()
+        textbox = self.editor.textbox
+        k = which(engine.offset(textbox.index(tk.INSERT)))
+        if k is None:
+            if engine.searching:
+                self.after(self.POLLTIME, lambda: self._goToMatch(which))
+            return
+        start, end = engine.index(engine.starts[k]), engine.index(engine.ends[k])
+        textbox.tag_remove(tk.SEL, "1.0", tk.END)
+        textbox.tag_add(tk.SEL, start, end)
+        textbox.mark_set(tk.INSERT, start)
+        textbox.see(start)
+        self.countVar.set("{0} of {1}{2}".format(k + 1, engine.count, "..." if engine.searching else ""))
+
+    def _poll(self):
+        """
+            Pick up the matches the background search has found so far.
+        """
+        self._pollJob = None
+        if self.engine.poll():
+            self._tagVisible()
+        if self.engine.searching:
+            self.countVar.set("Searching... {0}".format(self.engine.count))
+            self._pollJob = self.after(self.POLLTIME, self._poll)
+        else:
+            self.countVar.set("{0} matches".format(self.engine.count))
+
+    def _tagVisible(self, *args):
+        """
+            Tag the matches on screen, or within VIEWMARGIN lines of it, and no others.
+        """
+        if not self._searched:
+            return
+        engine, textbox = self.engine, self.editor.textbox
+        top = int(textbox.index("@0,0").split(".")[0]) - self.VIEWMARGIN
+        bottom = int(textbox.index("@0,{0}".format(textbox.winfo_height())).split(".")[0]) + self.VIEWMARGIN
+        first, last = engine.between(engine.lineOffset(top), engine.lineOffset(bottom + 1))
+        indices = []
+        for k in xrange(first, last):
+            indices.append(engine.index(engine.starts[k]))
+            indices.append(engine.index(engine.ends[k]))
+        textbox.tag_remove("search", "1.0", tk.END)
+        if indices:
+            textbox.tk.call(textbox._w, "tag", "add", "search", *indices)
+
+    def _onContentChange(self, *args):
+        """
+            The matches are for the text as it was, so search again once the edits stop.
+        """
+        if not self._searched:
+            return
+        self._stale = True
+        if self._refreshJob is not None:
+            self.after_cancel(self._refreshJob)
+        self._refreshJob = self.after(self.REFRESHTIME, self._refresh)
+
+    def _refresh(self):
+        self._refreshJob = None
+        if self._searched:
+            self.findText()
+
+    def _cancelJobs(self):
+        for job in (self._pollJob, self._refreshJob):
+            if job is not None:
+                self.after_cancel(job)
+        self._pollJob = self._refreshJob = None
+
+    def destroy(self):
+        self._cancelJobs()
+        self.engine.cancel()
+        try:
+            for sequence, command in self._bindings:
+                self._textbox.unbindData(sequence, command)
+        except tk.TclError:
+            pass    # the editor has been closed already
+        tk.Toplevel.destroy(self)
+
+class textReplaceWidget(textFindWidget):
+    """
+        Find and replace dialog. Replace All works out every replacement from a snapshot of the text in one go, and
+        makes them all as one undo step: an edit per match if there are no more than EDITLIMIT of them, otherwise a
+        single replace of everything from the first match to the last. Either way the highlighter re-lexes the
+        edited lines once, after the lot, rather than once per match.
+    """
+    EDITLIMIT = 100
+    def __init__(self, root, editor, parent=None, *args, **kwargs):
+        textFindWidget.__init__(self, root, editor, parent, *args, **kwargs)
+        self.lframe.configure(text='Replace')
+        self.replaceTextVar = tk.StringVar(self)
+        tk.Label(self.rowOne, text="Replace With:").grid(row=1, column=0)
+        self.replaceEntry = tk.Entry(self.rowOne, textvariable=self.replaceTextVar, width=40)
+        self.replaceEntry.grid(row=1, column=1, sticky="NSEW")
+        self.replaceEntry.bind('<Return>', lambda e: self.replaceText())
+        self.rowOne.grid_rowconfigure(1, weight=1)
+
+        self.replaceButton = tk.Button(self.rowTwo, text="Replace", width=self.BUTTONWIDTH,
+                                       command=self.replaceText)
+        self.replaceButton.grid(row=3, column=0, sticky="NSEW")
+        self.replaceAllButton = tk.Button(self.rowTwo, text="Replace All", width=self.BUTTONWIDTH,
+                                          command=self.replaceAll)
+        self.replaceAllButton.grid(row=3, column=1, sticky="NSEW")
+        self.rowTwo.grid_rowconfigure(3, weight=1)
+
+    def replaceText(self):
+        """
+            If the selection is a match, replace it. Then go on to the next match.
+        """
+        compiled = self._compile()
+        if compiled is None:
+            return
+        textbox = self.editor.textbox
+        try:
+            start, end = textbox.index(tk.SEL_FIRST), textbox.index(tk.SEL_LAST)
+        except tk.TclError:
+            start = end = None     # nothing selected
+        if start is not None:
+            selected = textbox.get(start, end)
+            match = compiled.match(selected)
+            if match and match.end() == len(selected):
+                try:
+                    new = match.expand(self.replaceTextVar.get()) if self.regexVar.get() else self.replaceTextVar.get()
+                except re.error as e:
+                    self.countVar.set("Bad replacement: {0}".format(e))
+                    return
+                textbox.edit_separator()
+                textbox.tk.call(textbox._w, "replace", start, end, new)
+                textbox.edit_separator()
+                textbox.mark_set(tk.INSERT, "{0} + {1}c".format(start, len(new)))
+                self._stale = True
+        self.findNext()
+
+    def replaceAll(self):
+        """
+            Replace every match in the text, as one undo step.
+        """
+        compiled = self._compile()
+        if compiled is None:
+            return
+        textbox = self.editor.textbox
+        text = textbox.document.get()
+        try:
+            edits = searchengine.replacements(text, compiled, self.replaceTextVar.get(), self.regexVar.get())
+        except re.error as e:
+            self.countVar.set("Bad replacement: {0}".format(e))
+            return
+        if not edits:
+            self.countVar.set("0 matches")
+            return
+        lineStarts = searchengine.findLineStarts(text)
+        with textbox.undoGroup():
+            if len(edits) <= self.EDITLIMIT:
+                # backwards, so the edits still to make don't move
+                for start, end, new in reversed(edits):
+                    textbox.tk.call(textbox._w, "replace", searchengine.indexOf(lineStarts, start),
+                                    searchengine.indexOf(lineStarts, end), new)
+            else:
+                first, last = edits[0][0], edits[-1][1]
+                pieces = []
+                pos = first
+                for start, end, new in edits:
+                    pieces.append(text[pos:start])
+                    pieces.append(new)
+                    pos = end
+                textbox.tk.call(textbox._w, "replace", searchengine.indexOf(lineStarts, first),
+                                searchengine.indexOf(lineStarts, last), "".join(pieces))
+        self._stale = True
+        self.countVar.set("Replaced {0}".format(len(edits)))
+
+class findInFilesWidget(tk.Toplevel):
+    """
+        Find in files dialog. The search runs in worker processes (see filesearch.FileSearch), and the hits stream
+        into the results list as they come in, up to MAXRESULTS of them. Double-clicking (or pressing Enter on) a
+        hit calls onOpen(path, line).
+    """
+    BUTTONWIDTH = 15
+    POLLTIME = 30       # ms between checks on the search
+    MAXRESULTS = 20000  # lines in the results list
+    def __init__(self, root, onOpen, directory, parent=None, *args, **kwargs):
+        tk.Toplevel.__init__(self, root, *args, **kwargs)
+        self.root = root
+        self.onOpen = onOpen
+        self.parent = parent if parent else root
+        self.title('Find in Files')
+        self.directoryVar = tk.StringVar(self)
+        self.directoryVar.set(directory)
+        self.searchTextVar = tk.StringVar(self)
+        self.regexVar = tk.BooleanVar(self)
+        self.matchCaseVar = tk.BooleanVar(self)
+        self.wholeWordVar = tk.BooleanVar(self)
+        self.statusVar = tk.StringVar(self)
+        self.search = filesearch.FileSearch()
+        self._hits = []     # (path, line) for each line in the results list
+        self._pollJob = None
+
+        self.lframe = ttk.Labelframe(self, text='Find in Files')
+        self.rowOne = tk.Frame(self.lframe)
+        tk.Label(self.rowOne, text="Search Text:").grid(row=0, column=0, sticky="W")
+        self.searchEntry = tk.Entry(self.rowOne, textvariable=self.searchTextVar, width=40)
+        self.searchEntry.grid(row=0, column=1, sticky="NSEW")
+        self.searchEntry.bind('<Return>', lambda e: self.findText())
+        tk.Label(self.rowOne, text="Directory:").grid(row=1, column=0, sticky="W")
+        tk.Entry(self.rowOne, textvariable=self.directoryVar, width=40).grid(row=1, column=1, sticky="NSEW")
+        tk.Button(self.rowOne, text="Browse...", command=self.browse).grid(row=1, column=2, sticky="NSEW")
+        self.rowOne.grid(row=0, column=0, sticky="NSEW")
+        self.rowOne.grid_columnconfigure(1, weight=1)
+
+        self.rowOptions = tk.Frame(self.lframe)
+        tk.Checkbutton(self.rowOptions, text="Regex", variable=self.regexVar).grid(row=0, column=0, sticky="W")
+        tk.Checkbutton(self.rowOptions, text="Match case", variable=self.matchCaseVar).grid(row=0, column=1,
+                                                                                          sticky="W")
+        tk.Checkbutton(self.rowOptions, text="Whole word", variable=self.wholeWordVar).grid(row=0, column=2,
+                                                                                          sticky="W")
+        self.rowOptions.grid(row=1, column=0, sticky="NSEW")
+
+        self.rowTwo = tk.Frame(self.lframe)
+        tk.Button(self.rowTwo, text="Find", width=self.BUTTONWIDTH, command=self.findText).grid(row=0, column=0,
+                                                                                              sticky="NSEW")
+        tk.Button(self.rowTwo, text="Stop", width=self.BUTTONWIDTH, command=self.stop).grid(row=0, column=1,
+                                                                                          sticky="NSEW")
+        tk.Button(self.rowTwo, text="Close", width=self.BUTTONWIDTH, command=self.destroy).grid(row=0, column=2,
+                                                                                              sticky="NSEW")
+        tk.Label(self.rowTwo, textvariable=self.statusVar, anchor="w").grid(row=1, column=0, columnspan=3,
+                                                                            sticky="EW")
+        self.rowTwo.grid(row=2, column=0, sticky="NSEW")
+
+        self.results = ScrollListbox(self.lframe, width=100, height=20)
+        self.results.Listbox.bind('<Double-Button-1>', self._openSelected)
+        self.results.Listbox.bind('<Return>', self._openSelected)
+        self.results.grid(row=3, column=0, sticky="NSEW")
+        self.lframe.grid_rowconfigure(3, weight=1)
+        self.lframe.grid_columnconfigure(0, weight=1)
+        self.lframe.grid(row=0, column=0, sticky="NSEW")
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+        self.searchEntry.focus_set()
+
+    def browse(self):
+        directory = tkFileDialog.askdirectory(parent=self, initialdir=self.directoryVar.get())
+        if directory:
+            self.directoryVar.set(directory)
+
+    def findText(self):
+        """
+            Start searching the files under the directory, clearing the results of any search before.
+        """
+        self.stop()
+        self.results.Listbox.delete(0, tk.END)
+        self._hits = []
+        pattern = self.searchTextVar.get()
+        directory = self.directoryVar.get()
+        if not pattern or not os.path.isdir(directory):
+            self.statusVar.set("Give some text to search for, and a directory to search in.")
+            return
+        try:
+            compiled = searchengine.SearchEngine.compile(pattern, self.regexVar.get(), self.matchCaseVar.get(),
+                                                         self.wholeWordVar.get())
+        except re.error as e:
+            self.statusVar.set("Bad regex: {0}".format(e))
+            return
+        self.search.start(directory, compiled)
+        self.statusVar.set("Searching...")
+        self._pollJob = self.after(self.POLLTIME, self._poll)
+
+    def stop(self):
+        if self._pollJob is not None:
+            self.after_cancel(self._pollJob)
+            self._pollJob = None
+        if self.search.searching:
+            self.search.cancel()
+            self.statusVar.set("Stopped: {0} hits in {1} files searched".format(len(self._hits),
+                                                                                self.search.filesSearched))
+
+    def _poll(self):
+        """
+            Add the hits that have come in since the last poll to the results list.
+        """
+        self._pollJob = None
+        lines = []
+        directory = self.directoryVar.get()
+        for path, hits in self.search.poll():
+            name = os.path.relpath(path, directory)
+            for line, text in hits:
+                if len(self._hits) >= self.MAXRESULTS:
+                    break
+                self._hits.append((path, line))
+                lines.append(u"{0}:{1}: {2}".format(name, line, text))
+        if lines:
+            self.results.Listbox.insert(tk.END, *lines)
+        if len(self._hits) >= self.MAXRESULTS:
+            self.search.cancel()
+            self.statusVar.set("Stopped at {0} hits".format(len(self._hits)))
+        elif self.search.searching:
+            self.statusVar.set("Searching... {0} hits in {1} files".format(len(self._hits),
+                                                                            self.search.filesSearched))
+            self._pollJob = self.after(self.POLLTIME, self._poll)
+        else:
+            self.statusVar.set("{0} hits in {1} files searched".format(len(self._hits), self.search.filesSearched))
+
+    def _openSelected(self, event):
+        selection = self.results.Listbox.curselection()
+        if selection:
+            path, line = self._hits[int(selection[0])]
+            self.onOpen(path, line)
+
+    def destroy(self):
+        self.stop()
+        self.search.close()
+        tk.Toplevel.destroy(self)
+
 #From StackOverflow http://stackoverflow.com/questions/16369470/tkinter-adding-line-number-to-text-widget
 class TextLineNumbers(tk.Canvas):
+    """
+        A line number gutter for a Text widget. The canvas text items are kept in a pool and reused: a redraw
+        only moves or renumbers the items that need it, and does nothing at all if the view hasn't moved and the
+        number of lines hasn't changed. The visible line numbers and positions come back from a single Tcl call.
+        If the text widget only holds part of a file, set firstLine to the number of the file line its first line
+        is (or None if that isn't known, to leave the gutter blank).
+    """
+    PADDING = 6     # pixels either side of the widest line number
     def __init__(self, *args, **kwargs):
         tk.Canvas.__init__(self, *args, **kwargs)
         self.textwidget = None
+        self._items = []        # canvas text items, in the order they are used down the gutter
+        self._shown = []        # (line number, y) each item shows, or None if it's hidden
+        self._lastView = None
+        self.firstLine = 1
+        self._digits = 0
+        self._minWidth = int(self.cget("width"))
+        self.tk.eval('''
+            proc textlinenumbers_visible {text} {
+                # the line number and y position of each line on screen, as a flat list
+                set result {}
+                set i [$text index @0,0]
+                while {[set dline [$text dlineinfo $i]] ne ""} {
+                    lappend result [lindex [split $i .] 0] [lindex $dline 1]
+                    set next [$text index "$i +1line"]
+                    if {$next eq $i} break
+                    set i $next
+                }
+                return $result
+            }
+            ''')
 
     def attach(self, text_widget):
         self.textwidget = text_widget
+        self._lastView = None
 
     def redraw(self, *args):
         '''redraw line numbers'''
-        self.delete("all")
-
-        i = self.textwidget.index("@0,0")
-        while True :
-            dline= self.textwidget.dlineinfo(i)
-            if dline is None: break
-            y = dline[1]
-            linenum = str(i).split(".")[0]
-            self.create_text(2,y,anchor="nw", text=linenum)
-            i = self.textwidget.index("%s+1line" % i)
+        text = self.textwidget
+        top = text.index("@0,0")
+        dline = text.dlineinfo(top)
+        lineCount = int(text.index("end -1c").split(".")[0])
+        view = (top, dline[1] if dline else None, lineCount, text.winfo_height(), self.firstLine)
+        if view == self._lastView:
+            return
+        self._lastView = view
+        self._setWidth(lineCount + (self.firstLine or 1) - 1)
 
-#From StackOverflow http://stackoverflow.com/questions/16369470/tkinter-adding-line-number-to-text-widget
-class CustomText(tk.Text):
-    def __init__(self, *args, **kwargs):
-        tk.Text.__init__(self, *args, **kwargs)
+        visible = self.tk.splitlist(self.tk.call("textlinenumbers_visible", text._w))
+        if self.firstLine is None:
+            numbers = [""] * (len(visible) // 2)
+        else:
+            numbers = [str(int(visible[k]) + self.firstLine - 1) for k in range(0, len(visible), 2)]
+        lines = [(numbers[k // 2], int(visible[k + 1])) for k in range(0, len(visible), 2)]
+        for k, (linenum, y) in enumerate(lines):
+            if k == len(self._items):
+                self._items.append(self.create_text(2, y, anchor="nw", text=linenum))
+                self._shown.append((linenum, y))
+                continue
+            shown = self._shown[k]
+            if shown == (linenum, y):
+                continue
+            item = self._items[k]
+            if shown is None:
+                self.itemconfigure(item, text=linenum, state="normal")
+            elif shown[0] != linenum:
+                self.itemconfigure(item, text=linenum)
+            if shown is None or shown[1] != y:
+                self.coords(item, 2, y)
+            self._shown[k] = (linenum, y)
+        for k in range(len(lines), len(self._items)):
+            if self._shown[k] is not None:
+                self.itemconfigure(self._items[k], state="hidden")
+                self._shown[k] = None
 
-        self.tk.eval('''
-            proc widget_proxy {widget widget_command args} {
-
-                # call the real tk widget command with the real args
-                set result [uplevel [linsert $args 0 $widget_command]]
-
-                # generate the event for certain types of commands
-                if {([lindex $args 0] in {insert replace delete}) ||
-                    ([lrange $args 0 2] == {mark set insert}) ||
-                    ([lrange $args 0 1] == {xview moveto}) ||
-                    ([lrange $args 0 1] == {xview scroll}) ||
-                    ([lrange $args 0 1] == {yview moveto}) ||
-                    ([lrange $args 0 1] == {yview scroll})} {
-
-                    event generate  $widget <<Change>> -when tail
-                }
-
-                # return the result from the real widget command
-                return $result
-            }
-            ''')
-        self.tk.eval('''
-            rename {widget} _{widget}
-            interp alias {{}} ::{widget} {{}} widget_proxy {widget} _{widget}
-        '''.format(widget=str(self)))
+    def _setWidth(self, lineCount):
+        """
+            Make the gutter wide enough for the biggest line number. This only changes when the number of digits
+            does, and then the width is worked out from the width of one digit rather than by measuring anything.
+        """
+        digits = len(str(lineCount))
+        if digits == self._digits:
+            return
+        self._digits = digits
+        width = tkFont.nametofont("TkDefaultFont").measure("0") * digits + 2 * self.PADDING
+        self.configure(width=max(self._minWidth, width))
 
 class ScrollListbox(tk.Frame):
     """
@@ -129,6 +567,8 @@ class ScrollListbox(tk.Frame):
         tk.Frame.__init__(self, parent)
         self._lbox = tk.Listbox(self, *args, **kwargs)
         self._vscroll = tk.Scrollbar(self, orient=tk.VERTICAL)
+        self._lbox.config(yscrollcommand=self._vscroll.set)
+        self._vscroll.config(command=self._lbox.yview)
         self._lbox.pack(fill=tk.BOTH, expand=1, side=tk.LEFT)
         self._vscroll.pack(fill=tk.Y, side=tk.RIGHT)
 
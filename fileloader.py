@@ -0,0 +1,99 @@
+#   CodePad
+#   Chunked file loading for the editor tabs
+__author__ = 'Robert Cope'
+
+try:
+    import Tkinter as tk
+except ImportError:
+    import tkinter as tk
+import codecs
+import os
+
+
+class ChunkedFileLoader(object):
+    """
+        Loads a file into a Text widget a chunk at a time, from after() callbacks, so a big file neither blocks the
+        UI nor has to be held in memory more than a chunk at a time. The bytes go through an incremental decoder, so a
+        multibyte character split across two chunks still comes out whole. If the file turns out not to be valid in
+        the encoding, the bad bytes (and the rest of the file) are decoded with replacement characters, and replaced is
+        set. The widget is disabled, and its undo stack turned off, until the load is done or cancelled.
+    """
+    CHUNKSIZE = 256 * 1024      # bytes read and inserted per callback
+    def __init__(self, textwidget, filename, encoding='utf-8', onProgress=None, onDone=None):
+        self.textwidget = textwidget
+        self.filename = filename
+        self.encoding = encoding
+        self.onProgress = onProgress    # called with this loader after every chunk but the last
+        self.onDone = onDone            # called with this loader once the whole file is in
+        self.replaced = False
+        self.chunks = 0
+        self._file = open(filename, 'rb')
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._read = 0
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self._undo = None
+        self._job = None
+
+    def start(self):
+        """
+            Start loading in the background.
+        """
+        self._undo = self.textwidget.cget('undo')
+        self.textwidget.configure(undo=False, state=tk.DISABLED)
+        self._job = self.textwidget.after_idle(self._loadChunk)
+
+    def cancel(self):
+        """
+            Stop loading, leaving whatever is already in the widget there.
+        """
+        if self._job is not None:
+            self.textwidget.after_cancel(self._job)
+            self._job = None
+        self._finish()
+
+    @property
+    def progress(self):
+        """
+            How much of the file has been read, from 0.0 to 1.0.
+        """
+        return float(self._read) / self._size if self._size else 1.0
+
+    def _loadChunk(self):
+        self._job = None
+        data = self._file.read(self.CHUNKSIZE)
+        self._read += len(data)
+        self.chunks += 1
+        final = len(data) < self.CHUNKSIZE
+        text = self._decode(data, final)
+        if text:
+            self.textwidget.configure(state=tk.NORMAL)
+            self.textwidget.insert('end -1c', text)
+            self.textwidget.configure(state=tk.DISABLED)
+        if final:
+            self._finish()
+            if self.onDone:
+                self.onDone(self)
+            return
+        if self.onProgress:
+            self.onProgress(self)
+        self._job = self.textwidget.after(1, self._loadChunk)
+
+    def _decode(self, data, final):
+        """
+            Decode the next chunk. The decoder holds on to any incomplete character at the end of a chunk until the
+            rest of it turns up. If the chunk won't decode, switch to a decoder that replaces bad bytes, carrying
+            over whatever was held back, and decode it again (a failed decode doesn't use up any input).
+        """
+        try:
+            return self._decoder.decode(data, final)
+        except UnicodeDecodeError:
+            state = self._decoder.getstate()
+            self._decoder = codecs.getincrementaldecoder(self.encoding)('replace')
+            self._decoder.setstate(state)
+            self.replaced = True
+            return self._decoder.decode(data, final)
+
+    def _finish(self):
+        self._file.close()
+        self.textwidget.configure(undo=self._undo, state=tk.NORMAL)
+        self.textwidget.edit_reset()
@@ -0,0 +1,102 @@
+#   CodePad
+#   Opening files in worker processes
+__author__ = 'Robert Cope'
+
+import multiprocessing
+import sys
+import lexerresolver
+
+
+def prepareFile(job):
+    """
+        Reading a file for opening, in a worker process. job is (path, encoding). The file is read and decoded
+        (with replacement characters, if it isn't valid in the encoding), and its lexer is picked. Returns (text,
+        replaced, lexer name). It isn't lexed here: that would hold the tab up until the whole file was done, where
+        the editor highlights whatever is on screen first, and the rest in the background.
+    """
+    path, encoding = job
+    with open(path, 'rb') as f:
+        data = f.read()
+    try:
+        text, replaced = data.decode(encoding), False
+    except UnicodeDecodeError:
+        text, replaced = data.decode(encoding, 'replace'), True
+    del data
+    lexer = lexerresolver.guessLexer(path, text[:lexerresolver.SAMPLESIZE])
+    return text, replaced, lexer.name
+
+
+class FilePipeline(object):
+    """
+        Opens files with a pool of worker processes (one per core, see prepareFile()), so that opening a lot of
+        them at once is spread over every core, and the Tk thread is only left to put the text in. The pool is started the first time it's needed, and kept for the next file. poll() (called from the Tk
+        thread) hands back the files that are ready.
+    """
+    def __init__(self, encoding='utf-8'):
+        self.encoding = encoding
+        self._pool = None
+        self._loads = []
+
+    def load(self, filename):
+        """
+            Start opening filename. Returns a PipelineLoad to look out for in poll().
+        """
+        if self._pool is None:
+            self._pool = multiprocessing.Pool()
+        load = PipelineLoad(filename, self._pool.apply_async(prepareFile, ((filename, self.encoding),)))
+        self._loads.append(load)
+        return load
+
+    @property
+    def loading(self):
+        return bool(self._loads)
+
+    def poll(self):
+        """
+            The (load, result, error) of each load that has finished since the last poll, and hasn't been
+            cancelled. result is what prepareFile() returned, or None if it raised, in which case error is the
+            exc_info.
+        """
+        done = []
+        loads = []
+        for load in self._loads:
+            if load.cancelled:
+                continue
+            if not load.ready():
+                loads.append(load)
+                continue
+            try:
+                done.append((load, load.get(), None))
+            except Exception:
+                done.append((load, None, sys.exc_info()))
+        self._loads = loads
+        return done
+
+    def close(self):
+        for load in self._loads:
+            load.cancel()
+        self._loads = []
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+
+class PipelineLoad(object):
+    """
+        A file on its way through a FilePipeline, which stands in for a fileloader.ChunkedFileLoader as an editor's
+        loader. A worker can't be stopped part way through a file, so cancelling just has the result dropped.
+    """
+    progress = 0.0
+    def __init__(self, filename, result):
+        self.filename = filename
+        self.cancelled = False
+        self._result = result
+
+    def ready(self):
+        return self._result.ready()
+
+    def get(self):
+        return self._result.get()
+
+    def cancel(self):
+        self.cancelled = True
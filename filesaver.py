@@ -0,0 +1,150 @@
+#   CodePad
+#   Background, all-or-nothing saving for the editor tabs
+__author__ = 'Robert Cope'
+
+import codecs
+import os
+import stat
+import sys
+import tempfile
+import threading
+
+
+class ChunkedFileSaver(object):
+    """
+        Saves a PygmentsText's contents to a file without holding up the UI, and without ever leaving the file half
+        written. A writer thread goes through a snapshot of the widget's document (see pygments_tk_text.document) a
+        piece at a time, encoding it into a temporary file in the same directory, so the text is never copied out
+        of Tk. Once it's all written (and with fsync, on the disk) the temporary file gets the original's
+        permissions and is renamed over it. If anything goes wrong, the temporary file is removed, the original is
+        left as it was, and error is set. The widget can be edited all the while; savePoint (see
+        ChangeTracker.savePoint) says where in its edits the snapshot was taken, so those made since still count as
+        unsaved.
+    """
+    POLLTIME = 10           # ms between looks at how the writer is getting on
+    def __init__(self, textwidget, filename, encoding='utf-8', fsync=True, onProgress=None, onDone=None,
+                 onError=None):
+        self.textwidget = textwidget
+        self.filename = filename
+        self.encoding = encoding
+        self.fsync = fsync
+        self.onProgress = onProgress    # called with this saver as the writer gets through the text
+        self.onDone = onDone            # called with this saver once the file is saved
+        self.onError = onError          # called with this saver if the save failed (see error)
+        self.error = None               # the exc_info the save failed with, if it did
+        self.charsWritten = 0
+        # write through a symlink, rather than replacing it
+        self._target = os.path.realpath(filename)
+        self.snapshot = None            # the text being saved
+        self.savePoint = None
+        self._writer = None
+        self._job = None
+
+    def start(self):
+        """
+            Start saving in the background.
+        """
+        self.snapshot = self.textwidget.document.snapshot()
+        self.savePoint = self.textwidget.changes.savePoint()
+        self._mode = self._fileMode()
+        self._writer = threading.Thread(target=self._write)
+        self._writer.daemon = True
+        self._writer.start()
+        self._job = self.textwidget.after(self.POLLTIME, self._poll)
+
+    def wait(self):
+        """
+            Finish the save before returning, rather than in the background. Returns True if it worked.
+        """
+        if self._job is not None:
+            self.textwidget.after_cancel(self._job)
+            self._job = None
+        self._writer.join()
+        self._finish()
+        return self.error is None
+
+    @property
+    def progress(self):
+        """
+            How much of the text has been written, from 0.0 to 1.0.
+        """
+        length = len(self.snapshot) if self.snapshot is not None else 0
+        return float(self.charsWritten) / length if length else 1.0
+
+    def _fileMode(self):
+        """
+            The permissions to save with: the file's own, or if it's new, what the umask leaves of rw for all.
+        """
+        try:
+            return stat.S_IMODE(os.stat(self._target).st_mode)
+        except OSError:
+            umask = os.umask(0)
+            os.umask(umask)
+            return 0666 & ~umask
+
+    def _poll(self):
+        self._job = None
+        if self._writer.is_alive():
+            if self.onProgress:
+                self.onProgress(self)
+            self._job = self.textwidget.after(self.POLLTIME, self._poll)
+            return
+        self._finish()
+
+    def _finish(self):
+        if self.error is None:
+            if self.onDone:
+                self.onDone(self)
+        elif self.onError:
+            self.onError(self)
+
+    def _write(self):
+        """
+            The writer thread. Never touches Tk.
+        """
+        directory, name = os.path.split(self._target)
+        temp = None
+        try:
+            fd, temp = tempfile.mkstemp(prefix='.{0}.'.format(name), suffix='.tmp', dir=directory)
+            with os.fdopen(fd, 'wb') as f:
+                encoder = codecs.getincrementalencoder(self.encoding)()
+                for text in self.snapshot.chunks():
+                    f.write(encoder.encode(text))
+                    self.charsWritten += len(text)
+                f.write(encoder.encode(u'', True))
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            os.chmod(temp, self._mode)
+            if os.name == 'nt' and os.path.exists(self._target):
+                # rename() won't replace a file on Windows, so this last step isn't atomic there
+                os.remove(self._target)
+            os.rename(temp, self._target)
+            temp = None
+            if self.fsync and hasattr(os, 'O_DIRECTORY'):
+                self._syncDirectory(directory)
+        except Exception:
+            self.error = sys.exc_info()
+        finally:
+            if temp is not None:
+                try:
+                    os.remove(temp)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _syncDirectory(directory):
+        """
+            Make sure the rename itself is on the disk. The file is saved either way, so a filesystem that can't
+            do this isn't an error.
+        """
+        try:
+            dirfd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        except OSError:
+            return
+        try:
+            os.fsync(dirfd)
+        except OSError:
+            pass
+        finally:
+            os.close(dirfd)
@@ -0,0 +1,157 @@
+#   CodePad
+#   Find in files
+__author__ = 'Robert Cope'
+
+import fnmatch
+import multiprocessing
+import os
+import re
+import threading
+import Queue
+
+DEFAULTIGNORE = ['.git', '.hg', '.svn', '.bzr', 'CVS', '__pycache__', 'node_modules',
+                 '*.pyc', '*.pyo', '*.o', '*.so', '*.a', '*.dll', '*.exe', '*.class', '*.jar', '*.zip', '*.gz']
+SNIFFSIZE = 8192                    # bytes looked at for a NUL, to tell binary files
+MAXFILESIZE = 32 * 1024 * 1024      # files bigger than this aren't searched
+MAXHITS = 1000                      # hits kept per file
+MAXLINETEXT = 200                   # characters of each hit line kept
+
+
+def readIgnoreFile(root):
+    """
+        The patterns in root's .gitignore, if it has one. Only plain name patterns are understood: negations are
+        skipped, and a pattern with a directory in it is matched against names only.
+    """
+    patterns = []
+    try:
+        with open(os.path.join(root, '.gitignore')) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#') and not line.startswith('!'):
+                    patterns.append(line.strip('/').split('/')[-1])
+    except (IOError, OSError):
+        pass
+    return patterns
+
+
+def walk(root, ignore):
+    """
+        Every file under root whose name (and whose directories' names) don't match any of the ignore patterns.
+    """
+    def ignored(name):
+        return any(fnmatch.fnmatch(name, pattern) for pattern in ignore)
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [name for name in dirnames if not ignored(name)]
+        for name in filenames:
+            if not ignored(name):
+                yield os.path.join(dirpath, name)
+
+
+def searchFile(job):
+    """
+        Search one file, in a worker process. job is (path, pattern, flags). Returns (path, hits), where hits is a
+        list of (line number, line text) for each line with a match, or None if the file was skipped (unreadable,
+        too big, or binary).
+    """
+    path, pattern, flags = job
+    try:
+        with open(path, 'rb') as f:
+            data = f.read(MAXFILESIZE + 1)
+    except (IOError, OSError):
+        return path, None
+    if len(data) > MAXFILESIZE or '\0' in data[:SNIFFSIZE]:
+        return path, None
+    text = data.decode('utf-8', 'replace')
+    hits = []
+    line, pos = 1, 0
+    for match in re.compile(pattern, flags).finditer(text):
+        start = match.start()
+        if start == match.end():
+            continue
+        line += text.count('\n', pos, start)
+        pos = start
+        if hits and hits[-1][0] == line:
+            continue
+        lineEnd = text.find('\n', start)
+        lineText = text[text.rfind('\n', 0, start) + 1:lineEnd if lineEnd != -1 else len(text)]
+        hits.append((line, lineText.strip()[:MAXLINETEXT]))
+        if len(hits) >= MAXHITS:
+            break
+    return path, hits
+
+
+class FileSearch(object):
+    """
+        Searches every file under a directory for a regex, with a pool of worker processes (one per core), kept for
+        the next search. The directory is walked in a thread, feeding the pool as it goes, so the first hits come
+        back as soon as the first files have been searched, and the results are handed back through a queue for
+        poll() (called from the Tk thread) to pick up.
+    """
+    CHUNKSIZE = 8   # files per task handed to a worker
+    def __init__(self):
+        self.searching = False
+        self.filesSearched = 0
+        self._pool = None
+        self._generation = 0
+        self._results = Queue.Queue()
+
+    def start(self, root, compiled, ignore=None):
+        """
+            Start searching the files under root for the compiled regex, dropping any search already running.
+        """
+        self._generation += 1
+        self.searching = True
+        self.filesSearched = 0
+        if self._pool is None:
+            self._pool = multiprocessing.Pool()
+        if ignore is None:
+            ignore = DEFAULTIGNORE + readIgnoreFile(root)
+        worker = threading.Thread(target=self._search,
+                                  args=(self._generation, root, compiled.pattern, compiled.flags, ignore))
+        worker.daemon = True
+        worker.start()
+
+    def cancel(self):
+        """
+            Stop the search. The walk stops feeding the pool straight away; files already handed out are finished,
+            but their results are dropped.
+        """
+        self._generation += 1
+        self.searching = False
+
+    def close(self):
+        self.cancel()
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+    def poll(self):
+        """
+            The (path, hits) results that have come in since the last poll, for files with hits.
+        """
+        found = []
+        while True:
+            try:
+                generation, path, hits = self._results.get_nowait()
+            except Queue.Empty:
+                return found
+            if generation != self._generation:
+                continue
+            if path is None:
+                self.searching = False
+                continue
+            self.filesSearched += 1
+            if hits:
+                found.append((path, hits))
+
+    def _search(self, generation, root, pattern, flags, ignore):
+        def jobs():
+            for path in walk(root, ignore):
+                if generation != self._generation:
+                    return
+                yield path, pattern, flags
+        for path, hits in self._pool.imap_unordered(searchFile, jobs(), self.CHUNKSIZE):
+            if generation != self._generation:
+                return
+            self._results.put((generation, path, hits))
+        self._results.put((generation, None, None))
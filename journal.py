@@ -0,0 +1,328 @@
+#   CodePad
+#   Edit journals, for getting unsaved work back after a crash
+__author__ = 'Robert Cope'
+
+import errno
+import itertools
+import json
+import os
+import struct
+import threading
+import time
+import traceback
+import zlib
+
+JOURNALDIR = os.path.join(os.path.expanduser('~'), '.codepad', 'journals')
+COMMITTIME = 0.2        # seconds the writer waits for more edits to join a commit
+FSYNC = True            # make sure each commit is on the disk
+COMPACTBYTES = 1024 * 1024  # bytes of edits after which a journal is started again from a snapshot
+
+# Each record is (kind, payload length, payload crc32) then the payload. A journal is a header, then a snapshot if
+# the text didn't start out as the file on disk, then edits. Indices are (line, column), as Tk has them.
+RECORD = struct.Struct('<cII')
+INDEX = struct.Struct('<II')
+RANGE = struct.Struct('<IIII')
+HEADER, SNAPSHOT, INSERT, DELETE, REPLACE = 'HSidr'
+OPS = {'insert': INSERT, 'delete': DELETE, 'replace': REPLACE}
+
+_ids = itertools.count()
+_lock = threading.Condition()
+_pending = []           # (journal, kind, data) for the writer, in order
+_committing = False
+_flushing = False
+_worker = None
+_lockFile = None        # held open while we have journals, where there's no asking if a pid is running
+
+
+class JournalError(Exception):
+    pass
+
+
+class EditJournal(object):
+    """
+        An append-only record of the edits made to one tab, from which its text can be got back if CodePad dies
+        before it's saved. The edits start from either the file as it is on disk (the journal only notes its size
+        and modification time) or baseText, which goes in as a snapshot. record() is fed every edit (see
+        PygmentsText.setEditHook), and costs a few bytes for a keystroke; the writing is done by a thread shared by
+        every journal, which commits whatever has come in every COMMITTIME. Once COMPACTBYTES of edits have piled
+        up, the journal is started again from a snapshot of getText(), which can hand back the text itself or a
+        document snapshot (see pygments_tk_text.document) for the writer to read it out of. Nothing is written
+        until the first edit.
+    """
+    def __init__(self, getText, filename=None, baseText=None):
+        self.getText = getText
+        self.filename = filename
+        self.path = os.path.join(JOURNALDIR, '{0}-{1}.journal'.format(os.getpid(), next(_ids)))
+        self.failed = False     # set by the writer if the journal couldn't be written, after which it's left be
+        self._header = {'filename': filename}
+        if baseText is None:
+            st = os.stat(filename)
+            self._header.update(base='file', size=st.st_size, mtime=st.st_mtime)
+        self._baseText = baseText
+        self._started = False
+        self._bytes = 0
+
+    def record(self, op, first, last, text):
+        """
+            Note an edit, with its indices as "line.column" strings.
+        """
+        if self.failed:
+            return
+        if not self._started:
+            self.snapshot(self._baseText)
+        firstLine, firstCol = first.split('.')
+        text = text.encode('utf-8')
+        if op == 'insert':
+            payload = INDEX.pack(int(firstLine), int(firstCol)) + text
+        else:
+            lastLine, lastCol = last.split('.')
+            payload = RANGE.pack(int(firstLine), int(firstCol), int(lastLine), int(lastCol)) + text
+        data = _record(OPS[op], payload)
+        _queue(self, 'append', data)
+        self._bytes += len(data)
+        if self._bytes >= COMPACTBYTES:
+            self.snapshot(self.getText())
+
+    def snapshot(self, text=None):
+        """
+            Start the journal again from text (or the file on disk, if the journal started from that and text is
+            None), dropping the edits so far.
+        """
+        header = dict(self._header)
+        if text is not None:
+            header.update(base='snapshot', size=None, mtime=None)
+        self._started = True
+        self._baseText = None
+        self._bytes = 0
+        _queue(self, 'start', (header, text))
+
+    def discard(self):
+        """
+            Stop journaling, and delete the journal: the tab has been saved or closed.
+        """
+        self.failed = True
+        _queue(self, 'discard', None)
+
+
+def _record(kind, payload):
+    return RECORD.pack(kind, len(payload), zlib.crc32(payload) & 0xffffffff) + payload
+
+
+def _queue(journal, kind, data):
+    global _worker
+    with _lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_work)
+            _worker.daemon = True
+            _worker.start()
+        _pending.append((journal, kind, data))
+        _lock.notify_all()
+
+
+def flush():
+    """
+        Wait for everything queued so far to be written (at exit, say).
+    """
+    global _flushing
+    with _lock:
+        _flushing = True
+        while _pending or _committing:
+            _lock.wait(COMMITTIME)
+        _flushing = False
+
+
+def _work():
+    global _committing
+    files = {}      # journal -> its file, open for appending
+    while True:
+        with _lock:
+            while not _pending:
+                _lock.wait()
+        if not _flushing:
+            # let whatever else is typed in the meantime go in the same commit
+            time.sleep(COMMITTIME)
+        with _lock:
+            items = list(_pending)
+            del _pending[:]
+            _committing = True
+        try:
+            _commit(items, files)
+        finally:
+            with _lock:
+                _committing = False
+                _lock.notify_all()
+
+
+def _commit(items, files):
+    written = set()
+    for journal, kind, data in items:
+        if journal.failed and kind != 'discard':
+            continue
+        try:
+            if kind == 'append':
+                f = files.get(journal)
+                if f is None:
+                    f = files[journal] = open(journal.path, 'ab')
+                f.write(data)
+                written.add(journal)
+            elif kind == 'start':
+                if journal in files:
+                    files.pop(journal).close()
+                written.discard(journal)
+                _start(journal.path, *data)
+            else:
+                if journal in files:
+                    files.pop(journal).close()
+                written.discard(journal)
+                if os.path.exists(journal.path):
+                    os.remove(journal.path)
+        except EnvironmentError:
+            journal.failed = True
+            traceback.print_exc()
+    for journal in written:
+        try:
+            f = files[journal]
+            f.flush()
+            if FSYNC:
+                os.fsync(f.fileno())
+        except EnvironmentError:
+            journal.failed = True
+            traceback.print_exc()
+
+
+def _start(path, header, text):
+    """
+        Write a journal with just a header and (if text isn't None) a snapshot, over whatever was at path.
+    """
+    if not os.path.isdir(JOURNALDIR):
+        os.makedirs(JOURNALDIR)
+    _holdLock()
+    data = _record(HEADER, json.dumps(header))
+    if text is not None:
+        if not isinstance(text, basestring):
+            text = text.get()
+        data += _record(SNAPSHOT, zlib.compress(text.encode('utf-8'), 1))
+    temp = path + '.tmp'
+    with open(temp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        if FSYNC:
+            os.fsync(f.fileno())
+    if os.name == 'nt' and os.path.exists(path):
+        os.remove(path)
+    os.rename(temp, path)
+
+
+def orphaned():
+    """
+        The journals left behind by CodePads that are no longer running.
+    """
+    try:
+        names = os.listdir(JOURNALDIR)
+    except OSError:
+        return []
+    paths = []
+    for name in sorted(names):
+        if not name.endswith(('.journal', '.lock')):
+            continue
+        try:
+            pid = int(name.split('-', 1)[0].split('.', 1)[0])
+        except ValueError:
+            continue
+        # (asking about a lock file's pid is enough to clear it away once that CodePad has gone)
+        if not _running(pid) and name.endswith('.journal'):
+            paths.append(os.path.join(JOURNALDIR, name))
+    return paths
+
+
+def _holdLock():
+    """
+        Where there's no asking the system if a pid is running (Windows), keep a lock file named after ours open
+        for as long as we're running. An open file can't be deleted there, so _running() can tell by trying.
+    """
+    global _lockFile
+    if os.name == 'posix' or _lockFile is not None:
+        return
+    _lockFile = open(os.path.join(JOURNALDIR, '{0}.lock'.format(os.getpid())), 'w')
+
+
+def _running(pid):
+    if pid == os.getpid():
+        return True
+    if os.name != 'posix':
+        try:
+            os.remove(os.path.join(JOURNALDIR, '{0}.lock'.format(pid)))
+        except OSError as e:
+            # still held open by the CodePad that made it, unless there's no lock to hold
+            return e.errno != errno.ENOENT
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def read(path):
+    """
+        Read a journal. Returns (filename, fromFile, text, edits): the file the tab was saved to (or None), whether
+        the edits start from that file as it is on disk, the text they start from, and the (op, first, last, text)
+        edits, as for PygmentsText.setEditHook. A record cut short or garbled by the crash ends the journal there.
+        Raises JournalError if the journal has nothing to start from, or the file it starts from has changed.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    header, text, edits = None, None, []
+    pos = 0
+    while pos + RECORD.size <= len(data):
+        kind, length, crc = RECORD.unpack_from(data, pos)
+        payload = data[pos + RECORD.size:pos + RECORD.size + length]
+        if len(payload) < length or zlib.crc32(payload) & 0xffffffff != crc:
+            break
+        pos += RECORD.size + length
+        if kind == HEADER:
+            header = json.loads(payload)
+        elif kind == SNAPSHOT:
+            text = zlib.decompress(payload).decode('utf-8')
+        elif kind == INSERT:
+            line, col = INDEX.unpack_from(payload)
+            index = '{0}.{1}'.format(line, col)
+            edits.append(('insert', index, index, payload[INDEX.size:].decode('utf-8')))
+        else:
+            firstLine, firstCol, lastLine, lastCol = RANGE.unpack_from(payload)
+            edits.append(('delete' if kind == DELETE else 'replace', '{0}.{1}'.format(firstLine, firstCol),
+                          '{0}.{1}'.format(lastLine, lastCol), payload[RANGE.size:].decode('utf-8')))
+    if header is None:
+        raise JournalError('The journal is empty.')
+    filename = header['filename']
+    fromFile = header.get('base') == 'file'
+    if fromFile:
+        try:
+            st = os.stat(filename)
+        except OSError:
+            raise JournalError('{0} is gone.'.format(filename))
+        if (st.st_size, st.st_mtime) != (header['size'], header['mtime']):
+            raise JournalError('{0} has changed since.'.format(filename))
+        with open(filename, 'rb') as f:
+            text = f.read().decode('utf-8', 'replace')
+    elif text is None:
+        raise JournalError('The journal is empty.')
+    return filename, fromFile, text, edits
+
+
+def replay(textwidget, edits):
+    """
+        Make edits (as read() hands them back) to a Text widget holding the text they start from.
+    """
+    for op, first, last, text in edits:
+        if op != 'insert':
+            textwidget.delete(first, last)
+        if text:
+            textwidget.insert(first, text)
+
+
+def remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
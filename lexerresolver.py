@@ -0,0 +1,133 @@
+#   CodePad
+#   Cheap lexer selection
+__author__ = 'Robert Cope'
+
+import os
+import re
+import json
+import pygments
+from pygments.lexers import get_all_lexers, guess_lexer_for_filename, find_lexer_class, \
+    find_lexer_class_by_name, ClassNotFound
+
+SAMPLESIZE = 16 * 1024      # characters of a file guessLexer() needs to see, at most
+INTERPRETERS = {'python': 'python', 'pypy': 'python', 'ruby': 'ruby', 'perl': 'perl', 'sh': 'bash',
+                'bash': 'bash', 'zsh': 'bash', 'ksh': 'bash', 'node': 'javascript', 'nodejs': 'javascript',
+                'php': 'php', 'tclsh': 'tcl', 'wish': 'tcl', 'lua': 'lua', 'awk': 'awk', 'gawk': 'awk',
+                'Rscript': 'r', 'escript': 'erlang', 'groovy': 'groovy', 'scala': 'scala'}
+SHEBANG = re.compile(r'#!\s*(\S+)(?:\s+(\S+))?')
+CACHEDIR = os.path.join(os.path.expanduser('~'), '.codepad')
+
+_instances = {}     # the shared instance of each lexer class
+_lexers = {}        # the same, by the names they've been asked for by
+_extensions = None  # extension -> lexer name, for extensions only one lexer claims
+_guessed = {}       # extension -> lexer name, for extensions we've had to guess at
+_catalog = None
+
+
+def lexerByName(name):
+    """
+        The lexer for a Pygments lexer alias or full name ("python" or "Python"). Lexers have no state of their own
+        between uses, so there is one instance of each, shared by every tab. Raises ClassNotFound if there is no such
+        lexer.
+    """
+    lexer = _lexers.get(name)
+    if lexer is None:
+        try:
+            lexerClass = find_lexer_class_by_name(name.lower())
+        except ClassNotFound:
+            lexerClass = find_lexer_class(name)
+            if lexerClass is None:
+                raise
+        lexer = _instances.get(lexerClass)
+        if lexer is None:
+            lexer = _instances[lexerClass] = lexerClass(stripall=True)
+        _lexers[name] = lexer
+    return lexer
+
+
+def guessLexer(filename, sample):
+    """
+        Work out the lexer for a file, given its name and (up to SAMPLESIZE characters of) its start. In order:
+        an extension only one lexer claims (or one we've had to guess at before), the interpreter in a #! line, and
+        last of all Pygments' guess_lexer_for_filename() on the sample, which is then remembered for the extension.
+    """
+    extension = os.path.splitext(os.path.basename(filename or ''))[1]
+    if extension:
+        name = _extensionMap().get(extension) or _guessed.get(extension)
+        if name:
+            return lexerByName(name)
+    name = _shebangLexer(sample)
+    if name:
+        return lexerByName(name)
+    try:
+        lexer = guess_lexer_for_filename(filename or '', sample[:SAMPLESIZE])
+        name = lexer.aliases[0] if lexer.aliases else 'text'
+    except ClassNotFound:
+        name = 'text'
+    if extension:
+        _guessed[extension] = name
+    return lexerByName(name)
+
+
+def catalog():
+    """
+        (name, aliases, filename patterns) for every lexer, sorted by name. Asking Pygments for these means loading
+        its plugin entry points, which is slow, so the list is kept in CACHEDIR, and only asked for again when the
+        Pygments version changes (or the cache can't be read).
+    """
+    global _catalog
+    if _catalog is None:
+        path = os.path.join(CACHEDIR, 'lexers-{0}.json'.format(pygments.__version__))
+        try:
+            with open(path) as f:
+                _catalog = [(name, tuple(aliases), tuple(patterns)) for name, aliases, patterns in json.load(f)]
+        except (IOError, OSError, ValueError):
+            _catalog = sorted((name, tuple(aliases), tuple(patterns))
+                              for name, aliases, patterns, mimetypes in get_all_lexers())
+            _saveCatalog(path, _catalog)
+    return _catalog
+
+
+def _saveCatalog(path, lexers):
+    """
+        Write the catalog out, to a temporary file first so a half-written one is never read. Not being able to write
+        it only means working it out again next time.
+    """
+    try:
+        if not os.path.isdir(CACHEDIR):
+            os.makedirs(CACHEDIR)
+        temporary = '{0}.{1}.tmp'.format(path, os.getpid())
+        with open(temporary, 'w') as f:
+            json.dump(lexers, f)
+        os.rename(temporary, path)
+    except (IOError, OSError):
+        pass
+
+
+def _shebangLexer(sample):
+    match = SHEBANG.match(sample)
+    if not match:
+        return None
+    interpreter = os.path.basename(match.group(1))
+    if interpreter == 'env' and match.group(2):
+        interpreter = match.group(2)
+    return INTERPRETERS.get(interpreter.rstrip('0123456789.'))
+
+
+def _extensionMap():
+    """
+        Extension -> lexer name, for every simple "*.ext" filename pattern claimed by exactly one lexer. This only
+        reads the catalog, without importing any lexers.
+    """
+    global _extensions
+    if _extensions is None:
+        claims = {}
+        for name, aliases, patterns in catalog():
+            if not aliases:
+                continue
+            for pattern in patterns:
+                extension = pattern[1:]
+                if pattern.startswith('*.') and not any(c in extension for c in '*?['):
+                    claims.setdefault(extension, set()).add(aliases[0])
+        _extensions = dict((extension, names.pop()) for extension, names in claims.iteritems() if len(names) == 1)
+    return _extensions
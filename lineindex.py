@@ -0,0 +1,123 @@
+#   CodePad
+#   Line index for memory-mapped files
+__author__ = 'Robert Cope'
+
+import mmap
+import os
+from array import array
+from bisect import bisect_left
+
+
+class LineIndex(object):
+    """
+        A read-only memory-mapped file, with a sparse index of where its lines are. The index is just the number of
+        newlines before the start of each BLOCKSIZE bytes of the file, built a bit at a time with build(), so it is
+        small even for a huge file. Finding the line an offset is on, or where a line starts, then means a binary
+        search and a look through one block. Lines are 0-based, and offsets are in bytes.
+    """
+    BLOCKSIZE = 16 * 1024
+    MAXLINEBYTES = 64 * 1024    # how far back lineStart() looks for the start of a line before giving up
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self.size = os.fstat(f.fileno()).st_size
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.lineCount = None                   # known once the whole file has been indexed
+        self._blockLines = array('L', [0])      # newlines before the start of each block indexed so far
+
+    @property
+    def complete(self):
+        return self.lineCount is not None
+
+    @property
+    def progress(self):
+        """
+            How much of the file has been indexed, from 0.0 to 1.0.
+        """
+        return min(1.0, float(len(self._blockLines) - 1) * self.BLOCKSIZE / self.size) if self.size else 1.0
+
+    def build(self, maxBytes):
+        """
+            Index up to maxBytes more of the file. Returns True once the whole file has been indexed.
+        """
+        data, blockLines = self.data, self._blockLines
+        start = (len(blockLines) - 1) * self.BLOCKSIZE
+        stop = min(self.size, start + maxBytes)
+        while start < stop:
+            end = start + self.BLOCKSIZE
+            blockLines.append(blockLines[-1] + data[start:end].count('\n'))
+            start = end
+        if start >= self.size and self.lineCount is None:
+            endsWithNewline = self.size and data[self.size - 1] == '\n'
+            self.lineCount = blockLines[-1] + (0 if endsWithNewline else 1)
+        return self.complete
+
+    def lineOfOffset(self, offset):
+        """
+            The line the byte at offset is on, or None if the index hasn't got that far yet.
+        """
+        block = offset // self.BLOCKSIZE
+        if block >= len(self._blockLines):
+            return None
+        return self._blockLines[block] + self.data[block * self.BLOCKSIZE:offset].count('\n')
+
+    def offsetOfLine(self, line):
+        """
+            Where the given line starts, or None if the index hasn't got that far yet (or there's no such line).
+        """
+        if line <= 0:
+            return 0
+        # the block with the newline that ends the line before
+        block = bisect_left(self._blockLines, line) - 1
+        if block >= len(self._blockLines) - 1:
+            return None
+        pos = block * self.BLOCKSIZE - 1
+        for _ in xrange(line - self._blockLines[block]):
+            pos = self.data.find('\n', pos + 1)
+        return pos + 1
+
+    def lineStart(self, offset):
+        """
+            The start of the line offset is on. If that's more than MAXLINEBYTES back, give up and go MAXLINEBYTES
+            back, so a file with no newlines doesn't get searched end to end.
+        """
+        limit = max(0, offset - self.MAXLINEBYTES)
+        if offset <= limit:
+            return limit
+        found = self.data.rfind('\n', limit, offset)
+        return found + 1 if found != -1 else limit
+
+    def forward(self, offset, count, maxBytes):
+        """
+            The starts of the (up to) count lines after the one starting at offset, without looking more than maxBytes
+            past offset. If the file ends first, the last entry is the size of the file.
+        """
+        starts = []
+        limit = min(self.size, offset + maxBytes)
+        pos = offset
+        while len(starts) < count:
+            pos = self.data.find('\n', pos, limit)
+            if pos == -1:
+                break
+            pos += 1
+            starts.append(pos)
+        if len(starts) < count and limit == self.size and (starts[-1] if starts else offset) < self.size:
+            starts.append(self.size)
+        return starts
+
+    def backward(self, offset, count, maxBytes):
+        """
+            The start of the line count lines before the one starting at offset, without looking more than maxBytes
+            before offset.
+        """
+        limit = max(0, offset - maxBytes)
+        pos = offset
+        for _ in xrange(count):
+            if pos <= limit:
+                return limit
+            found = self.data.rfind('\n', limit, pos - 1)
+            pos = found + 1 if found != -1 else limit
+        return pos
+
+    def close(self):
+        self.data.close()
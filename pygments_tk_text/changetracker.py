@@ -0,0 +1,107 @@
+#Modification tracking for PygmentsText
+__author__ = 'Robert Cope'
+
+
+class ChangeTracker(object):
+
+    """Works out whether a text has been modified since it was last saved from
+    a count of edits and of undo steps, rather than by looking at the text.
+
+    depth is how many undo steps the text is from where it started: an edit
+    after a separator (or after an undo/redo) starts a new step, undo takes one
+    off and redo puts one back. If depth isn't what it was at the last save the
+    text is modified, and that's all most checks need. If it is, the text might
+    be back where it was saved (or might not, if the steps don't line up with
+    the undo history's), so then and only then we compare a digest of the text
+    with the saved one, which is only worked out the first time it's needed.
+    Either answer is kept until the next edit. A save made without a digest
+    counts as modified after any edit at all, even one that has since been
+    undone. A save made from a copy of the text
+    taken earlier (in the background, say) is marked against the counts from
+    savePoint(), taken along with the copy, so edits made in the meantime still
+    count."""
+
+    def __init__(self):
+        self.editCount = 0      # every insert/delete, including undo/redo
+        self.depth = 0
+        self.savedDepth = 0     # None once the saved state can't be got back to
+        self._savedDigest = None
+        self._digest = None     # works out _savedDigest, until it's been asked for
+        self._savedEditCount = 0
+        self._point = None      # [editCount, depth] from savePoint(), depth None once it can't be got back to
+        self._stepOpen = False
+        self._checked = None    # (editCount, modified) from the last check
+
+    def edited(self, replaying=False):
+        """Call after every insert/delete. replaying is True for the ones Tk
+        makes itself to carry out an undo or redo."""
+        self.editCount += 1
+        if replaying or self._stepOpen:
+            return
+        if self.savedDepth is not None and self.savedDepth > self.depth:
+            # The save was undone, and this edit throws away the redo that would have got back to it.
+            self.savedDepth = None
+        if self._point is not None and self._point[1] > self.depth:
+            self._point[1] = None
+        self.depth += 1
+        self._stepOpen = True
+
+    def separator(self):
+        self._stepOpen = False
+
+    def undone(self):
+        self._stepOpen = False
+        self.depth -= 1
+
+    def redone(self):
+        self._stepOpen = False
+        self.depth += 1
+
+    def reset(self):
+        """The undo stack has been cleared, so only the current state can be got back to."""
+        self._stepOpen = False
+        if self.savedDepth != self.depth:
+            self.savedDepth = None
+        if self._point is not None and self._point[1] != self.depth:
+            self._point[1] = None
+
+    def savePoint(self):
+        """Call when a copy of the text is taken to be saved, and hand what it
+        returns to markSaved() once that copy is saved."""
+        self._stepOpen = False
+        self._point = [self.editCount, self.depth]
+        return self._point
+
+    def markSaved(self, digest=None, point=None):
+        """Call when the text is saved. digest() should return a digest of the
+        text saved, which is the text as it was at point, if one is given (see
+        savePoint), or else as it is now. It isn't called until the digest is
+        needed, so it should work from a copy of the text, not the text itself."""
+        if point is None:
+            self._stepOpen = False
+            point = [self.editCount, self.depth]
+        self._point = None
+        self._savedEditCount, self.savedDepth = point
+        self._savedDigest, self._digest = None, digest
+        self._checked = (self.editCount, False) if self.editCount == self._savedEditCount else None
+
+    @property
+    def savedDigest(self):
+        """The digest of the text as it was saved, or None if there isn't one."""
+        if self._digest is not None:
+            self._savedDigest, self._digest = self._digest(), None
+        return self._savedDigest
+
+    def isModified(self, digest):
+        """Has the text changed since it was last saved? digest() is only called if the
+        counts say the text could be back to how it was saved."""
+        if self._checked is not None and self._checked[0] == self.editCount:
+            return self._checked[1]
+        if self.editCount == self._savedEditCount:
+            modified = False
+        elif self.depth != self.savedDepth or self.savedDigest is None:
+            modified = True
+        else:
+            modified = digest() != self.savedDigest
+        self._checked = (self.editCount, modified)
+        return modified
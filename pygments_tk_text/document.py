@@ -0,0 +1,220 @@
+#A copy of a PygmentsText's text, kept in step with it
+__author__ = 'Robert Cope'
+
+LEAFCHARS = 2048    # most text a leaf holds; neighbouring leaves smaller than this are merged
+
+
+class _Leaf(object):
+    __slots__ = ('text', 'length', 'newlines', 'height')
+
+    def __init__(self, text):
+        self.text = text
+        self.length = len(text)
+        self.newlines = text.count('\n')
+        self.height = 0
+
+
+class _Node(object):
+    __slots__ = ('left', 'right', 'length', 'newlines', 'height')
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+        self.length = left.length + right.length
+        self.newlines = left.newlines + right.newlines
+        self.height = max(left.height, right.height) + 1
+
+
+def _build(text):
+    """A balanced tree of LEAFCHARS leaves holding text, or None if it's empty."""
+    if not text:
+        return None
+    leaves = [_Leaf(text[i:i + LEAFCHARS]) for i in xrange(0, len(text), LEAFCHARS)]
+
+    def build(lo, hi):
+        if hi - lo == 1:
+            return leaves[lo]
+        mid = (lo + hi) // 2
+        return _Node(build(lo, mid), build(mid, hi))
+    return build(0, len(leaves))
+
+
+def _join(left, right):
+    """The tree holding left's text then right's, kept height balanced (as an
+    AVL tree is). Nodes are never changed, only made, so any tree that shares
+    them is left as it was."""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.height > right.height + 1:
+        return _balance(left.left, _join(left.right, right))
+    if right.height > left.height + 1:
+        return _balance(_join(left, right.left), right.right)
+    if left.height == right.height == 0 and left.length + right.length <= LEAFCHARS:
+        return _Leaf(left.text + right.text)
+    return _Node(left, right)
+
+
+def _balance(left, right):
+    if left.height > right.height + 1:
+        if left.left.height >= left.right.height:
+            return _Node(left.left, _Node(left.right, right))
+        return _Node(_Node(left.left, left.right.left), _Node(left.right.right, right))
+    if right.height > left.height + 1:
+        if right.right.height >= right.left.height:
+            return _Node(_Node(left, right.left), right.right)
+        return _Node(_Node(left, right.left.left), _Node(right.left.right, right.right))
+    return _Node(left, right)
+
+
+def _split(node, offset):
+    """The trees holding node's text before offset, and from it on."""
+    if node is None or offset <= 0:
+        return None, node
+    if offset >= node.length:
+        return node, None
+    if node.height == 0:
+        return _Leaf(node.text[:offset]), _Leaf(node.text[offset:])
+    if offset <= node.left.length:
+        left, right = _split(node.left, offset)
+        return left, _join(right, node.right)
+    left, right = _split(node.right, offset - node.left.length)
+    return _join(node.left, left), right
+
+
+class Snapshot(object):
+
+    """A text as it was at some point, which never changes, so it can be read
+    from any thread. The text is held in a tree of leaves that counts the
+    characters and newlines under each node, so going between offsets, lines
+    and Tk "line.col" indices takes O(log n), and snapshots of a Document share
+    everything but the path to whatever has been edited since. Offsets are in
+    characters and lines are 0-based, except in indices, which are as Tk has
+    them. The text doesn't have the newline Tk keeps at the end."""
+
+    def __init__(self, root=None):
+        self._root = root
+
+    def __len__(self):
+        return self._root.length if self._root else 0
+
+    @property
+    def lineCount(self):
+        return (self._root.newlines if self._root else 0) + 1
+
+    def lineStart(self, line):
+        """The offset line starts at (len(self) for lines past the last)."""
+        if line <= 0:
+            return 0
+        node = self._root
+        if node is None or line > node.newlines:
+            return len(self)
+        offset = 0
+        while node.height:
+            if line <= node.left.newlines:
+                node = node.left
+            else:
+                line -= node.left.newlines
+                offset += node.left.length
+                node = node.right
+        pos = -1
+        for _ in xrange(line):
+            pos = node.text.index('\n', pos + 1)
+        return offset + pos + 1
+
+    def lineOf(self, offset):
+        """The line offset is on."""
+        node = self._root
+        if node is None:
+            return 0
+        offset = max(0, min(offset, node.length))
+        line = 0
+        while node.height:
+            if offset < node.left.length:
+                node = node.left
+            else:
+                offset -= node.left.length
+                line += node.left.newlines
+                node = node.right
+        return line + node.text.count('\n', 0, offset)
+
+    def index(self, offset):
+        """The Tk index of offset."""
+        line = self.lineOf(offset)
+        return '{0}.{1}'.format(line + 1, offset - self.lineStart(line))
+
+    def offset(self, index):
+        """The offset of a Tk "line.col" index (not "end" or a mark: have Tk
+        resolve those first)."""
+        line, col = index.split('.')
+        line = int(line) - 1
+        if line >= self.lineCount:
+            return len(self)
+        start = self.lineStart(line)
+        end = self.lineStart(line + 1) - 1 if line + 1 < self.lineCount else len(self)
+        return start + min(int(col), end - start)
+
+    def chunks(self, start=0, end=None):
+        """The text from start to end, a leaf's worth at a time, so it can be
+        gone through without having the whole of it in one string."""
+        end = len(self) if end is None else min(end, len(self))
+        if start >= end:
+            return
+        stack = [(self._root, 0)]
+        while stack:
+            node, offset = stack.pop()
+            if offset >= end or offset + node.length <= start:
+                continue
+            if node.height:
+                stack.append((node.right, offset + node.left.length))
+                stack.append((node.left, offset))
+            elif start <= offset and offset + node.length <= end:
+                yield node.text
+            else:
+                yield node.text[max(0, start - offset):end - offset]
+
+    def get(self, start=0, end=None):
+        """The text from start to end."""
+        return u''.join(self.chunks(start, end))
+
+    def lines(self, first, last=None):
+        """The text of lines first..last-1, with their newlines, or through to
+        the end if last is None."""
+        return self.get(self.lineStart(first), None if last is None else self.lineStart(last))
+
+
+class Document(Snapshot):
+
+    """The text of a PygmentsText, kept in step with it by the widget proxy
+    (see PygmentsText.document), so the text can be read without copying it
+    out of Tk. Edits make new nodes rather than changing any, so snapshot() is
+    O(1), and the snapshot can be handed to a worker thread as it is."""
+
+    def __init__(self, text=u''):
+        Snapshot.__init__(self, _build(text))
+
+    def snapshot(self):
+        return Snapshot(self._root)
+
+    def insert(self, offset, text):
+        if text:
+            left, right = _split(self._root, offset)
+            self._root = _join(_join(left, _build(text)), right)
+
+    def delete(self, start, end):
+        if start < end:
+            left, rest = _split(self._root, start)
+            self._root = _join(left, _split(rest, end - start)[1])
+
+    def apply(self, op, first, last, text):
+        """Make an edit as the widget proxy reports it: op is 'insert',
+        'delete' or 'replace', first and last are the indices it was made at,
+        and text is what went in (as for PygmentsText.setEditHook)."""
+        start = self.offset(first)
+        if op != 'insert':
+            self.delete(start, self.offset(last))
+        self.insert(start, text)
+
+    def reset(self, text=u''):
+        self._root = _build(text)
@@ -0,0 +1,595 @@
+#Incremental lexing support for PygmentsText
+__author__ = 'Robert Cope'
+
+import sre_compile
+import sre_parse
+from bisect import bisect_left, bisect_right
+from sre_constants import (ANY, ASSERT, ASSERT_NOT, AT, AT_END_STRING, BRANCH, CATEGORY, CATEGORY_NOT_SPACE,
+                           CATEGORY_SPACE, GROUPREF_EXISTS, IN, LITERAL, MAX_REPEAT, MAXREPEAT, MIN_REPEAT,
+                           NOT_LITERAL, SUBPATTERN)
+from pygments.lexer import RegexLexer, ExtendedRegexLexer
+from pygments.token import Text, Error, _TokenType
+
+ROOTSTATE = ('root',)
+_NEWLINEATEND = [(LITERAL, ord('\n')), (AT, AT_END_STRING)]
+_ANYCHAR = (IN, [(CATEGORY, CATEGORY_SPACE), (CATEGORY, CATEGORY_NOT_SPACE)])
+_probes = {}    # lexer class -> {rexmatch: (crossing probe, crossing probe for a match)}
+
+
+def _function(method):
+    return getattr(method, '__func__', method)
+
+
+def supportsCheckpoints(lexer):
+    """Return True if we can drive the lexer ourselves and observe its state stack at line boundaries.
+    That is true of plain RegexLexers that don't override get_tokens_unprocessed (which is most of them)."""
+
+    if not isinstance(lexer, RegexLexer) or isinstance(lexer, ExtendedRegexLexer):
+        return False
+    return _function(type(lexer).get_tokens_unprocessed) is _function(RegexLexer.get_tokens_unprocessed)
+
+
+def crossingProbe(pattern, matched=False):
+    """For a compiled regex, a match function probe(text, pos, endpos) that matches if trying pattern at
+    pos could get as far as reading what comes after the newline just before endpos, or None if pattern
+    can't match a newline at all. A match that fails like that (say an unterminated /* with a /\\*.*?\\*/
+    rule) can have a different outcome once lines after the one it started on are edited, so those lines
+    aren't a safe place to restart lexing from. So can one that succeeds after backtracking, as
+    "(\\\\|\\"|[^"])*" does on "\\" when there's no other quote after it. The probe is worked out from the
+    parsed regex, so it errs on the side of matching: with a backreference, say, it matches anything.
+
+    With matched True the probe is for a match that succeeded, which can't have run a lazy repeat of
+    single characters at the top of the pattern (as in /\\*.*?\\*/) any further than where it ended, so
+    those don't count. That holds unless an earlier part of the pattern had to be tried again after the
+    repeat got to the end of the text, which no lexer rule we know of does. A greedy match can still have
+    looked a character past where it ended, which we live with."""
+
+    parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    alternatives = _crossings(parsed.data, parsed.pattern, matched)
+    if not alternatives:
+        return None
+    return sre_compile.compile(_branch(parsed.pattern, alternatives), pattern.flags).match
+
+
+def _branch(state, alternatives):
+    return sre_parse.SubPattern(state, [(BRANCH, (None, [sre_parse.SubPattern(state, alternative)
+                                                         for alternative in alternatives]))])
+
+
+def _crossings(items, state, top=False):
+    """The ways through the sequence of parsed regex items that end by consuming a newline (or looking
+    ahead past one), as a list of item lists, each of which ends by asserting it's at the end. top is True
+    for the top of a pattern that matched (see crossingProbe)."""
+
+    alternatives = []
+    for i, (op, av) in enumerate(items):
+        if top and op == SUBPATTERN:
+            crossings = _crossings(av[-1].data, state, top)
+        elif top and op == MIN_REPEAT and av[2].getwidth() == (1, 1):
+            crossings = []
+        else:
+            crossings = _itemCrossings(op, av, state)
+        alternatives.extend(list(items[:i]) + alternative for alternative in crossings)
+    return alternatives
+
+
+def _itemCrossings(op, av, state):
+    if op in (LITERAL, NOT_LITERAL, ANY, IN):
+        if sre_compile.compile(sre_parse.SubPattern(state, [(op, av)])).match('\n'):
+            return [list(_NEWLINEATEND)]
+        return []
+    if op == SUBPATTERN:
+        return _crossings(av[-1].data, state)
+    if op == BRANCH:
+        return [alternative for item in av[1] for alternative in _crossings(item.data, state)]
+    if op in (MAX_REPEAT, MIN_REPEAT):
+        low, high, item = av
+        inner = _crossings(item.data, state)
+        if not inner or high == 0:
+            return []
+        before = (MAX_REPEAT, (0, high if high == MAXREPEAT else high - 1, item))
+        return [[before] + alternative for alternative in inner]
+    if op in (ASSERT, ASSERT_NOT):
+        direction, item = av
+        inner = _crossings(item.data, state) if direction == 1 else []
+        if not inner:
+            return []
+        return [[(ASSERT, (1, _branch(state, inner)))]]
+    if op == GROUPREF_EXISTS:
+        group, yes, no = av
+        return _crossings(yes.data, state) + (_crossings(no.data, state) if no else [])
+    if op == AT:
+        return []
+    # a backreference (or anything else we don't know), which could be anything
+    return [[(MIN_REPEAT, (0, MAXREPEAT, sre_parse.SubPattern(state, [_ANYCHAR])))] + _NEWLINEATEND]
+
+
+def crossingProbes(lexer):
+    """The crossingProbe()s for each rule of a RegexLexer, for a failed attempt and for a match, by the
+    rule's match function."""
+
+    lexerClass = type(lexer)
+    probes = _probes.get(lexerClass)
+    if probes is None:
+        probes = {}
+        for rules in lexer._tokens.itervalues():
+            for rexmatch, action, newState in rules:
+                if rexmatch not in probes:
+                    pattern = rexmatch.__self__
+                    probes[rexmatch] = (crossingProbe(pattern), crossingProbe(pattern, True))
+        _probes[lexerClass] = probes
+    return probes
+
+
+def lineOffsets(text):
+    """The offset of the start of each line in text."""
+    offsets = [0]
+    nextStart = text.find('\n') + 1
+    while nextStart:
+        offsets.append(nextStart)
+        nextStart = text.find('\n', nextStart) + 1
+    return offsets
+
+
+def splitRuns(tokens, offsets, count, classify):
+    """Split the (index, tokentype, value) tokens for count lines up into runs, given the offset in the text at
+    which each line starts (and the one after, if there is one). Returns a tuple of runs for each line, as
+    LineStateLexer.runs keeps them."""
+
+    lineRuns = [[] for i in range(count)]
+    i = 0
+    for index, ttype, value in tokens:
+        if not value:
+            continue
+        while i + 1 < count and offsets[i + 1] <= index:
+            i += 1
+        key = classify(ttype)
+        end = index + len(value)
+        line, col = i, index - offsets[i]
+        while True:
+            if line + 1 < len(offsets) and offsets[line + 1] <= end:
+                endCol = None
+            else:
+                endCol = end - offsets[line]
+            runs = lineRuns[line]
+            if runs and runs[-3] == key and runs[-1] == col:
+                # same key as the last run and it picks up where that left off, so just extend it.
+                runs[-1] = endCol
+            else:
+                runs.extend((key, col, endCol))
+            line, col = line + 1, 0
+            if endCol is not None or line >= count or offsets[line] == end:
+                break
+    return [tuple(runs) for runs in lineRuns]
+
+
+def steps(lexer, text, pos, stack, tokens):
+    """The RegexLexer main loop, but yielding (pos, statestack, reach) after every match so the caller can
+    watch the state at line boundaries. Tokens are appended to the tokens list as they are produced. reach
+    is the start of the furthest line that a rule tried so far could have looked into (see crossingProbe),
+    or 0: the state at a line boundary up to there depends on what comes after it."""
+
+    probes = crossingProbes(lexer)
+    tokendefs = dict((state, [rule + probes[rule[0]] for rule in rules])
+                     for state, rules in lexer._tokens.iteritems())
+    lineStarts = lineOffsets(text)
+    reach = lineEnd = 0
+    statestack = list(stack)
+    statetokens = tokendefs[statestack[-1]]
+    while True:
+        for rexmatch, action, new_state, probe, matchProbe in statetokens:
+            m = rexmatch(text, pos)
+            if m:
+                end = m.end()
+                if matchProbe is not None:
+                    if end >= lineEnd:
+                        lineEnd = text.find('\n', end) + 1 or len(text) + 1
+                    if reach >= lineEnd or matchProbe(text, pos, lineEnd):
+                        reach = _reach(matchProbe, text, pos, end, lineStarts, reach)
+                if action is not None:
+                    if type(action) is _TokenType:
+                        tokens.append((pos, action, m.group()))
+                    else:
+                        tokens.extend(action(lexer, m))
+                pos = end
+                if new_state is not None:
+                    if isinstance(new_state, tuple):
+                        for state in new_state:
+                            if state == '#pop':
+                                if len(statestack) > 1:
+                                    statestack.pop()
+                            elif state == '#push':
+                                statestack.append(statestack[-1])
+                            else:
+                                statestack.append(state)
+                    elif isinstance(new_state, int):
+                        if abs(new_state) >= len(statestack):
+                            del statestack[1:]
+                        else:
+                            del statestack[new_state:]
+                    elif new_state == '#push':
+                        statestack.append(statestack[-1])
+                    statetokens = tokendefs[statestack[-1]]
+                break
+            if probe is not None:
+                if pos >= lineEnd:
+                    lineEnd = text.find('\n', pos) + 1 or len(text) + 1
+                # most rules can't get past the end of the line, which is quick to rule out
+                if reach >= lineEnd or probe(text, pos, lineEnd):
+                    reach = _reach(probe, text, pos, pos, lineStarts, reach)
+        else:
+            if pos >= len(text):
+                return
+            if text[pos] == '\n':
+                # at EOL, reset state to "root"
+                statestack = ['root']
+                statetokens = tokendefs['root']
+                tokens.append((pos, Text, u'\n'))
+            else:
+                tokens.append((pos, Error, text[pos]))
+            pos += 1
+        yield pos, statestack, reach
+
+
+def _reach(probe, text, pos, end, lineStarts, reach):
+    """How far a rule with the given crossing probe tried at pos could have looked, past the line that end
+    (where it matched up to, or pos if it didn't match) is on: the start of the last line it could have got
+    to, if that's past reach, or else reach."""
+
+    eol = text.find('\n', end)
+    if eol == -1:
+        return reach
+    low = bisect_left(lineStarts, eol + 1) if eol >= reach else bisect_right(lineStarts, reach)
+    if low == len(lineStarts) or not probe(text, pos, lineStarts[low]):
+        return reach
+    # if it could get past a newline, it could get past every one before it
+    high = len(lineStarts) - 1
+    while low < high:
+        middle = (low + high + 1) // 2
+        if probe(text, pos, lineStarts[middle]):
+            low = middle
+        else:
+            high = middle - 1
+    return lineStarts[low]
+
+
+class LineStateLexer(object):
+
+    """Keeps the lexer state stack at the start of every line of a document, so that after an edit
+    we can re-lex from the nearest line with a known state and stop as soon as the state at a line
+    boundary past the edit matches what it was before. Line numbers here are 0-based.
+
+    states[i] is the state stack (a tuple) at the start of line i, or None if it isn't known, either
+    because the line hasn't been lexed since it was edited, because a single token spans the line
+    boundary, or because a rule that failed to match before it could have looked past it (see
+    crossingProbe), so that editing the line could change what came before. dirty is a sorted list of
+    [first, last] line ranges that still need re-lexing. Lexers we can't drive ourselves (see
+    supportsCheckpoints) have no states, so the whole document is re-lexed whenever anything is dirty.
+
+    runs[i] is what the highlighting of line i was last set to, as a flattened tuple of
+    (key, startCol, endCol) runs, where key is classify(tokentype) (a tag name, for PygmentsText)
+    and endCol is None for a run that takes in the end of the line. It is None for lines that have
+    been edited since, which could have picked up any of the keys in stale. apply() compares
+    against these, and only hands back the runs that actually changed.
+
+    The lexing itself isn't done here: plan() and peek() hand back a LexJob with a snapshot of the
+    text, to be run anywhere (a worker thread, for PygmentsText), and apply() and finish() take its
+    results in. version goes up with every edit, and results for an older version are dropped.
+
+    Text is only fetched WINDOWLINES past the point we expect to stop. A job that runs out of it
+    before the state settles hands back what it has up to the last line it could restart from, and
+    the rest is picked up from there."""
+
+    WINDOWLINES = 1000
+    PEEKLINES = 100
+
+    def __init__(self, lexer, lineCount=1, classify=None):
+        self.states = []
+        self.dirty = []
+        self.runs = []
+        self.stale = set()
+        self.version = 0
+        self.classify = classify if classify else (lambda ttype: ttype)
+        self.setLexer(lexer, lineCount)
+
+    def setLexer(self, lexer, lineCount=None):
+        """Switch lexers. All checkpoints are thrown away and every line is marked dirty."""
+        self.lexer = lexer
+        self.checkpoints = supportsCheckpoints(lexer)
+        self.reset(self.lineCount if lineCount is None else lineCount)
+
+    def reset(self, lineCount):
+        """Forget every checkpoint, and mark all of the lines dirty."""
+        lineCount = max(lineCount, 1)
+        self.version += 1
+        self.states = [ROOTSTATE] + [None] * (lineCount - 1)
+        self.dirty = [[0, lineCount - 1]]
+        for runs in self.runs:
+            if runs:
+                self.stale.update(runs[0::3])
+        self.runs = [None] * lineCount
+        self._stuck = None
+
+    @property
+    def lineCount(self):
+        return len(self.states)
+
+    def isDirty(self, line):
+        for first, last in self.dirty:
+            if first <= line <= last:
+                return True
+        return False
+
+    def markDirty(self, first, last):
+        """Add lines first..last to the dirty ranges, merging with any they touch."""
+        merged = [first, last]
+        dirty = []
+        for interval in self.dirty:
+            if interval[1] < merged[0] - 1 or interval[0] > merged[1] + 1:
+                dirty.append(interval)
+            else:
+                merged = [min(merged[0], interval[0]), max(merged[1], interval[1])]
+        dirty.append(merged)
+        dirty.sort()
+        self.dirty = dirty
+
+    def markClean(self, first, last):
+        """Take lines first..last out of the dirty ranges."""
+        dirty = []
+        for dirtyFirst, dirtyLast in self.dirty:
+            if dirtyFirst < first:
+                dirty.append([dirtyFirst, min(dirtyLast, first - 1)])
+            if dirtyLast > last:
+                dirty.append([max(dirtyFirst, last + 1), dirtyLast])
+        self.dirty = dirty
+
+    def noteEdit(self, first, oldLast, delta):
+        """Record that lines first..oldLast (inclusive) have been replaced by lines first..oldLast+delta.
+        The state at the start of the first line is still good, since nothing before it changed. States after
+        the edit are kept (shifted) so the next re-lex has something to compare against."""
+
+        self.version += 1
+        newLast = oldLast + delta
+        self.states[first + 1:oldLast + 1] = [None] * (newLast - first)
+        for runs in self.runs[first:oldLast + 1]:
+            if runs:
+                self.stale.update(runs[0::3])
+        self.runs[first:oldLast + 1] = [None] * (newLast - first + 1)
+
+        def shift(line):
+            return line + delta if line > oldLast else min(line, newLast)
+
+        self.dirty = [[shift(dirtyFirst), shift(dirtyLast)] for dirtyFirst, dirtyLast in self.dirty]
+        self.markDirty(first, newLast)
+
+    def plan(self, getText, limit=None):
+        """Plan re-lexing the first dirty range, as a LexJob. getText(first, last) should return the text of
+        lines first..last-1, with last=None meaning through to the end of the document.
+
+        limit is roughly how many lines to take on (the job carries on WINDOWLINES past it, if the state
+        hasn't settled by then). Lexers without checkpoints have nowhere to restart from but the top, so
+        they get the whole document re-lexed whatever the limit. Returns None if nothing is dirty."""
+
+        if not self.dirty:
+            return None
+        if not self.checkpoints:
+            return LexJob(self, 0, self.lineCount - 1, getText(0, None), 0, None)
+        dirtyFirst, dirtyLast = self.dirty[0]
+        dirtyLast = min(dirtyLast, self.lineCount - 1)
+
+        first = dirtyFirst
+        while self.states[first] is None:
+            first -= 1
+        windowEnd = (dirtyLast if limit is None else min(dirtyLast, first + limit)) + self.WINDOWLINES
+        if windowEnd >= self.lineCount or first == self._stuck:
+            # A single token ran past the end of the last window from here, and will have been cut short.
+            # Go with the rest of the document this time.
+            windowEnd = None
+        # Include the line before as context, so look-behind assertions see the same text they would
+        # if the whole document were lexed.
+        context = 1 if first else 0
+        text = getText(first - context, windowEnd)
+        pos = text.find('\n') + 1 if context else 0
+        lastLine = self.lineCount - 1 if windowEnd is None else windowEnd - 1
+        return LexJob(self, first, lastLine, text, pos, self.states[first], partial=windowEnd is not None)
+
+    def peek(self, getText, first, last):
+        """Plan lexing lines first..last without recording any states, for a quick look at lines we haven't
+        got to yet. We start from a known state if there is one in the PEEKLINES before first, otherwise we
+        guess that first starts in the root state. Everything peeked at is marked dirty, so the guesses get
+        put right by a re-lex later."""
+
+        if not self.checkpoints:
+            self.markDirty(first, last)
+            return LexJob(self, first, last, getText(first, last + 1), 0, None, peek=True)
+        start = first
+        while self.states[start] is None and start > 0 and first - start < self.PEEKLINES:
+            start -= 1
+        self.markDirty(start, last)
+        stack = self.states[start] or ROOTSTATE
+        return LexJob(self, start, last, getText(start, last + 1), 0, stack, peek=True)
+
+    def apply(self, job, batch):
+        """Take in a batch of results from job.batches(). Returns (removed, added): lists of
+        (key, startLine, startCol, endLine, endCol) ranges whose highlighting has gone, and that have been
+        newly highlighted, or None if the document has been edited since the job was planned."""
+
+        if job.version != self.version:
+            return None
+        first, lineRuns, states = batch
+        if job.peek:
+            # Only a guess, which is no use for lines that have been re-lexed properly since.
+            lineRuns = [runs if self.isDirty(line) else self.runs[line]
+                        for line, runs in enumerate(lineRuns, first)]
+            return self._update(first, lineRuns)
+        following = first + len(lineRuns)
+        if states:
+            if following < self.lineCount and self.states[following] != states[-1]:
+                # The state after the batch changed, so the lines following it need re-lexing too, even if
+                # the rest of the job never gets applied.
+                self.markDirty(following, following)
+            self.states[first + 1:first + 1 + len(states)] = states
+        self.markClean(first, following - 1)
+        return self._update(first, lineRuns)
+
+    def finish(self, job):
+        """Called once job has handed back all its results. If it ran out of text before the state settled,
+        the line it got to still needs re-lexing."""
+
+        if job.version != self.version or job.resume is None:
+            return
+        self.markDirty(job.resume, job.resume)
+        self._stuck = job.resume if job.resume == job.first else None
+
+    def _update(self, first, lineRuns):
+        """Store lineRuns as the runs for lines first.., and work out what changed."""
+
+
+        removed, added = [], []
+        unknownEnd, unknownRanges = None, []
+        for line, runs in enumerate(lineRuns, first):
+            old = self.runs[line]
+            if old == runs:
+                continue
+            self.runs[line] = runs
+            if old is None:
+                # We don't know what this line picked up, so clear out anything it might have. Runs of
+                # such lines (a whole new document, say) are cleared out in one go.
+                if unknownEnd == line:
+                    for ranges in unknownRanges:
+                        ranges[3] = line + 1
+                else:
+                    unknownRanges = [[key, line, 0, line + 1, 0] for key in self.stale]
+                    removed.extend(unknownRanges)
+                unknownEnd = line + 1
+                oldRuns = set()
+            else:
+                oldRuns = set(zip(old[0::3], old[1::3], old[2::3]))
+            newRuns = set(zip(runs[0::3], runs[1::3], runs[2::3]))
+            for key, startCol, endCol in oldRuns - newRuns:
+                removed.append(self._range(key, line, startCol, endCol))
+            for key, startCol, endCol in newRuns - oldRuns:
+                added.append(self._range(key, line, startCol, endCol))
+        if not self.dirty:
+            self.stale = set()
+        return removed, added
+
+    @staticmethod
+    def _range(key, line, startCol, endCol):
+        if endCol is None:
+            return key, line, startCol, line + 1, 0
+        return key, line, startCol, line, endCol
+
+
+class LexJob(object):
+
+    """A piece of lexing planned by LineStateLexer.plan() or peek(), with a snapshot of everything it
+    needs, so that batches() can be run in another thread (see tokenizer) while the document carries
+    on changing. The results go back in with LineStateLexer.apply() and finish().
+
+    text holds lines first..lastLine, with first starting at pos (after a line of context). stack is
+    the state at the start of first, or None for a lexer we can't checkpoint, which is given the whole
+    document. A re-lex stops as soon as the state at a line boundary past the dirty lines is one we
+    could restart from and matches oldStates (the states of lines first.. as they were when the job
+    was planned). If the text is partial (stops short of the end of the document) and runs out first,
+    anything after the last line boundary we could restart from could have been cut short, so it's
+    left out, and resume is set to the line to carry on from. cancelled can be set at any time to
+    have the job dropped."""
+
+    BATCHLINES = 500    # lines of results handed back at a time
+
+    def __init__(self, lineStates, first, lastLine, text, pos, stack, partial=False, peek=False):
+        self.lexer = lineStates.lexer
+        self.classify = lineStates.classify
+        self.version = lineStates.version
+        self.first = first
+        self.lastLine = lastLine
+        self.text = text
+        self.pos = pos
+        self.stack = stack
+        self.partial = partial
+        self.peek = peek
+        if stack is not None and not peek:
+            self.oldStates = lineStates.states[first:lastLine + 1]
+            self.dirty = [list(interval) for interval in lineStates.dirty]
+        else:
+            self.oldStates, self.dirty = (), []
+        self.resume = None
+        self.cancelled = False
+
+    def batches(self):
+        """Lex the text, handing back (first, lineRuns, states) BATCHLINES at a time: the runs for lines
+        first.., and (with checkpoints) the state at the start of the line after each one, or None where
+        a token runs over the line boundary."""
+
+        if self.stack is None:
+            for batch in self._wholeBatches():
+                yield batch
+            return
+        text, first, lastLine = self.text, self.first, self.lastLine
+        dirty = list(self.dirty)
+        dirtyLast = dirty.pop(0)[1] if dirty else lastLine
+
+        tokens, offsets, states = [], [self.pos], []
+        batchFirst = line = first
+        clean = None    # how far the batch had got at the last clean line boundary
+        nextStart = text.find('\n', self.pos) + 1
+        for pos, statestack, reach in steps(self.lexer, text, self.pos, self.stack, tokens):
+            while nextStart and nextStart < pos and line < lastLine:
+                # A token ran over this line boundary, so there is no state we could restart from here.
+                line += 1
+                states.append(None)
+                offsets.append(nextStart)
+                nextStart = text.find('\n', nextStart) + 1
+            if nextStart and nextStart == pos and line < lastLine:
+                line += 1
+                # no good to restart from if a rule that failed before here could have looked past it
+                state = tuple(statestack) if reach < nextStart else None
+                states.append(state)
+                offsets.append(nextStart)
+                nextStart = text.find('\n', nextStart) + 1
+                if (state is not None and line > dirtyLast and line - first < len(self.oldStates) and
+                        self.oldStates[line - first] == state):
+                    yield self._batch(batchFirst, tokens, offsets, states, line - batchFirst)
+                    return
+                while dirty and dirty[0][0] <= line:
+                    dirtyLast = max(dirtyLast, dirty.pop(0)[1])
+                if line - batchFirst >= self.BATCHLINES:
+                    yield self._batch(batchFirst, tokens, offsets, states, line - batchFirst)
+                    batchFirst, clean = line, None
+                    del tokens[:], offsets[:-1], states[:]
+                elif state is not None:
+                    clean = (line, len(tokens), len(offsets), len(states))
+        if not self.partial:
+            yield self._batch(batchFirst, tokens, offsets, states, line - batchFirst + 1)
+        elif clean is None:
+            self.resume = batchFirst
+        else:
+            line, tokenCount, offsetCount, stateCount = clean
+            yield self._batch(batchFirst, tokens[:tokenCount], offsets[:offsetCount], states[:stateCount],
+                              line - batchFirst)
+            self.resume = line
+
+    def _wholeBatches(self):
+        """Lex the text in one go, for a lexer we can't checkpoint, handing back BATCHLINES lines at a
+        time as batches() does. A token that runs over into the next batch is split between them."""
+
+        offsets = lineOffsets(self.text)
+        count = self.lastLine - self.first + 1
+        tokens = []
+        batchFirst, batchEnd = 0, min(self.BATCHLINES, count)
+        for index, ttype, value in self.lexer.get_tokens_unprocessed(self.text):
+            while batchEnd < count and index + len(value) > offsets[batchEnd]:
+                if index < offsets[batchEnd]:
+                    cut = offsets[batchEnd] - index
+                    tokens.append((index, ttype, value[:cut]))
+                    index, value = offsets[batchEnd], value[cut:]
+                yield (self.first + batchFirst,
+                       splitRuns(tokens, offsets[batchFirst:batchEnd + 1], batchEnd - batchFirst, self.classify), None)
+                batchFirst, batchEnd = batchEnd, min(batchEnd + self.BATCHLINES, count)
+                del tokens[:]
+            tokens.append((index, ttype, value))
+        yield self.first + batchFirst, splitRuns(tokens, offsets[batchFirst:count], count - batchFirst, self.classify), None
+
+    def _batch(self, first, tokens, offsets, states, count):
+        return first, splitRuns(tokens, offsets, count, self.classify), list(states)
@@ -1,180 +1,466 @@
 from Tkinter import *
-import tkFont
-import string
-import pygments
+import contextlib
+import time
+from pygments_tk_text import linestate
+from pygments_tk_text import changetracker
+from pygments_tk_text import document
+from pygments_tk_text import scheduler as highlightscheduler
+from pygments_tk_text import undohistory
 
 
 class PygmentsText(Text):
     
     """Class that uses the pygments syntax-based highlighter to color-code text
     displayed in a Tk Text widget. Note that this isn't the same as a code
-    pretty-printer. It just color-codes. It is also heuristic. It's not easy, in
-    general, to determine how much of a text has to be reformatted given a
-    change in it. We make a guess (1-2 lines) that should be good for a wide
-    variety of highlighted langauges and use cases. """
+    pretty-printer. It just color-codes. To work out how much of a text has to
+    be reformatted given a change in it, we keep the lexer state at the start of
+    every line (see linestate.LineStateLexer) and re-lex from the edit until the
+    state matches up with what it was before. None of the lexing is done on the
+    Tk thread: it is handed to the tokenizer's worker thread as jobs, with a
+    snapshot of the text they need, by a HighlightScheduler (shared with other
+    widgets, if one is given), which also puts the results on as they come back.
+    Results for a version of the document that has since been edited are
+    dropped. Whatever is on screen gets a quick first look before the rest, so
+    it isn't left as plain text. Edits don't
+    re-highlight straight away: they wait for typing to pause for QUIETTIME ms
+    (or DEADLINE ms at most), and then everything edited since goes in one pass.
 
+    Rather than one <<Change>> for everything, the widget generates:
+        <<ContentChanged>>  after an insert/delete, with data "first last delta":
+                            lines first..last (1-based) were replaced, and the
+                            number of lines went up by delta.
+        <<CursorMoved>>     when the insert mark moves, with its new index.
+        <<ViewChanged>>     when the widget scrolls, with its yview and xview.
+    Tkinter's bind() doesn't pass the data on; use bindData() for that. For
+    a record of the edits themselves, see setEditHook().
 
-    def __init__(self, root, lexer, formatter, parent = None, **kwargs):
+    Undo and redo are ours rather than Tk's (Tk's -undo is always off): the
+    'undo' option and the edit_* methods work as usual, but go to an
+    undohistory.UndoHistory, which only ever sees the user's edits, merges
+    runs of typing into one step, and holds UNDOBYTES at most. Use undoGroup()
+    to make a bulk edit one step.
+
+    self.document is a copy of the text (a document.Document) that the proxy
+    keeps in step with every edit. Read the text from that, or a snapshot() of
+    it, rather than get()ting it out of Tk, which copies the lot every time. """
+
+    JOBLINES = 5000     # roughly how many lines we hand the tokenizer to re-lex in one job
+    VIEWLINES = 100     # how many lines to assume are on screen before we've been mapped
+    QUIETTIME = 30      # ms without an edit before we re-highlight
+    DEADLINE = 100      # ms at most we put off re-highlighting while edits keep coming
+    UNDOBYTES = 32 * 1024 * 1024    # how much undo history to keep, roughly
+
+
+    def __init__(self, root, lexer, formatter, parent = None, scheduler = None, **kwargs):
         self.root = root
         self.parent = parent if parent else root
-        Text.__init__(self, self.parent, **kwargs)
+        undo = kwargs.pop('undo', False)
+        kwargs.pop('maxundo', None)
+        Text.__init__(self, self.parent, undo=False, **kwargs)
         self.tk.eval('''
-            proc widget_proxy {widget widget_command args} {
+            proc pygtext_proxy {widget widget_command edit_command history_command args} {
+
+                # undo history commands go to our own history, rather than Tk's
+                set op [lindex $args 0]
+                if {$op eq "edit" && [lindex $args 1] in {undo redo separator reset canundo canredo}} {
+                    return [$history_command [lindex $args 1]]
+                }
+
+                # a delete of several ranges goes through again a range at a time,
+                # so each is an edit of its own: sorted, with overlaps merged and
+                # the last first, which is how Tk deletes them
+                if {$op eq "delete" && [llength $args] > 3} {
+                    set ranges {}
+                    foreach {i j} [lrange $args 1 end] {
+                        set i [$widget_command index $i]
+                        set j [$widget_command index [expr {$j eq "" ? "$i +1c" : $j}]]
+                        if {[$widget_command compare $i < $j]} {
+                            lappend ranges [concat [split $i .] [list $i $j]]
+                        }
+                    }
+                    set ranges [lsort -integer -index 0 [lsort -integer -index 1 $ranges]]
+                    set merged {}
+                    foreach range $ranges {
+                        lassign $range line col i j
+                        if {[llength $merged] && [$widget_command compare $i <= [lindex $merged end 1]]} {
+                            if {[$widget_command compare $j > [lindex $merged end 1]]} {
+                                lset merged end 1 $j
+                            }
+                        } else {
+                            lappend merged [list $i $j]
+                        }
+                    }
+                    foreach range [lreverse $merged] {
+                        $widget delete {*}$range
+                    }
+                    return
+                }
+
+                # work out what the command could change, and for edits, which
+                # lines are affected, before we make it
+                # (a disabled widget ignores them, so then they aren't edits)
+                set edit [expr {$op in {insert replace delete} && [$widget_command cget -state] ne "disabled"}]
+                set cursor [expr {$edit || [lrange $args 0 2] eq {mark set insert}}]
+                set view [expr {$op eq "see" || ($op in {xview yview} && [llength $args] > 1)}]
+                if {$cursor} {
+                    set insertBefore [$widget_command index insert]
+                }
+                if {$view} {
+                    set viewBefore [concat [$widget_command yview] [$widget_command xview]]
+                }
+                if {$edit} {
+                    set first [$widget_command index [lindex $args 1]]
+                    if {[$widget_command compare $first == end]} {
+                        set first [$widget_command index "end -1c"]
+                    }
+                    if {$op eq "insert"} {
+                        set last $first
+                    } elseif {$op eq "replace"} {
+                        set last [$widget_command index [lindex $args 2]]
+                    } elseif {[llength $args] % 2} {
+                        set last [$widget_command index [lindex $args end]]
+                    } else {
+                        set last [$widget_command index "[lindex $args end] +1c"]
+                    }
+                    if {[$widget_command compare $last == end]} {
+                        set last [$widget_command index "end -1c"]
+                    }
+                    set before [$widget_command index end]
+                }
 
                 # call the real tk widget command with the real args
                 set result [uplevel [linsert $args 0 $widget_command]]
 
-                # generate the event for certain types of commands
-                if {([lindex $args 0] in {insert replace delete}) ||
-                    ([lrange $args 0 2] == {mark set insert}) ||
-                    ([lrange $args 0 1] == {xview moveto}) ||
-                    ([lrange $args 0 1] == {xview scroll}) ||
-                    ([lrange $args 0 1] == {yview moveto}) ||
-                    ([lrange $args 0 1] == {yview scroll})} {
-
-                    event generate  $widget <<Change>> -when tail
+                # tell the document, the undo history and the line state tracker
+                # about the edit, and generate the events for whatever actually changed
+                if {$edit} {
+                    set text ""
+                    if {$op ne "delete"} {
+                        foreach {chars tags} [lrange $args [expr {$op eq "insert" ? 2 : 3}] end] {
+                            append text $chars
+                        }
+                    }
+                    set after [$widget_command index end]
+                    set delta [expr {int($after) - int($before)}]
+                    set range [list [lindex [split $first .] 0] [lindex [split $last .] 0] $delta]
+                    $edit_command $op $first $last $text {*}$range
+                    event generate $widget <<ContentChanged>> -when tail -data $range
+                }
+                if {$cursor} {
+                    set insertAfter [$widget_command index insert]
+                    if {$insertAfter ne $insertBefore} {
+                        event generate $widget <<CursorMoved>> -when tail -data $insertAfter
+                    }
+                }
+                if {$view} {
+                    set viewAfter [concat [$widget_command yview] [$widget_command xview]]
+                    if {$viewAfter ne $viewBefore} {
+                        event generate $widget <<ViewChanged>> -when tail -data $viewAfter
+                    }
                 }
 
                 # return the result from the real widget command
                 return $result
             }
             ''')
-        self.tk.eval('''
-            rename {widget} _{widget}
-            interp alias {{}} ::{widget} {{}} widget_proxy {widget} _{widget}
-        '''.format(widget=str(self)))
         self.lexer     = lexer      # from pygments.lexers
         self.formatter = formatter  # a TkFormatter
+        self.lineStates = linestate.LineStateLexer(lexer, classify=formatter.tagNameFor)
+        self._highlightJob = None
+        self._pendingSince = None
+        self._editHook = None
+        self.document = document.Document()
+        self.history = undohistory.UndoHistory(self.UNDOBYTES)
+        self.history.enabled = undo
+        self.peekedView = None      # the lines on screen when we last had a look at them
+        self.scheduler = scheduler if scheduler else highlightscheduler.HighlightScheduler(self)
+        self.scheduler.add(self)
+        self.changes = changetracker.ChangeTracker()
+        self._replaying = False
+        self.tk.eval('''
+            rename {widget} _{widget}
+            interp alias {{}} ::{widget} {{}} pygtext_proxy {widget} _{widget} {edit} {history}
+        '''.format(widget=str(self), edit=self.register(self._lineEdit),
+                   history=self.register(self._historyEdit)))
 
         self.config_tags()
-        self.bind('<KeyRelease>', self.key_press)
         self.bind('<Control-l>',  lambda *args: self.reformatEverything() )
 
     
     def insertFormatted(self, location, text, add_sep=False):
-        """Similar to self.insert(), but instead of plain text, uses pygments to
-        provide a set of formatting tags. The formatter should return stream of
-        tagged lines of the format tagName:payload_string\n, which this class then
-        inserts in tagged way. Note that if the given text is smaller than a
-        "complete syntactic unit" of the language being syntax-highlighted, insertFormatted()
-        probably won't result in correct syntax highlighting. Use self.reformatRange()
-        or self.reformatEverything() to reformat a larger enclosing range if
-        you're making micro-inserts."""
-
-        #RPC: Added this to stop the formatter from replacing liternal '\n'.
+        """Similar to self.insert(), but the text is highlighted in context. It
+        goes in plain, and the edit is re-lexed by the tokenizer like any other,
+        so nothing is lexed here (call self.highlightDirty() to have that started
+        without waiting for the edits to die down)."""
+
         if add_sep:
             self.edit_separator()
-        text = string.replace(text, r'\n', chr(1))
-        textTagged = pygments.highlight(text, self.lexer, self.formatter)
-
-        insertList = []
-        #inQuotes = False
-        for chunk in textTagged.splitlines():
-            # split tagged lines into component parts
-            tagEnd = string.index(chunk, ':')
-            tagName, stringPart = chunk[:tagEnd], chunk[tagEnd+1:]
-
-            # clean up / unquote / reformat data as necessary
-            #num = stringPart.count('"') + stringPart.count("'")
-
-            stringPart = string.replace(stringPart, r'\n', "\n")
-            #Convert literal '\n' back.
-            stringPart = string.replace(stringPart, chr(1), r'\n')
-            #print stringPart
-
-            # add to the insert list
-            insertList.append(stringPart)
-            insertList.append(tagName)
-
-        # pygments.highlight() can send back extra linefeed markers at the end.
-        # So if we didn't mean to end with a return, check for these, and if
-        # they're just linefeeds, truncate them
-        if not text.endswith("\n"):
-            penultimate = insertList[-2]
-            if (penultimate.endswith("\n")):
-                if penultimate == "\n":
-                    insertList = insertList[:-2]
-                else:
-                    insertList[-2] = insertList[-2][:-1]
-        
-        # if something to insert, do it (actual typed returns are the missing
-        # else case here; net-net they don't get formatted through pygments)
-        #print insertList
-        if insertList:
-            self.insert(location, *insertList)
+        self.insert(location, text)
 
 
     def config_tags(self):
-        """Get style defintions from the friendly local pygments formatter, and
-        instantiate them as Tk.Text tag definitions."""
-        
-        # Discover what 'basefont' currently in use
-        curFontName = self.cget('font')
-        curFont = tkFont.nametofont(curFontName)
-        curFontSpecs = curFont.actual()
-        basefont = ' '.join([ str(curFontSpecs[k]) for k in 'family size'.split() ])
-        
-        # Get tag definitions from our pygments formatter
-        styledict = self.formatter.get_style_defs()
-        
-        # Define our tags accordingly
-        for tagName, attTupleList in styledict.iteritems():
-            # print "tagconfig:", tagName, tkatts
-            for attTuple in attTupleList:
-                (attName, attValue) = attTuple
-                if attName == 'font':
-                    f = basefont.rsplit(' ', 1)
-                    f = (f[0], f[1], attValue)
-                    self.tag_configure(tagName, font = f)
-                    #self.tag_configure(tagName, font = basefont + ' ' + attValue)
+        """Instantiate the formatter's style definitions as Tk.Text tag
+        definitions. The formatter is shared between widgets, and does this
+        with fonts and a Tcl proc shared between them too (see
+        TkFormatter.configureTags)."""
+
+        self.formatter.configureTags(self)
+
+
+    def highlightDirty(self):
+        """Start re-lexing whatever lines have been edited since the last pass
+        straight away, rather than when the scheduler gets round to it."""
+
+        self._cancelHighlight()
+        self._highlight()
+
+    def _highlight(self):
+        self._highlightJob = None
+        self._pendingSince = None
+        self.scheduler.wake()
+
+    @property
+    def highlightPending(self):
+        """True while highlighting is being put off for edits to die down."""
+        return self._highlightJob is not None
+
+    def peekJob(self):
+        """A job for a quick look at the dirty lines on screen, or None if there
+        aren't any, or we've already had a look at them (see LineStateLexer.peek)."""
+
+        top, bottom = self._viewLines()
+        if (top, bottom) == self.peekedView:
+            return None
+        self.peekedView = (top, bottom)
+        for line in xrange(top, bottom + 1):
+            if self.lineStates.isDirty(line):
+                return self.lineStates.peek(self._getLines, line, bottom)
+        return None
+
+    def relexJob(self):
+        """A job for the next piece of re-lexing (see LineStateLexer.plan), or
+        None if nothing is dirty."""
+
+        return self.lineStates.plan(self._getLines, self.JOBLINES)
+
+    def takeResult(self, job, kind, result):
+        """Take in something the tokenizer handed back for one of our jobs: a
+        'batch' of results, 'done', or an 'error' to raise."""
+
+        if kind == 'batch':
+            changes = self.lineStates.apply(job, result)
+            if changes:
+                self._applyChanges(*changes)
+        elif kind == 'done':
+            self.lineStates.finish(job)
+        else:
+            raise result[0], result[1], result[2]
+
+    def _scheduleHighlight(self):
+        """Called on every edit. Put highlighting off until there have been no
+        edits for QUIETTIME ms, but not more than DEADLINE ms after the first
+        edit it's waiting on, so holding a key down still gets highlighted. Any
+        job already waiting (or background pass under way) is superseded: the
+        dirty lines it was going to do are still in self.lineStates, merged with
+        the new ones, and the new job does the lot."""
+
+        now = time.time()
+        if self._pendingSince is None:
+            self._pendingSince = now
+        remaining = self.DEADLINE - int((now - self._pendingSince) * 1000)
+        self._cancelHighlight()
+        self._highlightJob = self.after(max(0, min(self.QUIETTIME, remaining)), self._highlight)
+
+    def _cancelHighlight(self):
+        if self._highlightJob is not None:
+            self.after_cancel(self._highlightJob)
+            self._highlightJob = None
+
+    def _viewLines(self):
+        """The first and last (0-based) lines on screen."""
+
+        top = int(self.index("@0,0").split('.')[0]) - 1
+        height = self.winfo_height()
+        if height > 1:
+            bottom = int(self.index("@0,{0}".format(height)).split('.')[0]) - 1
+        else:
+            bottom = top + self.VIEWLINES
+        return top, min(bottom, self.lineStates.lineCount - 1)
+
+    def _applyChanges(self, removed, added):
+        """Take off the removed highlighting and put on the added, given as
+        (tagName, startLine, startCol, endLine, endCol) ranges. Only tags change;
+        the text, marks, selection and undo stack are left alone."""
+
+        for command, changes in (('remove', removed), ('add', added)):
+            ranges = {}
+            for tagName, startLine, startCol, endLine, endCol in changes:
+                startIndex = "{0}.{1}".format(startLine + 1, startCol)
+                endIndex = "{0}.{1}".format(endLine + 1, endCol)
+                indices = ranges.setdefault(tagName, [])
+                if indices and indices[-1] == startIndex:
+                    # picks up where the last range for this tag left off, so just extend it.
+                    indices[-1] = endIndex
                 else:
-                    attSetter = dict([attTuple])
-                    self.tag_configure(tagName, **attSetter)
-
-
-    def key_press(self, key):
-        """On key press (key release, acctually, so the character has already
-        been inserted), reformat the effected area. The laziest, lowest-performance, and
-        yet most correct approach would be to reformat
-        the entire text contents. But that might be a bit slow / brute force. So we
-        localize the reformatting, usually to a single line, with a fall back to
-        several lines. If this doesn't catch it, the user can always type a key
-        (default Control-L) bound to self.reformatEverything()."""
-
-        #TODO (RPC): Fix the way separators are added for a consistent and smooth undo/redo operation.
-        self.edit_separator()
-        savePosn = self.index(INSERT)
-        linenum = int(savePosn.split('.')[0])
-        startline = linenum
-        extraline = None
-
-        #RPC: Had to change this to make newlines work correctly when entered at the beginning of the line.
-        if key.char in {"\n", "\r"}:
-            # breaking a line, so reformat this line and the one before
-            extraline = linenum - 1 if linenum > 1 else 1
-
-        self.reformatRange("{0}.0".format(startline), "{0}.end".format(linenum))
-            
-        self.see(savePosn)
-        self.mark_set(INSERT, savePosn)
-        if extraline:
-            self.reformatRange("{0}.0".format(extraline), "{0}.end".format(extraline))
-    
+                    indices.extend((startIndex, endIndex))
+            for tagName, indices in ranges.iteritems():
+                self.tk.call(self._w, 'tag', command, tagName, *indices)
+
+    def _getLines(self, first, last):
+        """Get the text of lines first..last-1 (0-based), or through to the end if last is None
+        (with the newline Tk has at the end, as get() would)."""
+
+        if last is None:
+            return self.document.lines(first) + '\n'
+        return self.document.lines(first, last)
+
+    def _lineEdit(self, op, first, last, text, firstLine, lastLine, delta):
+        """Called by the widget proxy after every insert/delete, with the edit
+        (as for setEditHook), the (1-based) first and last lines it replaced,
+        and the change in the number of lines."""
+
+        recording = self.history.enabled and not self._replaying
+        if recording and op != 'insert':
+            # what the edit took out, from the document before it's told
+            old = self.document.get(self.document.offset(first), self.document.offset(last))
+        else:
+            old = ''
+        self.document.apply(op, first, last, text)
+        if recording and self.history.record(op, first, last, text, old):
+            self.changes.separator()
+        self.lineStates.noteEdit(int(firstLine) - 1, int(lastLine) - 1, int(delta))
+        self.scheduler.edited(self)
+        self.changes.edited(self._replaying)
+        self._scheduleHighlight()
+        if self._editHook is not None:
+            self._editHook(op, first, last, text)
+
+    def _historyEdit(self, command):
+        """Carry out 'edit undo|redo|separator|reset|canundo|canredo', which
+        the widget proxy hands us rather than Tk."""
+
+        if command in ('undo', 'redo'):
+            if Text.cget(self, 'state') == DISABLED:
+                return ''
+            # the inserts/deletes made to carry out an undo/redo aren't new undo steps
+            self._replaying = True
+            try:
+                if command == 'undo':
+                    cursor = self.history.undo(self._applyEdit)
+                else:
+                    cursor = self.history.redo(self._applyEdit)
+            finally:
+                self._replaying = False
+            if cursor is not None:
+                self.changes.undone() if command == 'undo' else self.changes.redone()
+                self.mark_set(INSERT, cursor)
+                self.see(INSERT)
+        elif command == 'separator':
+            # the tracker starts a new step when the history does (see _lineEdit)
+            self.history.separator()
+        elif command == 'reset':
+            self.history.reset()
+            self.changes.reset()
+        elif command == 'canundo':
+            return int(self.history.canUndo)
+        elif command == 'canredo':
+            return int(self.history.canRedo)
+        return ''
+
+    def _applyEdit(self, op, first, last, text):
+        if op == 'insert':
+            self.insert(first, text)
+        else:
+            self.delete(first, last)
+
+    @contextlib.contextmanager
+    def undoGroup(self):
+        """Make every edit in a with block one undo step."""
+
+        self.history.beginGroup()
+        try:
+            yield
+        finally:
+            self.history.endGroup()
+
+    def configure(self, cnf=None, **kw):
+        if isinstance(cnf, dict):
+            kw = dict(cnf, **kw)
+            cnf = None
+        if 'undo' in kw:
+            self.history.enabled = bool(kw.pop('undo'))
+            if not kw and cnf is None:
+                return
+        return Text.configure(self, cnf, **kw)
+
+    config = configure
+
+    def cget(self, key):
+        if key == 'undo':
+            return self.history.enabled
+        return Text.cget(self, key)
+
+    __getitem__ = cget
+
+    def _lineCount(self):
+        return self.document.lineCount
+
     def reformatRange(self, start, end):
-        """Reformat the given range of text. """
-        
-        buffer = str(self.get(start, end))
-        self.delete(start, end)
-        self.insertFormatted(start, buffer)
-        
-    
+        """Reformat the given range of text. This re-lexes and re-tags it (and
+        whatever follows, if the lexer state at the end changes), and doesn't
+        touch the text itself."""
+
+        first = int(self.index(start).split('.')[0]) - 1
+        last = int(self.index(end).split('.')[0]) - 1
+        self.lineStates.markDirty(first, min(last, self.lineStates.lineCount - 1))
+        self.highlightDirty()
+
+
     def reformatEverything(self):
         """Reformat the works!"""
-        
-        self.reformatRange("1.0", "end")
+
+        self._cancelHighlight()
+        self.scheduler.cancel(self)
+        self.lineStates.reset(self._lineCount())
+        self._highlight()
 
     def setLexer(self, lexer):
         """
             Change the Lexer (if the user decides they want a different one).
         """
-        self.lexer = lexer
\ No newline at end of file
+        self.lexer = lexer
+        self.scheduler.cancel(self)
+        self.lineStates.setLexer(lexer, self._lineCount())
+
+    def bindData(self, sequence, func, add=True):
+        """Bind func to one of the virtual events above, like bind(), but call it
+        with the event's data split into strings, rather than with an Event."""
+
+        command = self.register(lambda data: func(*self.tk.splitlist(data)))
+        self.tk.call('bind', self._w, sequence, '{0}{1} %d'.format('+' if add else '', command))
+        return command
+
+    def unbindData(self, sequence, command):
+        """Undo a bindData(), given what it returned, leaving any other bindings
+        for the sequence alone (unlike unbind())."""
+
+        script = self.tk.call('bind', self._w, sequence)
+        lines = [line for line in script.split('\n') if command not in line]
+        self.tk.call('bind', self._w, sequence, '\n'.join(lines))
+        self.deletecommand(command)
+
+    def setEditHook(self, func):
+        """Have func(op, first, last, text) called after every insert, delete
+        or replace (undo and redo included), or stop that with func None. op is
+        the command, first and last are the indices it started and ended at,
+        resolved before it was made (first for both, for an insert), and text
+        is what went in, without its tags ('' for a delete). Doing the same
+        to the text as it was before gets the same text as after."""
+
+        self._editHook = func
+
+    def destroy(self):
+        self._editHook = None
+        self._cancelHighlight()
+        self.scheduler.remove(self)
+        Text.destroy(self)
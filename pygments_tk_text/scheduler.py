@@ -0,0 +1,152 @@
+#Highlight scheduling across PygmentsText widgets
+__author__ = 'Robert Cope'
+
+import sys
+import time
+import Queue
+from pygments_tk_text import tokenizer
+
+VIEW, FOCUSED, VISIBLE, IDLE = range(4)     # job priorities, most urgent first
+
+
+class HighlightScheduler(object):
+
+    """Owns the highlighting work of a set of PygmentsText widgets, so that they
+    don't compete with each other for the tokenizer or for time on the Tk thread.
+    Jobs go to the tokenizer by priority:
+        VIEW      the dirty lines on screen in the focused widget
+        FOCUSED   the rest of the focused widget
+        VISIBLE   the dirty lines on screen in any other widget that is mapped
+        IDLE      the rest of the other widgets, one job at a time, and only once
+                  the focused widget is done and hasn't been edited for IDLETIME ms
+    Each widget has at most one re-lex job in flight (and one look at its view).
+    Results come back through one queue in the same order, and are put on in
+    frames, every POLLTIME ms while there is work on, up to FRAMETIME at a time
+    between them. A widget's jobs are cancelled when it is edited, changes lexer,
+    or is removed."""
+
+    FRAMETIME = 0.015   # seconds of putting results on per frame, across every widget
+    POLLTIME = 10       # ms between frames
+    IDLETIME = 500      # ms without an edit in the focused widget before the others get their turn
+
+    def __init__(self, root):
+        self.root = root            # anything with after()
+        self.widgets = []
+        self.focused = None
+        self._results = Queue.PriorityQueue()
+        self._owners = {}           # job in flight -> its widget
+        self._relexJobs = {}        # widget -> its re-lex job in flight
+        self._lastEdit = 0
+        self._frameJob = None
+
+    def add(self, widget):
+        self.widgets.append(widget)
+        if self.focused is None:
+            self.focused = widget
+
+    def remove(self, widget):
+        self.cancel(widget)
+        self.widgets.remove(widget)
+        if widget is self.focused:
+            self.focused = None
+        if not self.widgets and self._frameJob is not None:
+            self.root.after_cancel(self._frameJob)
+            self._frameJob = None
+
+    def focus(self, widget):
+        """Make widget the one whose highlighting comes first. Jobs already in flight for the widgets whose
+        priority changes are planned again, so they go in at the right priority."""
+
+        if widget is self.focused:
+            return
+        for other in (self.focused, widget):
+            if other is not None:
+                self.cancel(other)
+        self.focused = widget
+        self.wake()
+
+    def edited(self, widget):
+        """Called on every edit in widget: whatever it had in flight is out of date."""
+
+        self.cancel(widget)
+        if widget is self.focused:
+            self._lastEdit = time.time()
+
+    def cancel(self, widget):
+        """Drop every job widget has in flight, along with anything they've handed back."""
+
+        for job, owner in self._owners.items():
+            if owner is widget:
+                job.cancelled = True
+                del self._owners[job]
+        self._relexJobs.pop(widget, None)
+        # so the lines on screen get looked at again, if they were in a job just dropped
+        widget.peekedView = None
+
+    def wake(self):
+        """Have a frame soon, if one isn't already on the way, to hand out whatever needs doing."""
+
+        if self._frameJob is None:
+            self._frameJob = self.root.after_idle(self._frame)
+
+    def _frame(self):
+        self._frameJob = None
+        error = None
+        deadline = time.time() + self.FRAMETIME
+        while time.time() < deadline:
+            try:
+                priority, sequence, job, kind, result = self._results.get_nowait()
+            except Queue.Empty:
+                break
+            widget = self._owners.get(job)
+            if widget is None:
+                continue
+            if kind != 'batch':
+                del self._owners[job]
+                if self._relexJobs.get(widget) is job:
+                    del self._relexJobs[widget]
+            try:
+                widget.takeResult(job, kind, result)
+            except Exception:
+                error = error or sys.exc_info()
+        self._plan()
+        if self._owners or any(self._wantsWork(widget) for widget in self.widgets):
+            self._frameJob = self.root.after(self.POLLTIME, self._frame)
+        if error:
+            raise error[0], error[1], error[2]
+
+    def _plan(self):
+        """Hand the tokenizer whatever should be under way, by priority."""
+
+        focused = self.focused
+        if focused is not None and self._wantsWork(focused):
+            self._submit(focused, focused.peekJob(), VIEW)
+            if focused not in self._relexJobs:
+                self._submit(focused, focused.relexJob(), FOCUSED)
+        for widget in self.widgets:
+            if widget is not focused and self._wantsWork(widget) and widget.winfo_ismapped():
+                self._submit(widget, widget.peekJob(), VISIBLE)
+        if self._idle():
+            for widget in self.widgets:
+                if widget is not focused and self._wantsWork(widget):
+                    self._submit(widget, widget.relexJob(), IDLE)
+                    return
+
+    def _idle(self):
+        if self._owners:
+            return False
+        if self.focused is not None and self._wantsWork(self.focused):
+            return False
+        return time.time() - self._lastEdit >= self.IDLETIME / 1000.0
+
+    @staticmethod
+    def _wantsWork(widget):
+        return bool(widget.lineStates.dirty) and not widget.highlightPending
+
+    def _submit(self, widget, job, priority):
+        if job is None:
+            return
+        self._owners[job] = widget
+        if not job.peek:
+            self._relexJobs[widget] = job
+        tokenizer.submit(job, self._results, priority)
@@ -1,6 +1,20 @@
 from pygments.formatter import Formatter
+import tkFont
 import string
 
+
+_formatters = {}    # style name -> the TkFormatter shared by every widget using it
+
+def sharedFormatter(style='default'):
+    """Return the TkFormatter for a style, made the first time it is asked
+    for and shared from then on, so each new editor doesn't walk the style
+    (and make its fonts) all over again."""
+
+    formatter = _formatters.get(style)
+    if formatter is None:
+        formatter = _formatters[style] = TkFormatter(style=style)
+    return formatter
+
 class TkFormatter(Formatter):
     
     """A Pygments formatter that creates tags suitable for use in Tkinter.Text objects.
@@ -18,16 +32,21 @@ class TkFormatter(Formatter):
         # method later
         self.styles = {}
         self.tktags = {} # parallel to self.styles, but with tagNames
+        self.tagNames = {} # token type -> tagName; the style's own token types are
+                           # filled in here, any others by tagNameFor() as we meet them
+        self.fonts = {}    # (family, size, modifiers) -> shared tkFont.Font
+        self.tagProcs = {} # (family, size) -> Tcl proc that configures our tags
         
         # Prepare a token & tagName -> style mapping
         for token, style in self.style:
             tagName = self.tokenToTagName(token)
             tkStyle = self.pygmentsStyleToTkStyle(style)
-            self.styles[token]   = True     # self.format() doesn't need a token ->
+            self.styles[token]   = True     # tagNameFor() doesn't need a token ->
                                             # rendered style mapping, just to know
                                             # whether one exists
             self.tktags[tagName] = tkStyle  # But the calling Tk Text object will need
                                             # the style details
+            self.tagNames[token] = tagName
 
 
     def pygmentsStyleToTkStyle(self, style):
@@ -58,10 +77,57 @@ class TkFormatter(Formatter):
     
 
     def get_style_defs(self, arg=""):
-        """Called by the client (a Tk Text object) to learn what styles to use."""
+        """The tag definitions, as tagName: [(attname, attval), ..]. Widgets
+        use configureTags() instead."""
         return self.tktags
     
     
+    def configureTags(self, widget):
+        """Configure our tags on a Tk Text widget. A tag whose style is bold or
+        italic gets a named font, made the first time it's needed for the
+        widget's base font and shared by every widget from then on; other tags
+        are left with the widget's own font. The tag configuration for a base
+        font goes into a Tcl proc the first time round, so each widget after
+        that costs a single Tcl call."""
+
+        spec = widget.tk.splitlist(widget.tk.call('font', 'actual', widget.cget('font')))
+        spec = dict(zip(spec[::2], spec[1::2]))
+        key = (spec['-family'], int(spec['-size']))
+        procName = self.tagProcs.get(key)
+        if procName is None:
+            lines = []
+            for tagName, attTupleList in self.tktags.iteritems():
+                options = []
+                for attName, attValue in attTupleList:
+                    if attName == 'font':
+                        if not attValue:
+                            continue
+                        attValue = self.fontFor(widget, key, attValue).name
+                    elif attValue is True:
+                        attValue = 1
+                    options.append('-{0} {{{1}}}'.format(attName, attValue))
+                if options:
+                    lines.append('$w tag configure {0} {1}'.format(tagName, ' '.join(options)))
+            procName = 'pygtext_tags_{0}_{1}'.format(id(self), len(self.tagProcs))
+            widget.tk.eval('proc {0} {{w}} {{\n{1}\n}}'.format(procName, '\n'.join(lines)))
+            self.tagProcs[key] = procName
+        widget.tk.call(procName, str(widget))
+
+
+    def fontFor(self, widget, key, modifiers):
+        """The shared named font for a base font (family, size) with the given
+        modifiers ("bold", "italic" or both) added."""
+
+        fontKey = key + (modifiers,)
+        font = self.fonts.get(fontKey)
+        if font is None:
+            family, size = key
+            font = self.fonts[fontKey] = tkFont.Font(root=widget, family=family, size=size,
+                                                     weight='bold' if 'bold' in modifiers else 'normal',
+                                                     slant='italic' if 'italic' in modifiers else 'roman')
+        return font
+
+
     def tokenToTagName(self, token):
         """Tokens are pygments 'style names' or 'style classes'. Here we
         translate between pygments tokens and Tk's Text equivalent 'tag' names."""
@@ -73,51 +139,16 @@ class TkFormatter(Formatter):
         return tagName
 
         
-    def tkTaggedStr(self, s, token):
-        """Return a tag:quoted-string\n string that a Tk Text element can easily
-        use. Note that s may come in as unicode string, so down-code back to str
-        (at least for Python 2.7)"""
-        
-        tagName = self.tokenToTagName(token) or ""
-        s = string.replace(s, "\n", "\\n")
-        taggedStr = tagName + ':' + s + "\n"
-        return str(taggedStr)
-        
-
-    def format(self, tokensource, outfile):
-        # lastval is a string we use for caching
-        # because it's possible that an lexer yields a number
-        # of consecutive tokens with the same token type.
-        # to minimize the size of the generated markup we
-        # try to join the values of same-type tokens here
-        
-        lastval = ''
-        lasttype = None
-        
-        for ttype, value in tokensource:
-            # if the token type doesn't exist in the stylemap
-            # we try it with the parent of the token type
-            # eg: parent of Token.Literal.String.Double is
-            # Token.Literal.String
-            while ttype not in self.styles:
-                ttype = ttype.parent
-            if ttype == lasttype:
-                # the current token type is the same of the last
-                # iteration. cache it
-                lastval += value
-            else:
-                # not the same token as last iteration, but we
-                # have some data in the buffer. wrap it with the
-                # defined style and write it to the output file
-                if lastval:
-                    tkstr = self.tkTaggedStr(lastval, lasttype)
-                    outfile.write(tkstr)
-                # set lastval/lasttype to current values
-                lastval = value
-                lasttype = ttype
-
-        # we're done; if something's left in the buffer, write it now
-        if lastval:
-            tkstr = self.tkTaggedStr(lastval, ttype)
-            outfile.write(tkstr)
+    def tagNameFor(self, ttype):
+        """Return the tag name for a token type. If the token type doesn't exist
+        in the stylemap we use its closest parent that does, eg: parent of
+        Token.Literal.String.Double is Token.Literal.String"""
 
+        try:
+            return self.tagNames[ttype]
+        except KeyError:
+            styled = ttype
+            while styled not in self.styles:
+                styled = styled.parent
+            tagName = self.tagNames[ttype] = self.tokenToTagName(styled)
+            return tagName
@@ -0,0 +1,54 @@
+#Background lexing for PygmentsText
+__author__ = 'Robert Cope'
+
+import itertools
+import sys
+import threading
+import time
+import Queue
+
+_jobs = Queue.PriorityQueue()
+_sequence = itertools.count()
+_worker = None
+
+
+def submit(job, results, priority=0):
+    """Queue job (a linestate.LexJob) for the worker thread, which is shared by every widget and started
+    the first time it's needed. The worker never touches Tk: it puts (priority, sequence, job, 'batch',
+    batch) on results for each batch job.batches() hands back, then (priority, sequence, job, 'done',
+    None), or (priority, sequence, job, 'error', exc_info) if the lexer raised, for the Tk thread to pick
+    up. sequence goes up with every result, so a PriorityQueue for results hands them back by priority,
+    and in order within it.
+
+    Jobs with a lower priority number go first, and the worker goes back to the queue after every batch,
+    so a job that comes in with a better priority than the one running doesn't wait for it to finish. A
+    job with cancelled set is dropped at its next batch (or before it starts)."""
+
+    global _worker
+    if _worker is None:
+        _worker = threading.Thread(target=_work)
+        _worker.daemon = True
+        _worker.start()
+    _jobs.put((priority, next(_sequence), job, results, None))
+
+
+def _work():
+    while True:
+        priority, sequence, job, results, batches = _jobs.get()
+        if job.cancelled:
+            continue
+        try:
+            if batches is None:
+                batches = job.batches()
+            batch = next(batches)
+        except StopIteration:
+            results.put((priority, next(_sequence), job, 'done', None))
+            continue
+        except Exception:
+            results.put((priority, next(_sequence), job, 'error', sys.exc_info()))
+            continue
+        results.put((priority, next(_sequence), job, 'batch', batch))
+        # back in the queue behind anything more urgent, keeping its place among the rest
+        _jobs.put((priority, sequence, job, results, batches))
+        # and let the Tk thread have the interpreter between batches
+        time.sleep(0)
@@ -0,0 +1,191 @@
+#Undo/redo history for PygmentsText
+__author__ = 'Robert Cope'
+
+import collections
+import sys
+import time
+
+INSERT, DELETE = 'id'
+OPBYTES = 64        # roughly what an edit costs on top of its text
+
+
+def parseIndex(index):
+    line, col = index.split('.')
+    return int(line), int(col)
+
+
+def endOf(line, col, text):
+    """The (line, col) text runs to, if it starts at line, col."""
+    newlines = text.count('\n')
+    if newlines:
+        return line + newlines, len(text) - text.rfind('\n') - 1
+    return line, col + len(text)
+
+
+class UndoHistory(object):
+
+    """The undo and redo stacks for a PygmentsText, kept here rather than by
+    Tk, so they only ever hold the user's edits, as (kind, line, col, text):
+    an INSERT of text at line.col, or a DELETE of the text that was at line.col.
+    A step is a list of edits, undone last first.
+
+    Typing runs and deleting runs go into the same step as long as each edit
+    carries on where the last left off, within MERGETIME of it; a newline, a
+    pause, a jump, or separator() ends the step. Anything else (a paste, a cut,
+    a replace) is a step of its own, as is everything between beginGroup() and
+    endGroup(). Once the stacks hold more than maxBytes, the oldest undo steps
+    are dropped (the newest too, if it's bigger than that on its own)."""
+
+    MERGETIME = 1.0     # seconds between edits that still go in the same step
+
+    def __init__(self, maxBytes=32 * 1024 * 1024):
+        self.maxBytes = maxBytes
+        self.enabled = True
+        self.bytes = 0
+        self._undo = collections.deque()
+        self._redo = []
+        self._open = False      # whether the newest undo step can take more edits
+        self._mergeable = False # whether it's a typing or deleting run
+        self._group = 0
+        self._lastEdit = 0
+
+    @property
+    def canUndo(self):
+        return bool(self._undo)
+
+    @property
+    def canRedo(self):
+        return bool(self._redo)
+
+    def record(self, op, first, last, text, old):
+        """Take in an edit made by the user: op is 'insert', 'delete' or
+        'replace', first and last the indices it was made at, text what went in
+        and old what was taken out. Returns True if it started a new step."""
+
+        line, col = parseIndex(first)
+        edits = []
+        if old:
+            edits.append((DELETE, line, col, old))
+        if text:
+            edits.append((INSERT, line, col, text))
+        if not edits:
+            return False
+        now = time.time()
+        if self._redo:
+            self.bytes -= sum(self._stepBytes(step) for step in self._redo)
+            self._redo = []
+        newStep = True
+        if self._open and self._group:
+            newStep = False
+        elif self._open and self._mergeable and len(edits) == 1 and now - self._lastEdit < self.MERGETIME:
+            merged = self._merge(self._undo[-1][-1], edits[0])
+            if merged is not None:
+                self.bytes += self._editBytes(merged) - self._editBytes(self._undo[-1][-1])
+                self._undo[-1][-1] = merged
+                edits = []
+                newStep = False
+        if newStep:
+            self._undo.append([])
+            self._open = True
+            self._mergeable = len(edits) == 1 and len(edits[0][3]) == 1 and edits[0][3] != '\n'
+        self._undo[-1].extend(edits)
+        self.bytes += sum(self._editBytes(edit) for edit in edits)
+        self._lastEdit = now
+        self._evict()
+        return newStep
+
+    def separator(self):
+        if not self._group:
+            self._open = False
+
+    def beginGroup(self):
+        """Have every edit until the matching endGroup() go in one step."""
+        if not self._group:
+            self._open = False
+        self._group += 1
+
+    def endGroup(self):
+        self._group -= 1
+        if not self._group:
+            self._open = False
+
+    def reset(self):
+        self._undo.clear()
+        self._redo = []
+        self.bytes = 0
+        self._open = False
+
+    def undo(self, apply):
+        """Undo the newest step, making each edit with apply(op, first, last,
+        text), as for PygmentsText.setEditHook. Returns the index the cursor
+        should go to, or None if there was nothing to undo."""
+
+        if not self._undo:
+            return None
+        self._open = False
+        step = self._undo.pop()
+        self._redo.append(step)
+        cursor = None
+        for kind, line, col, text in reversed(step):
+            cursor = self._apply(apply, DELETE if kind == INSERT else INSERT, line, col, text)
+        return cursor
+
+    def redo(self, apply):
+        """Redo the newest step undone, like undo()."""
+
+        if not self._redo:
+            return None
+        self._open = False
+        step = self._redo.pop()
+        self._undo.append(step)
+        cursor = None
+        for kind, line, col, text in step:
+            cursor = self._apply(apply, kind, line, col, text)
+        return cursor
+
+    @staticmethod
+    def _apply(apply, kind, line, col, text):
+        first = '{0}.{1}'.format(line, col)
+        end = '{0}.{1}'.format(*endOf(line, col, text))
+        if kind == INSERT:
+            apply('insert', first, first, text)
+            return end
+        apply('delete', first, end, '')
+        return first
+
+    @staticmethod
+    def _merge(last, edit):
+        """last and edit as one edit, if edit carries on where last left off."""
+
+        lastKind, lastLine, lastCol, lastText = last
+        kind, line, col, text = edit
+        if kind != lastKind or len(text) != 1 or '\n' in lastText[-1:]:
+            return None
+        if kind == INSERT and (line, col) == endOf(lastLine, lastCol, lastText):
+            return kind, lastLine, lastCol, lastText + text
+        if kind == DELETE and endOf(line, col, text) == (lastLine, lastCol):
+            # backspace
+            return kind, line, col, text + lastText
+        if kind == DELETE and (line, col) == (lastLine, lastCol):
+            # forward delete
+            return kind, line, col, lastText + text
+        return None
+
+    def _evict(self):
+        while self.bytes > self.maxBytes and self._undo:
+            step = self._undo.popleft()
+            self.bytes -= self._stepBytes(step)
+            if not self._undo:
+                self._open = False
+        if self.bytes > self.maxBytes:
+            # what's left is all redo steps, which can't be got to without the undo steps just dropped
+            self.bytes -= sum(self._stepBytes(step) for step in self._redo)
+            self._redo = []
+
+    @staticmethod
+    def _editBytes(edit):
+        return OPBYTES + sys.getsizeof(edit[3])
+
+    @classmethod
+    def _stepBytes(cls, step):
+        return sum(cls._editBytes(edit) for edit in step)
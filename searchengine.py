@@ -0,0 +1,194 @@
+#   CodePad
+#   Background text search
+__author__ = 'Robert Cope'
+
+import re
+import threading
+import Queue
+from array import array
+from bisect import bisect_left, bisect_right
+
+NEWLINE = re.compile('\n')
+
+
+def findLineStarts(text):
+    """
+        The offset of the start of each line in text.
+    """
+    lineStarts = array('L', [0])
+    lineStarts.extend(match.end() for match in NEWLINE.finditer(text))
+    return lineStarts
+
+
+def indexOf(lineStarts, offset):
+    """
+        The Tk "line.col" index of an offset into a text with the given line starts.
+    """
+    line = bisect_right(lineStarts, offset)
+    return "{0}.{1}".format(line, offset - lineStarts[line - 1])
+
+
+def replacements(text, compiled, replacement, regex=False):
+    """
+        Every replacement to make in text, as a list of (start, end, new text), one for each (non-empty) match of
+        compiled. With regex True, replacement can refer to groups as re.sub() allows ("\\1", "\\g<name>"), and
+        re.error is raised if it refers to one that isn't there.
+    """
+    edits = []
+    for match in compiled.finditer(text):
+        start, end = match.span()
+        if start != end:
+            edits.append((start, end, match.expand(replacement) if regex else replacement))
+    return edits
+
+
+class SearchEngine(object):
+    """
+        Searches a snapshot of a text for a literal string or a regex in a worker thread, and keeps the matches as
+        sorted arrays of start and end offsets, so that finding the matches in a range, or the next or previous
+        match from a point, is a binary search. The worker never touches Tk: it hands its results back through a
+        queue in batches, and poll() (called from the Tk thread) picks them up. Offsets are in characters from the
+        start of the snapshot, and index() and offset() convert to and from Tk "line.col" indices using the line
+        starts, which the worker works out first.
+    """
+    BATCHSIZE = 5000    # matches per batch handed back by the worker
+    def __init__(self):
+        self.starts = array('L')
+        self.ends = array('L')
+        self.lineStarts = array('L', [0])
+        self.textLength = 0
+        self.searching = False
+        self._generation = 0
+        self._results = Queue.Queue()
+
+    @staticmethod
+    def compile(pattern, regex=False, matchCase=False, wholeWord=False):
+        """
+            Make the regex for a search. Raises re.error if regex is True and pattern isn't a valid one.
+        """
+        if not regex:
+            pattern = re.escape(pattern)
+        if wholeWord:
+            pattern = r'\b(?:{0})\b'.format(pattern)
+        flags = re.MULTILINE | re.UNICODE
+        if not matchCase:
+            flags |= re.IGNORECASE
+        return re.compile(pattern, flags)
+
+    def start(self, text, compiled):
+        """
+            Start searching text for the compiled regex in the background, dropping any search already running. text
+            can be a document snapshot (see pygments_tk_text.document), in which case it's read out by the worker.
+        """
+        self._generation += 1
+        self.starts = array('L')
+        self.ends = array('L')
+        self.lineStarts = array('L', [0])
+        self.textLength = len(text)
+        self.searching = True
+        worker = threading.Thread(target=self._search, args=(self._generation, text, compiled))
+        worker.daemon = True
+        worker.start()
+
+    def cancel(self):
+        """
+            Stop the search running in the background, if there is one. The matches found so far are kept.
+        """
+        self._generation += 1
+        self.searching = False
+
+    def poll(self):
+        """
+            Pick up whatever the worker has found since the last poll. Returns True if there was anything.
+        """
+        changed = False
+        while True:
+            try:
+                message = self._results.get_nowait()
+            except Queue.Empty:
+                return changed
+            generation, kind = message[:2]
+            if generation != self._generation:
+                continue
+            changed = True
+            if kind == 'lines':
+                self.lineStarts = message[2]
+            else:
+                self.starts.extend(message[2])
+                self.ends.extend(message[3])
+                if kind == 'done':
+                    self.searching = False
+
+    def _search(self, generation, text, compiled):
+        if not isinstance(text, basestring):
+            text = text.get()
+        self._results.put((generation, 'lines', findLineStarts(text)))
+        starts, ends = array('L'), array('L')
+        for match in compiled.finditer(text):
+            if generation != self._generation:
+                return
+            start, end = match.span()
+            if start == end:
+                continue
+            starts.append(start)
+            ends.append(end)
+            if len(starts) == self.BATCHSIZE:
+                self._results.put((generation, 'matches', starts, ends))
+                starts, ends = array('L'), array('L')
+        self._results.put((generation, 'done', starts, ends))
+
+    @property
+    def count(self):
+        return len(self.starts)
+
+    def between(self, startOffset, endOffset):
+        """
+            The range of match numbers for the matches that start in startOffset..endOffset.
+        """
+        return bisect_left(self.starts, startOffset), bisect_left(self.starts, endOffset)
+
+    def nextMatch(self, offset):
+        """
+            The number of the first match starting after offset, wrapping round to the first match, or None if there
+            aren't any matches.
+        """
+        if not self.starts:
+            return None
+        k = bisect_right(self.starts, offset)
+        return k if k < len(self.starts) else 0
+
+    def previousMatch(self, offset):
+        """
+            The number of the last match starting before offset, wrapping round to the last match, or None if there
+            aren't any matches.
+        """
+        if not self.starts:
+            return None
+        k = bisect_left(self.starts, offset) - 1
+        return k if k >= 0 else len(self.starts) - 1
+
+    def index(self, offset):
+        """
+            The Tk index of a snapshot offset.
+        """
+        return indexOf(self.lineStarts, offset)
+
+    def offset(self, index):
+        """
+            The snapshot offset of a Tk "line.col" index (as returned by Text.index()).
+        """
+        line, col = index.split(".")
+        line = int(line)
+        if line > len(self.lineStarts):
+            return self.textLength
+        return min(self.lineStarts[line - 1] + int(col), self.textLength)
+
+    def lineOffset(self, line):
+        """
+            The snapshot offset of the start of a (1-based) line, clamped to the text.
+        """
+        if line < 1:
+            return 0
+        if line > len(self.lineStarts):
+            return self.textLength
+        return self.lineStarts[line - 1]
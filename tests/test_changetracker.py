@@ -0,0 +1,125 @@
+#Tests for working out modification from edit and undo counts
+__author__ = 'Robert Cope'
+
+import unittest
+
+from pygments_tk_text.changetracker import ChangeTracker
+
+
+class Text(object):
+
+    """A text and its tracker, edited the way PygmentsText tells the tracker about it: each type() is a
+    step of its own, and undo() and redo() replay one."""
+
+    def __init__(self):
+        self.text = u''
+        self.undos, self.redos = [], []
+        self.changes = ChangeTracker()
+        self.digests = 0
+
+    def type(self, text):
+        self.undos.append(self.text)
+        self.redos = []
+        self.text += text
+        self.changes.separator()
+        self.changes.edited()
+
+    def undo(self):
+        self.redos.append(self.text)
+        self.text = self.undos.pop()
+        self.changes.edited(replaying=True)
+        self.changes.undone()
+
+    def redo(self):
+        self.undos.append(self.text)
+        self.text = self.redos.pop()
+        self.changes.edited(replaying=True)
+        self.changes.redone()
+
+    def digest(self):
+        self.digests += 1
+        return hash(self.text)
+
+    def save(self):
+        text = self.text
+        self.changes.markSaved(lambda: hash(text))
+
+    @property
+    def modified(self):
+        return self.changes.isModified(self.digest)
+
+
+class ChangeTrackerTest(unittest.TestCase):
+
+    def testEditAfterSave(self):
+        text = Text()
+        text.type(u'a')
+        text.save()
+        self.assertFalse(text.modified)
+        text.type(u'b')
+        self.assertTrue(text.modified)
+        self.assertEqual(text.digests, 0)
+
+    def testUndoToSaved(self):
+        text = Text()
+        text.type(u'a')
+        text.save()
+        text.type(u'b')
+        text.undo()
+        self.assertFalse(text.modified)
+        text.redo()
+        self.assertTrue(text.modified)
+
+    def testUndoToEmpty(self):
+        text = Text()
+        text.save()
+        text.type(u'a')
+        text.type(u'b')
+        text.undo()
+        self.assertTrue(text.modified)
+        text.undo()
+        self.assertFalse(text.modified)
+
+    def testRedoThrownAway(self):
+        # undoing past the save and then typing throws away the redo that would have got back to it
+        text = Text()
+        text.type(u'a')
+        text.save()
+        text.undo()
+        text.type(u'a')
+        self.assertIsNone(text.changes.savedDepth)
+        self.assertTrue(text.modified)
+
+    def testDigestOnlyWhenNeeded(self):
+        text = Text()
+        text.type(u'a')
+        text.save()
+        text.type(u'b')
+        text.undo()
+        self.assertFalse(text.modified)
+        self.assertEqual(text.digests, 1)
+        self.assertFalse(text.modified)
+        self.assertEqual(text.digests, 1)
+
+    def testSaveWithoutDigest(self):
+        text = Text()
+        text.changes.markSaved(None)
+        text.type(u'a')
+        text.undo()
+        self.assertTrue(text.modified)
+
+    def testSavePoint(self):
+        # edits made while a copy is being saved still count, and undoing them gets back to it
+        text = Text()
+        text.type(u'a')
+        point = text.changes.savePoint()
+        saved = text.text
+        text.type(u'b')
+        text.changes.markSaved(lambda: hash(saved), point)
+        self.assertTrue(text.modified)
+        text.undo()
+        self.assertFalse(text.modified)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#Tests for the rope copy of a PygmentsText's text
+__author__ = 'Robert Cope'
+
+import random
+import unittest
+
+from pygments_tk_text import document
+from pygments_tk_text.document import Document
+
+
+class DocumentTest(unittest.TestCase):
+
+    def setUp(self):
+        # small leaves, so short texts still make trees a few levels deep
+        self.leafChars = document.LEAFCHARS
+        document.LEAFCHARS = 8
+
+    def tearDown(self):
+        document.LEAFCHARS = self.leafChars
+
+    def assertMatches(self, doc, text):
+        self.assertEqual(doc.get(), text)
+        self.assertEqual(len(doc), len(text))
+        self.assertEqual(doc.lineCount, text.count('\n') + 1)
+        start = 0
+        for line, chars in enumerate(text.split('\n')):
+            self.assertEqual(doc.lineStart(line), start)
+            for offset in xrange(start, start + len(chars) + 1):
+                self.assertEqual(doc.lineOf(offset), line)
+                index = '{0}.{1}'.format(line + 1, offset - start)
+                self.assertEqual(doc.index(offset), index)
+                self.assertEqual(doc.offset(index), offset)
+            start += len(chars) + 1
+
+    def testLookups(self):
+        text = u'first line\n\nthird, which is longer than a leaf\nlast'
+        doc = Document(text)
+        self.assertMatches(doc, text)
+        self.assertEqual(doc.lineStart(10), len(text))
+        self.assertEqual(doc.offset('2.99'), text.index('\n') + 1)
+        self.assertEqual(doc.offset('9.0'), len(text))
+        self.assertEqual(doc.lines(1, 3), u'\nthird, which is longer than a leaf\n')
+        self.assertEqual(doc.lines(3), u'last')
+        self.assertEqual(doc.get(3, 20), text[3:20])
+
+    def testEmpty(self):
+        doc = Document()
+        self.assertEqual(doc.get(), u'')
+        self.assertEqual(doc.lineCount, 1)
+        self.assertEqual(doc.index(0), '1.0')
+        doc.insert(0, u'a\nb')
+        doc.delete(0, 3)
+        self.assertMatches(doc, u'')
+
+    def testRandomEdits(self):
+        rand = random.Random(0)
+        text = u''
+        doc = Document()
+        for _ in xrange(500):
+            start = rand.randint(0, len(text))
+            if text and rand.random() < 0.4:
+                end = rand.randint(start, min(len(text), start + 30))
+                doc.delete(start, end)
+                text = text[:start] + text[end:]
+            else:
+                new = u''.join(rand.choice(u'ab\n') for _ in xrange(rand.randint(1, 30)))
+                doc.insert(start, new)
+                text = text[:start] + new + text[start:]
+        self.assertMatches(doc, text)
+        # kept balanced, so lookups stay O(log n)
+        self.assertLessEqual(doc._root.height, 4 * len(text).bit_length())
+
+    def testApply(self):
+        doc = Document(u'one\ntwo\nthree')
+        doc.apply('insert', '2.0', '2.0', u'new\n')
+        doc.apply('delete', '1.1', '1.3', u'')
+        doc.apply('replace', '4.0', '4.5', u'3')
+        self.assertMatches(doc, u'o\nnew\ntwo\n3')
+
+    def testSnapshotUnchangedByEdits(self):
+        doc = Document(u'0123456789\n' * 5)
+        snapshot = doc.snapshot()
+        doc.insert(15, u'inserted')
+        doc.delete(0, 30)
+        doc.reset(u'gone')
+        self.assertEqual(snapshot.get(), u'0123456789\n' * 5)
+        self.assertEqual(list(snapshot.chunks(5, 25)), [u'567', u'89\n01234', u'56789\n01', u'2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+#Tests for the edit journals kept for unsaved work
+__author__ = 'Robert Cope'
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import journal
+from pygments_tk_text.document import Document
+
+
+class Widget(object):
+
+    """Just enough of a Text widget for journal.replay()."""
+
+    def __init__(self, text):
+        self.document = Document(text)
+
+    def insert(self, index, text):
+        self.document.insert(self.document.offset(index), text)
+
+    def delete(self, first, last):
+        self.document.delete(self.document.offset(first), self.document.offset(last))
+
+
+class EditJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.settings = journal.JOURNALDIR, journal.FSYNC, journal.COMMITTIME, journal.COMPACTBYTES
+        journal.JOURNALDIR = os.path.join(self.dir, 'journals')
+        journal.FSYNC = False
+        journal.COMMITTIME = 0.01
+
+    def tearDown(self):
+        journal.flush()
+        journal.JOURNALDIR, journal.FSYNC, journal.COMMITTIME, journal.COMPACTBYTES = self.settings
+        shutil.rmtree(self.dir)
+
+    def edit(self, doc, jrnl, op, first, last, text):
+        doc.apply(op, first, last, text)
+        jrnl.record(op, first, last, text)
+
+    def editAll(self, doc, jrnl):
+        self.edit(doc, jrnl, 'insert', '1.5', '1.5', u' there')
+        self.edit(doc, jrnl, 'insert', '2.0', '2.0', u'caf\xe9\n')
+        self.edit(doc, jrnl, 'delete', '1.0', '1.1', u'')
+        self.edit(doc, jrnl, 'replace', '3.0', '3.4', u'two\nlines')
+
+    def assertRoundTrip(self, jrnl, base, doc, fromFile=False):
+        journal.flush()
+        filename, readFromFile, text, edits = journal.read(jrnl.path)
+        self.assertEqual((filename, readFromFile, text), (jrnl.filename, fromFile, base))
+        widget = Widget(text)
+        journal.replay(widget, edits)
+        self.assertEqual(widget.document.get(), doc.get())
+        return edits
+
+    def testRoundTripFromText(self):
+        doc = Document(u'hello\nworld\nlast')
+        jrnl = journal.EditJournal(doc.get, baseText=doc.get())
+        journal.flush()
+        # nothing is written until the first edit
+        self.assertFalse(os.path.exists(jrnl.path))
+        self.editAll(doc, jrnl)
+        edits = self.assertRoundTrip(jrnl, u'hello\nworld\nlast', doc)
+        self.assertEqual(edits[0], ('insert', '1.5', '1.5', u' there'))
+        self.assertEqual(edits[2], ('delete', '1.0', '1.1', u''))
+
+    def testRoundTripFromFile(self):
+        filename = os.path.join(self.dir, 'file.txt')
+        with open(filename, 'wb') as f:
+            f.write(u'hello\nworld\nlast'.encode('utf-8'))
+        doc = Document(u'hello\nworld\nlast')
+        jrnl = journal.EditJournal(doc.get, filename)
+        self.editAll(doc, jrnl)
+        self.assertRoundTrip(jrnl, u'hello\nworld\nlast', doc, fromFile=True)
+        with open(filename, 'ab') as f:
+            f.write('changed')
+        self.assertRaises(journal.JournalError, journal.read, jrnl.path)
+
+    def testCutShort(self):
+        doc = Document(u'hello\nworld\nlast')
+        jrnl = journal.EditJournal(doc.get, baseText=doc.get())
+        self.editAll(doc, jrnl)
+        journal.flush()
+        with open(jrnl.path, 'rb') as f:
+            data = f.read()
+        with open(jrnl.path, 'wb') as f:
+            f.write(data[:-3])
+        self.assertEqual(len(journal.read(jrnl.path)[3]), 3)
+
+    def testCompaction(self):
+        journal.COMPACTBYTES = 100
+        doc = Document(u'')
+        jrnl = journal.EditJournal(doc.snapshot, baseText=u'')
+        for i in xrange(20):
+            self.edit(doc, jrnl, 'insert', '1.{0}'.format(i), '1.{0}'.format(i), u'x')
+        journal.flush()
+        text, edits = journal.read(jrnl.path)[2:]
+        self.assertEqual(text + u'x' * len(edits), doc.get())
+        self.assertLess(len(edits), 20)
+
+    def testDiscard(self):
+        doc = Document(u'a')
+        jrnl = journal.EditJournal(doc.get, baseText=doc.get())
+        self.edit(doc, jrnl, 'insert', '1.1', '1.1', u'b')
+        journal.flush()
+        self.assertTrue(os.path.exists(jrnl.path))
+        jrnl.discard()
+        jrnl.record('insert', '1.2', '1.2', u'c')
+        journal.flush()
+        self.assertFalse(os.path.exists(jrnl.path))
+
+    def testOrphaned(self):
+        doc = Document(u'a')
+        jrnl = journal.EditJournal(doc.get, baseText=doc.get())
+        self.edit(doc, jrnl, 'insert', '1.1', '1.1', u'b')
+        journal.flush()
+        # a CodePad that has since exited
+        child = subprocess.Popen([sys.executable, '-c', 'pass'])
+        child.wait()
+        orphan = os.path.join(journal.JOURNALDIR, '{0}-0.journal'.format(child.pid))
+        shutil.copy(jrnl.path, orphan)
+        self.assertEqual(journal.orphaned(), [orphan])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+#Tests for the line index over memory-mapped files
+__author__ = 'Robert Cope'
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from lineindex import LineIndex
+
+
+class LineIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.indexes = []
+
+    def tearDown(self):
+        for index in self.indexes:
+            index.close()
+        shutil.rmtree(self.dir)
+
+    def open(self, data):
+        filename = os.path.join(self.dir, 'file{0}.log'.format(len(self.indexes)))
+        with open(filename, 'wb') as f:
+            f.write(data)
+        index = LineIndex(filename)
+        # small blocks, so short files still span a few
+        index.BLOCKSIZE = 16
+        self.indexes.append(index)
+        return index
+
+    def assertMatches(self, index, data):
+        starts = [0] + [i + 1 for i, char in enumerate(data) if char == '\n']
+        if data.endswith('\n'):
+            starts.pop()
+        self.assertEqual(index.lineCount, len(starts))
+        for line, start in enumerate(starts):
+            self.assertEqual(index.offsetOfLine(line), start)
+        self.assertIsNone(index.offsetOfLine(len(starts) + 1))
+        for offset in xrange(len(data)):
+            self.assertEqual(index.lineOfOffset(offset), data.count('\n', 0, offset))
+            self.assertEqual(index.lineStart(offset), data.rfind('\n', 0, offset) + 1)
+
+    def testLookups(self):
+        rand = random.Random(0)
+        for data in ('one line', 'ends with a newline\n', '\n\n\n',
+                     ''.join(rand.choice('ab\n') for _ in xrange(300)),
+                     ''.join(rand.choice('abcdefghij\n') for _ in xrange(300))):
+            index = self.open(data)
+            self.assertTrue(index.build(len(data)))
+            self.assertMatches(index, data)
+
+    def testBuiltABitAtATime(self):
+        data = 'line\n' * 40
+        index = self.open(data)
+        self.assertFalse(index.build(64))
+        self.assertEqual(index.progress, 64.0 / len(data))
+        self.assertIsNone(index.lineCount)
+        self.assertEqual(index.lineOfOffset(63), 12)
+        self.assertIsNone(index.lineOfOffset(100))
+        self.assertEqual(index.offsetOfLine(12), 60)
+        self.assertIsNone(index.offsetOfLine(30))
+        while not index.build(64):
+            pass
+        self.assertEqual(index.progress, 1.0)
+        self.assertMatches(index, data)
+
+    def testLongLine(self):
+        data = 'x' * 100 + '\nend'
+        index = self.open(data)
+        index.MAXLINEBYTES = 30
+        self.assertEqual(index.lineStart(90), 60)
+        self.assertEqual(index.lineStart(102), 101)
+
+    def testForwardAndBackward(self):
+        data = 'a\nbb\nccc\ndddd'
+        index = self.open(data)
+        self.assertEqual(index.forward(0, 2, 100), [2, 5])
+        self.assertEqual(index.forward(5, 5, 100), [9, len(data)])
+        self.assertEqual(index.forward(0, 5, 4), [2])
+        self.assertEqual(index.backward(9, 2, 100), 2)
+        self.assertEqual(index.backward(9, 9, 100), 0)
+        self.assertEqual(index.backward(9, 2, 3), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#Tests for incremental lexing against lexing the whole document
+__author__ = 'Robert Cope'
+
+import unittest
+
+from pygments.lexers import CLexer, JavaLexer, JavascriptLexer
+
+from pygments_tk_text.linestate import LineStateLexer, lineOffsets, splitRuns
+
+
+class Document(object):
+
+    """Text that is edited and re-lexed the way PygmentsText does it."""
+
+    def __init__(self, lexer, text):
+        self.text = text
+        self.lineStates = LineStateLexer(lexer, self.text.count('\n') + 1)
+        self.relex()
+
+    def getLines(self, first, last):
+        lines = self.text.split('\n')
+        if last is None:
+            return u'\n'.join(lines[first:]) + u'\n'
+        return u''.join(line + u'\n' for line in lines[first:last])
+
+    def insert(self, line, col, text):
+        offset = sum(len(before) + 1 for before in self.text.split('\n')[:line]) + col
+        self.text = self.text[:offset] + text + self.text[offset:]
+        self.lineStates.noteEdit(line, line, text.count('\n'))
+        self.relex()
+
+    def relex(self):
+        job = self.lineStates.plan(self.getLines, 2)
+        while job is not None:
+            for batch in job.batches():
+                self.lineStates.apply(job, batch)
+            self.lineStates.finish(job)
+            job = self.lineStates.plan(self.getLines, 2)
+
+    def fullRuns(self):
+        text = self.text + u'\n'
+        count = self.text.count('\n') + 1
+        tokens = self.lineStates.lexer.get_tokens_unprocessed(text)
+        return splitRuns(tokens, lineOffsets(text)[:count], count, self.lineStates.classify)
+
+
+class IncrementalLexTest(unittest.TestCase):
+
+    def assertMatchesFullLex(self, document):
+        self.assertEqual(document.lineStates.runs, document.fullRuns())
+
+    def testCommentOpenedThenClosed(self):
+        document = Document(CLexer(), u'int a = 1;\nint b = 2;\nint c = 3;\n')
+        document.insert(0, 0, u'/*')
+        self.assertMatchesFullLex(document)
+        document.insert(1, 10, u'*/')
+        self.assertMatchesFullLex(document)
+
+    def testCommentClosedBelowCheckpoint(self):
+        # /\*.*?\*/ is a single match, so the lines it will run over once closed are lexed from
+        # checkpoints taken while it was unterminated.
+        document = Document(JavascriptLexer(), u'var a = 1;\nvar b = 2;\nvar c = 3;\nvar d = 4;\n')
+        document.insert(0, 0, u'/*')
+        self.assertMatchesFullLex(document)
+        document.insert(2, 10, u'*/')
+        self.assertMatchesFullLex(document)
+
+    def testStringOpenedThenClosed(self):
+        document = Document(JavaLexer(), u'class A {\n  int x = 1;\n  int y = 2;\n}\n')
+        document.insert(1, 10, u'"')
+        self.assertMatchesFullLex(document)
+        document.insert(2, 10, u'"')
+        self.assertMatchesFullLex(document)
+
+    def testStringThatBacktracked(self):
+        # "(\\\\|\\"|[^"])*" only matches "\" after running to the end of the text looking for another quote.
+        document = Document(JavaLexer(), u'\n"\\"\n\n\n')
+        document.insert(4, 0, u'"')
+        self.assertMatchesFullLex(document)
+
+    def testTemplateThatBacktracked(self):
+        document = Document(JavascriptLexer(), u'""""""""""""\'\'\'\\\'\n\n\n\n\n\n/>`')
+        document.insert(6, 3, u"*/'''")
+        self.assertMatchesFullLex(document)
+
+
+if __name__ == '__main__':
+    unittest.main()
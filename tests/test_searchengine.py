@@ -0,0 +1,78 @@
+#Tests for the background text search
+__author__ = 'Robert Cope'
+
+import time
+import unittest
+
+from pygments_tk_text.document import Document
+from searchengine import SearchEngine, findLineStarts, indexOf
+
+
+class SearchEngineTest(unittest.TestCase):
+
+    def search(self, text, pattern, **options):
+        engine = SearchEngine()
+        engine.start(text, SearchEngine.compile(pattern, **options))
+        deadline = time.time() + 10
+        while engine.searching and time.time() < deadline:
+            engine.poll()
+            time.sleep(0.001)
+        self.assertFalse(engine.searching)
+        return engine
+
+    def matches(self, engine):
+        return zip(engine.starts, engine.ends)
+
+    def testOptions(self):
+        text = u'Foo foo food a.b axb'
+        self.assertEqual(self.matches(self.search(text, u'foo')), [(0, 3), (4, 7), (8, 11)])
+        self.assertEqual(self.matches(self.search(text, u'foo', matchCase=True)), [(4, 7), (8, 11)])
+        self.assertEqual(self.matches(self.search(text, u'foo', wholeWord=True)), [(0, 3), (4, 7)])
+        self.assertEqual(self.matches(self.search(text, u'a.b')), [(13, 16)])
+        self.assertEqual(self.matches(self.search(text, u'a.b', regex=True)), [(13, 16), (17, 20)])
+        # empty matches are skipped
+        self.assertEqual(self.matches(self.search(text, u'x*', regex=True)), [(18, 19)])
+
+    def testBatchesAndSnapshots(self):
+        text = u'ab\n' * 50
+        engine = SearchEngine()
+        engine.BATCHSIZE = 7
+        engine.start(Document(text).snapshot(), SearchEngine.compile(u'b'))
+        while engine.searching:
+            engine.poll()
+        self.assertEqual(list(engine.starts), range(1, len(text), 3))
+        self.assertEqual(engine.count, 50)
+
+    def testNavigation(self):
+        engine = self.search(u'x..x..x', u'x')
+        self.assertEqual(engine.between(1, 6), (1, 2))
+        self.assertEqual(engine.nextMatch(0), 1)
+        self.assertEqual(engine.nextMatch(6), 0)
+        self.assertEqual(engine.previousMatch(3), 0)
+        self.assertEqual(engine.previousMatch(4), 1)
+        self.assertEqual(engine.previousMatch(0), 2)
+        self.assertIsNone(self.search(u'abc', u'x').nextMatch(0))
+
+    def testIndices(self):
+        text = u'one\n\nthree'
+        engine = self.search(text, u'e')
+        self.assertEqual(list(engine.lineStarts), list(findLineStarts(text)))
+        self.assertEqual([engine.index(start) for start in engine.starts], ['1.2', '3.3', '3.4'])
+        for offset in xrange(len(text) + 1):
+            self.assertEqual(engine.offset(engine.index(offset)), offset)
+        self.assertEqual(engine.offset('2.9'), len(text))
+        self.assertEqual(engine.offset('9.0'), len(text))
+        self.assertEqual(engine.lineOffset(3), 5)
+        self.assertEqual(indexOf(engine.lineStarts, 4), '2.0')
+
+    def testCancel(self):
+        engine = self.search(u'aaa', u'a')
+        engine.start(u'a' * 100000, SearchEngine.compile(u'a'))
+        engine.cancel()
+        time.sleep(0.05)
+        self.assertFalse(engine.poll())
+        self.assertEqual(engine.count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
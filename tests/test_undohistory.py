@@ -0,0 +1,138 @@
+#Tests for the undo/redo history kept for PygmentsText
+__author__ = 'Robert Cope'
+
+import unittest
+
+from pygments_tk_text.document import Document
+from pygments_tk_text.undohistory import OPBYTES, UndoHistory
+
+
+class Text(object):
+
+    """A document edited through an UndoHistory, the way PygmentsText._lineEdit feeds it."""
+
+    def __init__(self, maxBytes=32 * 1024 * 1024):
+        self.document = Document()
+        self.history = UndoHistory(maxBytes)
+
+    def edit(self, op, first, last, text):
+        old = self.document.get(self.document.offset(first), self.document.offset(last)) if op != 'insert' else ''
+        self.document.apply(op, first, last, text)
+        return self.history.record(op, first, last, text, old)
+
+    def type(self, index, chars):
+        line, col = index.split('.')
+        for i, char in enumerate(chars):
+            at = '{0}.{1}'.format(line, int(col) + i)
+            self.edit('insert', at, at, char)
+
+    def undo(self):
+        return self.history.undo(self.document.apply)
+
+    def redo(self):
+        return self.history.redo(self.document.apply)
+
+    @property
+    def text(self):
+        return self.document.get()
+
+
+class UndoHistoryTest(unittest.TestCase):
+
+    def testTypingRunIsOneStep(self):
+        text = Text()
+        text.type('1.0', u'hello')
+        self.assertEqual(len(text.history._undo), 1)
+        self.assertEqual(text.undo(), '1.0')
+        self.assertEqual(text.text, u'')
+        self.assertFalse(text.history.canUndo)
+        self.assertEqual(text.redo(), '1.5')
+        self.assertEqual(text.text, u'hello')
+
+    def testRunEndedByNewlinePauseOrJump(self):
+        text = Text()
+        text.type('1.0', u'ab')
+        text.edit('insert', '1.2', '1.2', u'\n')
+        text.type('2.0', u'cd')
+        text.history.MERGETIME = -1
+        text.type('2.2', u'e')
+        text.history.MERGETIME = UndoHistory.MERGETIME
+        text.type('1.0', u'f')
+        steps = []
+        while text.history.canUndo:
+            text.undo()
+            steps.append(text.text)
+        # the newline goes at the end of the run it ends
+        self.assertEqual(steps, [u'ab\ncde', u'ab\ncd', u'ab\n', u''])
+
+    def testDeleteRuns(self):
+        text = Text()
+        text.edit('insert', '1.0', '1.0', u'abcdef')
+        text.history.separator()
+        for col in (6, 5, 4):
+            # backspace
+            text.edit('delete', '1.{0}'.format(col - 1), '1.{0}'.format(col), u'')
+        text.history.separator()
+        text.edit('delete', '1.0', '1.1', u'')
+        text.edit('delete', '1.0', '1.1', u'')
+        self.assertEqual(text.text, u'c')
+        self.assertEqual(text.undo(), '1.2')
+        self.assertEqual(text.text, u'abc')
+        text.undo()
+        self.assertEqual(text.text, u'abcdef')
+
+    def testPasteAndGroupAreSteps(self):
+        text = Text()
+        text.type('1.0', u'a')
+        text.edit('insert', '1.1', '1.1', u'pasted')
+        text.history.beginGroup()
+        text.edit('replace', '1.0', '1.1', u'b')
+        text.type('1.7', u'cd')
+        text.history.endGroup()
+        self.assertEqual(text.text, u'bpastedcd')
+        text.undo()
+        self.assertEqual(text.text, u'apasted')
+        text.undo()
+        self.assertEqual(text.text, u'a')
+
+    def testEditThrowsAwayRedo(self):
+        text = Text()
+        text.type('1.0', u'a')
+        text.history.separator()
+        text.type('1.1', u'b')
+        text.undo()
+        self.assertTrue(text.history.canRedo)
+        text.type('1.1', u'c')
+        self.assertFalse(text.history.canRedo)
+        self.assertIsNone(text.redo())
+
+    def testCapDropsOldestFirst(self):
+        step = UndoHistory._editBytes(('insert', 1, 0, u'0'))
+        text = Text(maxBytes=3 * step)
+        for i in xrange(5):
+            text.history.separator()
+            text.edit('insert', '1.0', '1.0', unicode(i))
+        self.assertLessEqual(text.history.bytes, 3 * step)
+        while text.history.canUndo:
+            text.undo()
+        # the newest steps are the ones kept
+        self.assertEqual(text.text, u'10')
+
+    def testCapDropsStepTooBigOnItsOwn(self):
+        text = Text(maxBytes=OPBYTES * 4)
+        text.type('1.0', u'a')
+        text.history.separator()
+        text.edit('insert', '1.1', '1.1', u'x' * OPBYTES * 4)
+        self.assertFalse(text.history.canUndo)
+        self.assertEqual(text.history.bytes, 0)
+
+    def testReset(self):
+        text = Text()
+        text.type('1.0', u'ab')
+        text.history.reset()
+        self.assertFalse(text.history.canUndo)
+        self.assertEqual(text.history.bytes, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
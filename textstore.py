@@ -0,0 +1,47 @@
+#   CodePad
+#   Compact storage for the text of hibernated tabs
+__author__ = 'Robert Cope'
+
+import tempfile
+import zlib
+
+
+class TextStore(object):
+    """
+        A text put away until it's wanted again, as UTF-8, compressed unless compress is False. Anything over
+        SPILLBYTES (once compressed) goes out to an anonymous temporary file, which the OS cleans up however we exit.
+    """
+    SPILLBYTES = 4 * 1024 * 1024
+    LEVEL = 1       # zlib level: source code still shrinks severalfold, and it's quick both ways
+    def __init__(self, text, compress=True):
+        data = text.encode('utf-8')
+        if compress:
+            data = zlib.compress(data, self.LEVEL)
+        self.compressed = compress
+        self.size = len(data)
+        self._data = None
+        self._file = None
+        if self.size > self.SPILLBYTES:
+            self._file = tempfile.TemporaryFile(prefix='codepad-')
+            self._file.write(data)
+        else:
+            self._data = data
+
+    def read(self):
+        """
+            The text, as it was put away.
+        """
+        if self._file is not None:
+            self._file.seek(0)
+            data = self._file.read()
+        else:
+            data = self._data
+        if self.compressed:
+            data = zlib.decompress(data)
+        return data.decode('utf-8')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._data = None